@@ -10,4 +10,7 @@ python manage.py collectstatic --no-input
 # Aplicar migraciones a la base de datos de la nube
 python manage.py migrate
 
+# Miniaturas de las fotos de perfil subidas antes del procesamiento (idempotente)
+python manage.py generar_miniaturas
+
 python manage.py shell -c "from django.contrib.auth import get_user_model; User = get_user_model(); User.objects.create_superuser('admin', 'admin@example.com', 'Monfer2025') if not User.objects.filter(username='admin').exists() else print('El Superusuario ya existe')"
\ No newline at end of file
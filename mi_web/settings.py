@@ -62,6 +62,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'odontologia.middleware.InstrumentacionSQLMiddleware', # Cuenta y mide las consultas SQL de cada petición
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -79,6 +80,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'odontologia.contexto.cabecera', # saludo, nombre y foto del usuario para base.html
             ],
         },
     },
@@ -107,18 +109,60 @@ STATICFILES_DIRS = [
     os.path.join(BASE_DIR, 'static'),
     os.path.join(BASE_DIR, 'odontologia', 'static'), # Asegúrate que Django también encuentre los static de odontologia
 ]
-STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
+# STATICFILES_STORAGE ya no existe en Django 5.1+: sin STORAGES se usaba el almacenamiento
+# simple (sin hash ni compresión). Con Manifest + WhiteNoise cada archivo lleva hash en
+# el nombre, se sirve con "Cache-Control: immutable" y con sus variantes .gz y .br
+# (esta última requiere el paquete Brotli).
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'whitenoise.storage.CompressedManifestStaticFilesStorage'},
+}
+# Los tests no ejecutan collectstatic (no hay manifiesto): el ejecutor usa almacenamiento simple
+TEST_RUNNER = 'odontologia.ejecutor_pruebas.EjecutorPruebas'
 
 # Media files (User uploaded content)
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Cola de reportes (odontologia/trabajos.py). Sin un worker `procesar_reportes` que comparta
+# MEDIA_ROOT con la web (en Render cada servicio tiene su propio disco), la petición que
+# encola el reporte lo genera ella misma. Con REPORTES_CON_WORKER=1 solo se encola.
+REPORTES_CON_WORKER = os.environ.get('REPORTES_CON_WORKER') == '1'
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # Redirección después del login
 LOGIN_REDIRECT_URL = '/dashboard/'
 
+# Guardar en la sesión el nombre y la foto de la cabecera (ver odontologia/contexto.py)
+PERFIL_EN_SESION = True
+
+# Instrumentación SQL por petición (ver odontologia/middleware.py). Sobre estos
+# umbrales la petición se registra como WARNING en el log "odontologia.sql".
+INSTRUMENTACION_SQL = {
+    'ACTIVA': True,
+    'SERVER_TIMING': 'staff', # Cabecera Server-Timing solo para administradores (o con DEBUG)
+    'MAX_CONSULTAS': 50,
+    'MAX_REPETIDAS': 5, # Misma consulta repetida más veces que esto: probable N+1
+    'MAX_MS_DB': 500,
+    'LENTAS': 3,
+}
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'odontologia': {
+            'handlers': ['console'],
+            'level': os.environ.get('ODONTOLOGIA_LOG_LEVEL', 'INFO'),
+        },
+    },
+}
+
 # --- CONFIGURACIÓN DE JAZZMIN MEJORADA ---
 JAZZMIN_SETTINGS = {
     # Títulos
@@ -143,6 +187,7 @@ JAZZMIN_SETTINGS = {
     "order_with_respect_to": [
         # Primero la app Odontologia, con este orden:
         "odontologia.Atencion",
+        "odontologia.Paciente",
         "odontologia.Doctor",
         "odontologia.Tratamiento",
         "odontologia.Examen",
@@ -160,7 +205,6 @@ JAZZMIN_SETTINGS = {
 
     # Ocultar modelos que no usamos
     "hide_models": [
-        "odontologia.Paciente", # Oculta el modelo Paciente (ya que usamos campos en Atencion)
         "odontologia.DetalleAtencion", # Se maneja dentro de Atencion
         "odontologia.ExamenAtencion",  # Se maneja dentro de Atencion
     ],
@@ -170,9 +214,11 @@ JAZZMIN_SETTINGS = {
         "auth.User": "fas fa-users-cog",
         "auth.Group": "fas fa-users",
         "odontologia.Atencion": "fas fa-calendar-check",
+        "odontologia.Paciente": "fas fa-user-injured",
         "odontologia.Doctor": "fas fa-user-md",
         "odontologia.Tratamiento": "fas fa-tooth",
         "odontologia.Examen": "fas fa-vial",
         "odontologia.Boleta": "fas fa-file-invoice-dollar",
+        "odontologia.TrabajoReporte": "fas fa-tasks",
     },
 }
\ No newline at end of file
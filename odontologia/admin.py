@@ -1,6 +1,9 @@
 from django.contrib import admin
+from django.db import IntegrityError
 # Importamos los modelos correctos (sin ExamenAtencion)
-from .models import Doctor, Paciente, Tratamiento, Examen, Atencion, DetalleAtencion, Boleta
+from .models import Doctor, Paciente, Tratamiento, Examen, Atencion, DetalleAtencion, Boleta, ResumenMensualDoctor, TrabajoReporte
+from .forms import AtencionAdminForm, DoctorAdminForm, restriccion_de_horario
+from .fotos import procesar_foto
 
 # Clases para mostrar detalles "inline" (dentro de la misma página)
 class DetalleAtencionInline(admin.TabularInline):
@@ -24,6 +27,22 @@ class AtencionAdmin(admin.ModelAdmin):
     search_fields = ('paciente_nombre', 'paciente_apellido', 'paciente_rut', 'doctor__user__first_name', 'doctor__user__last_name')
     # CORREGIDO: Eliminamos ExamenAtencionInline
     inlines = [DetalleAtencionInline]
+    form = AtencionAdminForm
+
+    def get_form(self, request, obj=None, **kwargs):
+        formulario = super().get_form(request, obj, **kwargs)
+        formulario.error_previo = getattr(request, '_error_horario', None)
+        return formulario
+
+    def changeform_view(self, request, object_id=None, form_url='', extra_context=None):
+        try:
+            return super().changeform_view(request, object_id, form_url, extra_context)
+        except IntegrityError as error:
+            # Choque u horario repetido: se vuelve a mostrar el formulario, ahora con el error
+            if restriccion_de_horario(error) is None or hasattr(request, '_error_horario'):
+                raise
+            request._error_horario = error
+            return super().changeform_view(request, object_id, form_url, extra_context)
 
     # Método para mostrar nombre y apellido juntos en la lista
     @admin.display(description='Paciente')
@@ -35,11 +54,18 @@ class AtencionAdmin(admin.ModelAdmin):
 class DoctorAdmin(admin.ModelAdmin):
     list_display = ('__str__', 'rut', 'fecha_nacimiento') # Añadido fecha_nacimiento
     search_fields = ('user__first_name', 'user__last_name', 'rut')
+    form = DoctorAdminForm # Valida la foto antes de decodificarla (ver fotos.py)
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        # Igual que DoctorProfileForm.save: foto sin EXIF, miniaturas y versión nueva
+        if 'foto_perfil' in form.changed_data and obj.foto_perfil:
+            procesar_foto(obj)
 
-@admin.register(Paciente) # Mantenemos PacienteAdmin por si se usa como catálogo
+@admin.register(Paciente) # Ficha maestra de pacientes (una por RUT)
 class PacienteAdmin(admin.ModelAdmin):
-    list_display = ('nombre', 'rut')
-    search_fields = ('nombre', 'rut')
+    list_display = ('rut', 'nombre', 'apellido', 'celular', 'email')
+    search_fields = ('rut', 'nombre', 'apellido')
 
 @admin.register(Tratamiento)
 class TratamientoAdmin(admin.ModelAdmin):
@@ -53,7 +79,23 @@ class ExamenAdmin(admin.ModelAdmin):
 class BoletaAdmin(admin.ModelAdmin):
     # CORREGIDO: Eliminamos 'total_examenes'
     list_display = ('id', 'atencion', 'total_tratamientos', 'ganancia_neta_doctor', 'fecha_emision')
-    readonly_fields = ('total_tratamientos', 'ganancia_neta_doctor', 'fecha_emision')
+    # Los totales se calculan solos al guardar la atención y sus detalles (ver boletas.py)
+    readonly_fields = ('total_tratamientos', 'total_examenes', 'ganancia_neta_doctor', 'fecha_emision')
+
+@admin.register(ResumenMensualDoctor)
+class ResumenMensualDoctorAdmin(admin.ModelAdmin):
+    # Tabla derivada: se mantiene sola (ver resumenes.py), por eso es de solo lectura
+    list_display = ('doctor', 'anio', 'mes', 'especialidad', 'cantidad_tratamientos', 'total_facturado', 'ganancia_doctor')
+    list_filter = ('anio', 'especialidad', 'doctor')
+
+    def has_add_permission(self, request): return False
+    def has_change_permission(self, request, obj=None): return False
+
+@admin.register(TrabajoReporte) # Cola de reportes (los procesa el comando procesar_reportes)
+class TrabajoReporteAdmin(admin.ModelAdmin):
+    list_display = ('id', 'tipo', 'estado', 'solicitado_por', 'creado', 'terminado', 'intentos')
+    list_filter = ('estado', 'tipo')
+    readonly_fields = ('tipo', 'parametros', 'solicitado_por', 'creado', 'iniciado', 'terminado', 'intentos', 'error', 'archivo', 'nombre_archivo')
 
 # (Opcional) Registrar los otros modelos si quieres verlos en el admin individualmente
-# admin.site.register(DetalleAtencion)
\ No newline at end of file
+# admin.site.register(DetalleAtencion)
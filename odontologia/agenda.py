@@ -0,0 +1,146 @@
+# odontologia/agenda.py
+import datetime
+from bisect import bisect_left
+from collections import defaultdict
+from itertools import accumulate
+from django.db.models import OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from .models import Atencion, DetalleAtencion, DURACION_POR_DEFECTO
+
+# --- Agenda de los doctores ---
+# Cada atención ocupa [hora_atencion, hora_atencion + duracion) en la agenda de su
+# doctor. `Atencion.duracion` se guarda (suma de duracion_aproximada de los tratamientos
+# del catálogo elegidos en sus detalles, o DURACION_POR_DEFECTO) para que las agendas
+# salgan de una sola consulta por rango sobre atencion_doctor_fecha_idx.
+# La base impide los choques (restricción 'atencion_doctor_sin_choques', migración 0020).
+# En memoria cada día de un doctor es un AgendaDia: inicios ordenados más el máximo
+# acumulado de los finales, así un choque se encuentra con una bisección y las horas
+# libres con un recorrido lineal.
+
+PASO = 15 # minutos entre las horas ofrecidas
+# Horario de atención por día de la semana (lunes = 0); el domingo no se atiende
+HORARIO = {dia: (datetime.time(9), datetime.time(20)) for dia in range(5)}
+HORARIO[5] = (datetime.time(9), datetime.time(14))
+MAX_DIAS = 14 # días por consulta de disponibilidad
+
+
+def _minutos(hora):
+    return hora.hour * 60 + hora.minute
+
+def _hora(minutos):
+    return datetime.time(minutos // 60, minutos % 60)
+
+def duracion_de(tratamientos):
+    """Duración de una atención con estos tratamientos del catálogo (None = detalle sin tratamiento)."""
+    return sum(t.duracion_aproximada for t in tratamientos if t is not None) or DURACION_POR_DEFECTO
+
+def duracion_calculada():
+    """Expresión para `Atencion.objects.update(duracion=...)` a partir de los detalles guardados."""
+    suma = (
+        DetalleAtencion.objects.filter(atencion=OuterRef('pk'), tratamiento__isnull=False)
+        .values('atencion').annotate(total=Sum('tratamiento__duracion_aproximada')).values('total')
+    )
+    return Coalesce(Subquery(suma), DURACION_POR_DEFECTO)
+
+
+class AgendaDia:
+    """Atenciones de un doctor en un día, como intervalos (inicio, fin, pk) en minutos."""
+
+    def __init__(self, intervalos=()):
+        self.intervalos = sorted(intervalos)
+        self._inicios = [inicio for inicio, _, _ in self.intervalos]
+        self._max_fin = list(accumulate((fin for _, fin, _ in self.intervalos), max))
+
+    def choques(self, inicio, fin, excluir=None):
+        """Intervalos que se cruzan con [inicio, fin), en orden."""
+        resultado = []
+        # Solo pueden cruzarse los que empiezan antes de `fin`; se recorren hacia atrás
+        # mientras alguno anterior todavía termine después de `inicio`
+        i = bisect_left(self._inicios, fin) - 1
+        while i >= 0 and self._max_fin[i] > inicio:
+            intervalo = self.intervalos[i]
+            if intervalo[1] > inicio and intervalo[2] != excluir:
+                resultado.append(intervalo)
+            i -= 1
+        return resultado[::-1]
+
+    def libres(self, apertura, cierre, duracion, paso=PASO, desde=0):
+        """Inicios (minutos) cada `paso` entre apertura y cierre donde cabe `duracion` sin choques."""
+        resultado = []
+        inicio = apertura
+        if desde > apertura:
+            inicio += -(-(desde - apertura) // paso) * paso
+        total = len(self.intervalos)
+        i = 0
+        while inicio + duracion <= cierre:
+            # Se descartan las atenciones que terminan antes de este inicio
+            while i < total and self._max_fin[i] <= inicio:
+                i += 1
+            j = i
+            while j < total and self.intervalos[j][1] <= inicio:
+                j += 1
+            if j == total or self.intervalos[j][0] >= inicio + duracion:
+                resultado.append(inicio)
+                inicio += paso
+            else:
+                # Salta al primer inicio de la grilla que queda después del choque
+                inicio += -(-(self.intervalos[j][1] - inicio) // paso) * paso
+        return resultado
+
+
+def agendas(doctor_ids, desde, hasta):
+    """{(doctor_id, fecha): AgendaDia} de los doctores entre dos fechas, en una consulta."""
+    dias = defaultdict(list)
+    filas = Atencion.objects.filter(doctor_id__in=list(doctor_ids), fecha__range=(desde, hasta)).values_list(
+        'doctor_id', 'fecha', 'hora_atencion', 'duracion', 'pk',
+    )
+    for doctor_id, fecha, hora, duracion, pk in filas:
+        inicio = _minutos(hora)
+        dias[(doctor_id, fecha)].append((inicio, inicio + duracion, pk))
+    return defaultdict(AgendaDia, {clave: AgendaDia(intervalos) for clave, intervalos in dias.items()})
+
+def choques(doctor_id, fecha, hora, duracion, excluir=None):
+    """Atenciones del doctor que se cruzan con ese horario, como [(hora_inicio, hora_fin)]."""
+    inicio = _minutos(hora)
+    dia = agendas([doctor_id], fecha, fecha)[(doctor_id, fecha)]
+    return [(_hora(a), _hora(min(b, 24 * 60 - 1))) for a, b, _ in dia.choques(inicio, inicio + duracion, excluir)]
+
+def horas_libres(doctor_ids, desde, hasta, duracion=DURACION_POR_DEFECTO, ahora=None):
+    """
+    {doctor_id: {fecha: [horas]}} con las horas en que cada doctor puede recibir una
+    atención de `duracion` minutos dentro de HORARIO (sin horas ya pasadas).
+    """
+    ahora = timezone.localtime(ahora)
+    ocupadas = agendas(doctor_ids, desde, hasta)
+    resultado = {}
+    for doctor_id in doctor_ids:
+        por_dia = resultado[doctor_id] = {}
+        fecha = desde
+        while fecha <= hasta:
+            if fecha.weekday() in HORARIO and fecha >= ahora.date():
+                apertura, cierre = (_minutos(h) for h in HORARIO[fecha.weekday()])
+                desde_minuto = _minutos(ahora) + 1 if fecha == ahora.date() else 0
+                libres = ocupadas[(doctor_id, fecha)].libres(apertura, cierre, duracion, desde=desde_minuto)
+                por_dia[fecha] = [_hora(m) for m in libres]
+            fecha += datetime.timedelta(days=1)
+    return resultado
+
+def asignar_duracion(form, detalles):
+    """Deja en form.instance la duración según los tratamientos de su formset de `detalles`."""
+    tratamientos = [
+        f.cleaned_data.get('tratamiento') for f in detalles.forms
+        if f.cleaned_data and not f.cleaned_data.get('DELETE')
+    ]
+    form.instance.duracion = duracion_de(tratamientos)
+
+def mensaje_choque(atencion):
+    """Error para una atención que chocó con otra del doctor ('atencion_doctor_sin_choques')."""
+    cruces = choques(atencion.doctor_id, atencion.fecha, atencion.hora_atencion, atencion.duracion, excluir=atencion.pk)
+    if not cruces:
+        return f"El doctor ya tiene otra atención que se cruza con este horario ({atencion.duracion} min)."
+    inicio, fin = cruces[0]
+    return (
+        f"El doctor ya tiene una atención de {inicio:%H:%M} a {fin:%H:%M} "
+        f"que se cruza con este horario ({atencion.duracion} min)."
+    )
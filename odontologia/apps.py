@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class OdontologiaConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'odontologia'
+
+    def ready(self):
+        # Registra los receptores que mantienen las boletas al día
+        from . import signals  # noqa: F401
@@ -0,0 +1,87 @@
+# odontologia/autocompletar.py
+import re
+import time
+from functools import lru_cache
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from .models import Paciente
+
+# --- Autocompletado de pacientes (registro de atenciones) ---
+# Busca fichas por prefijo de RUT o por palabras del nombre completo: cada palabra
+# escrita debe ser el comienzo de alguna palabra del nombre o del apellido (así
+# 'maria jo' encuentra a 'María José Pérez'). El prefijo de RUT usa el índice *_like
+# que Django crea para los CharField únicos en PostgreSQL (en SQLite, el índice COLLATE
+# NOCASE de la migración 0018). En PostgreSQL las palabras se buscan como prefijos en el
+# tsvector de nombre y apellido (índice GIN, migración 0022); en otros motores con
+# istartswith sobre los índices de la 0018 y, para las palabras que no son la primera
+# del campo, con un icontains que recorre la tabla.
+# Email y celular solo se entregan cuando el texto es el RUT completo de la ficha.
+# Las respuestas se guardan en un LRU por proceso. Se vacía cuando este proceso
+# guarda o borra una ficha (signals.py); para los cambios hechos por otros procesos
+# (u otros workers) la clave incluye el tramo de TTL_LRU segundos en curso.
+
+MIN_CARACTERES = 2
+MAX_RESULTADOS = 8
+TAMANO_LRU = 1024
+TTL_LRU = 60 # segundos
+CAMPOS = ('rut', 'nombre', 'apellido', 'sexo', 'email', 'celular')
+CONTACTO = ('email', 'celular')
+
+_RUT = re.compile(r'^[\d.]+(-[\dkK]?)?$')
+_PALABRA = re.compile(r'[^\W_]+')
+DOCUMENTO_POSTGRES = """to_tsvector('simple', "nombre" || ' ' || "apellido")""" # igual que el índice de la 0022
+_SEPARADORES_RUT = str.maketrans('', '', '. ')
+
+
+def normalizar_prefijo(texto):
+    """' Juan  PÉ' -> 'juan pé'; '12.345.6' -> '123456'; '12345678-k' -> '12345678-K'."""
+    texto = ' '.join((texto or '').split())
+    if _RUT.match(texto):
+        return texto.translate(_SEPARADORES_RUT).upper()
+    return texto.lower()
+
+def filtro_nombre(palabras, vendor):
+    """Q para fichas donde cada una de `palabras` es el comienzo de una palabra del nombre o del apellido."""
+    if vendor == 'postgresql':
+        # Solo letras y dígitos: el resto es sintaxis de tsquery (el parser 'simple' también separa ahí)
+        terminos = [t for palabra in palabras for t in _PALABRA.findall(palabra)]
+        if not terminos:
+            return Q(pk__in=[])
+        consulta = ' & '.join(f'{termino}:*' for termino in terminos)
+        return Q(pk__in=RawSQL(
+            f"SELECT id FROM odontologia_paciente WHERE {DOCUMENTO_POSTGRES} @@ to_tsquery('simple', %s)", (consulta,),
+        ))
+    filtro = Q()
+    for palabra in palabras:
+        filtro &= (
+            Q(nombre__istartswith=palabra) | Q(apellido__istartswith=palabra)
+            | Q(nombre__icontains=f' {palabra}') | Q(apellido__icontains=f' {palabra}')
+        )
+    return filtro
+
+@lru_cache(maxsize=TAMANO_LRU)
+def _buscar(prefijo, tramo):
+    if _RUT.match(prefijo):
+        filtro = Q(rut__startswith=prefijo)
+    else:
+        filtro = filtro_nombre(prefijo.split(), connection.vendor)
+    filas = Paciente.objects.filter(filtro).order_by('nombre', 'apellido', 'rut').values(*CAMPOS)[:MAX_RESULTADOS]
+    return tuple(filas)
+
+def buscar_pacientes(texto):
+    """
+    Hasta MAX_RESULTADOS fichas (dicts con CAMPOS) cuyo RUT o nombre empieza con `texto`.
+    Los CONTACTO van solo en la ficha cuyo RUT es exactamente `texto`.
+    """
+    prefijo = normalizar_prefijo(texto)
+    if len(prefijo.replace('-', '')) < MIN_CARACTERES:
+        return []
+    return [
+        fila if fila['rut'] == prefijo else {campo: valor for campo, valor in fila.items() if campo not in CONTACTO}
+        for fila in _buscar(prefijo, int(time.monotonic() // TTL_LRU))
+    ]
+
+def olvidar():
+    """Vacía el LRU de este proceso (una ficha cambió)."""
+    _buscar.cache_clear()
@@ -0,0 +1,114 @@
+# odontologia/boletas.py
+import threading
+from contextlib import contextmanager
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+from .models import Atencion, Boleta, DetalleAtencion, ExamenAtencion, PORCENTAJE_DOCTOR
+from .resumenes import recalcular_periodos
+from .agenda import duracion_calculada
+
+# --- Totales materializados por Atención (modelo Boleta) ---
+# Cada Atención tiene una Boleta con la suma de sus tratamientos y exámenes y la
+# ganancia del doctor. Se recalcula en la misma transacción en que cambian los datos
+# (ver signals.py), así los reportes leen una fila en vez de sumar los detalles.
+# Los periodos del resumen mensual (resumenes.py) se recalculan con el mismo mecanismo.
+
+CERO = Decimal('0.00')
+CENTAVOS = Decimal('0.01')
+
+_estado = threading.local()
+
+
+def calcular_totales(atencion_ids):
+    """Devuelve {atencion_id: (total_tratamientos, total_examenes, ganancia_neta_doctor)} en dos consultas."""
+    atencion_ids = list(atencion_ids)
+    tratamientos = dict(
+        DetalleAtencion.objects.filter(atencion_id__in=atencion_ids)
+        .values('atencion_id').annotate(total=Sum('valor')).values_list('atencion_id', 'total')
+    )
+    examenes = dict(
+        ExamenAtencion.objects.filter(atencion_id__in=atencion_ids)
+        .values('atencion_id').annotate(total=Sum('costo_total')).values_list('atencion_id', 'total')
+    )
+    totales = {}
+    for atencion_id in atencion_ids:
+        total_tratamientos = tratamientos.get(atencion_id) or CERO
+        total_examenes = examenes.get(atencion_id) or CERO
+        ganancia = (total_tratamientos * PORCENTAJE_DOCTOR).quantize(CENTAVOS)
+        totales[atencion_id] = (total_tratamientos, total_examenes, ganancia)
+    return totales
+
+def guardar_boletas(totales):
+    """Crea o actualiza (upsert) las boletas a partir del diccionario de `calcular_totales`."""
+    boletas = [
+        Boleta(atencion_id=atencion_id, total_tratamientos=tratamientos, total_examenes=examenes, ganancia_neta_doctor=ganancia)
+        for atencion_id, (tratamientos, examenes, ganancia) in totales.items()
+    ]
+    Boleta.objects.bulk_create(
+        boletas, update_conflicts=True, unique_fields=['atencion'],
+        update_fields=['total_tratamientos', 'total_examenes', 'ganancia_neta_doctor'],
+    )
+
+def recalcular_boletas(atencion_ids):
+    atencion_ids = set(atencion_ids)
+    if not atencion_ids:
+        return
+    with transaction.atomic():
+        guardar_boletas(calcular_totales(atencion_ids))
+
+def marcar_modificadas(atencion_ids):
+    """
+    Actualiza `Atencion.actualizado` de atenciones cuyos detalles o exámenes cambiaron,
+    y en la misma sentencia su duración (los tratamientos del catálogo pudieron cambiar).
+    """
+    atencion_ids = set(atencion_ids)
+    if atencion_ids:
+        Atencion.objects.filter(pk__in=atencion_ids).update(actualizado=timezone.now(), duracion=duracion_calculada())
+
+
+def marcar_para_recalculo(atencion_id=None, periodos=(), modificada=False):
+    """
+    Recalcula la boleta de la atención y los periodos (doctor_id, año, mes) del resumen
+    mensual ahora, o al final del bloque `recalculo_diferido` si hay uno activo. Con
+    `modificada` también se marca la atención como cambiada (cambió un detalle).
+    """
+    pendientes = getattr(_estado, 'pendientes', None)
+    if pendientes is not None:
+        if atencion_id is not None:
+            pendientes.add(atencion_id)
+            if modificada:
+                _estado.modificadas.add(atencion_id)
+        _estado.periodos.update(periodos)
+        return
+    with transaction.atomic():
+        if atencion_id is not None:
+            recalcular_boletas([atencion_id])
+            if modificada:
+                marcar_modificadas([atencion_id])
+        recalcular_periodos(periodos)
+
+@contextmanager
+def recalculo_diferido():
+    """
+    Agrupa en una transacción los cambios de una atención y sus detalles (por ejemplo
+    form + formset) y recalcula cada boleta y periodo afectado una sola vez al final.
+    """
+    if getattr(_estado, 'pendientes', None) is not None:
+        # Bloque anidado: el bloque externo se encarga del recálculo
+        yield
+        return
+    _estado.pendientes = set()
+    _estado.periodos = set()
+    _estado.modificadas = set()
+    try:
+        with transaction.atomic():
+            yield
+            pendientes, periodos, modificadas = _estado.pendientes, _estado.periodos, _estado.modificadas
+            _estado.pendientes = _estado.periodos = _estado.modificadas = None
+            recalcular_boletas(pendientes)
+            recalcular_periodos(periodos)
+            marcar_modificadas(modificadas)
+    finally:
+        _estado.pendientes = _estado.periodos = _estado.modificadas = None
@@ -0,0 +1,81 @@
+# odontologia/busqueda.py
+import re
+from django.db import connection
+from django.db.models import FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+# --- Búsqueda de texto en atenciones ---
+# Busca en nombre, apellido, RUT normalizado, motivo de la visita y descripciones de
+# los tratamientos. En PostgreSQL usa la columna `busqueda` (tsvector con la
+# configuración 'odontologia_es': spanish + unaccent, índice GIN) y en SQLite la tabla
+# FTS5 `odontologia_atencion_fts`; ambas se mantienen con triggers (migración 0017).
+# Cada término se busca como prefijo y deben aparecer todos. El orden es por
+# relevancia: nombre y RUT pesan más que el motivo, y este más que los tratamientos.
+
+CONFIGURACION = 'odontologia_es'
+TABLA_FTS = 'odontologia_atencion_fts'
+PESOS_FTS = (10.0, 10.0, 4.0, 1.0) # nombre, rut, motivo, detalles (bm25)
+
+_RUT = re.compile(r'^[\d.]*\d[\d.]*-?[\dkK]?$')
+_PALABRA = re.compile(r'[^\W_]+')
+
+
+def terminos(texto):
+    """
+    'Pérez 12.345.678-k' -> ['Pérez', '12345678k']. Los RUT quedan como se indexan
+    (sin puntos ni guion); del resto se toman solo letras y dígitos.
+    """
+    resultado = []
+    for parte in (texto or '').split():
+        if _RUT.match(parte):
+            resultado.append(re.sub(r'[^0-9kK]', '', parte).lower())
+        else:
+            resultado += _PALABRA.findall(parte)
+    return [t for t in resultado if t]
+
+
+def _postgres(atenciones, lista):
+    consulta = ' & '.join(f'{t}:*' for t in lista)
+    coincidencias = RawSQL(
+        f"SELECT id FROM odontologia_atencion WHERE busqueda @@ to_tsquery('{CONFIGURACION}', %s)", (consulta,),
+    )
+    relevancia = RawSQL(
+        f"ts_rank(odontologia_atencion.busqueda, to_tsquery('{CONFIGURACION}', %s))", (consulta,), output_field=FloatField(),
+    )
+    return atenciones.filter(pk__in=coincidencias).annotate(relevancia=relevancia)
+
+def _sqlite(atenciones, lista):
+    consulta = ' AND '.join(f'"{t}"*' for t in lista)
+    coincidencias = RawSQL(f"SELECT rowid FROM {TABLA_FTS} WHERE {TABLA_FTS} MATCH %s", (consulta,))
+    # bm25 es menor mientras más relevante; solo se puede calcular dentro de la consulta MATCH
+    pesos = ', '.join(str(p) for p in PESOS_FTS)
+    relevancia = RawSQL(
+        f"(SELECT -bm25({TABLA_FTS}, {pesos}) FROM {TABLA_FTS} "
+        f"WHERE {TABLA_FTS} MATCH %s AND rowid = odontologia_atencion.id)", (consulta,), output_field=FloatField(),
+    )
+    return atenciones.filter(pk__in=coincidencias).annotate(relevancia=relevancia)
+
+def _sin_indice(atenciones, lista):
+    """Otros motores: substring en cada campo, sin orden por relevancia."""
+    filtro = Q()
+    for termino in lista:
+        filtro &= (
+            Q(paciente_nombre__icontains=termino) | Q(paciente_apellido__icontains=termino)
+            | Q(paciente_rut__icontains=termino) | Q(motivo_visita__icontains=termino)
+            | Q(detalles__descripcion__icontains=termino)
+        )
+    return atenciones.filter(pk__in=atenciones.filter(filtro).values('pk')).annotate(relevancia=Value(0.0))
+
+MOTORES = {'postgresql': _postgres, 'sqlite': _sqlite}
+
+
+def buscar_atenciones(atenciones, texto):
+    """
+    Filtra un queryset de Atencion por `texto` y lo ordena por relevancia (anotada como
+    `relevancia`), con las más recientes primero en caso de empate.
+    """
+    lista = terminos(texto)
+    if not lista:
+        return atenciones.none()
+    resultados = MOTORES.get(connection.vendor, _sin_indice)(atenciones, lista)
+    return resultados.order_by('-relevancia', '-fecha', '-hora_atencion', '-id')
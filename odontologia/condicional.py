@@ -0,0 +1,56 @@
+# odontologia/condicional.py
+import hashlib
+from django.contrib.messages import get_messages
+from django.shortcuts import render
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+from .contexto import get_saludo, version_perfil
+
+# --- Respuestas condicionales (ETag / Last-Modified) ---
+# El navegador guarda la respuesta y la vuelve a pedir con If-None-Match /
+# If-Modified-Since; si nada cambió se responde 304 sin cuerpo. El validador de
+# una atención es su campo `actualizado`; el de un listado, la versión de datos del
+# doctor (versiones.py) más todo lo demás que cambia la página (usuario, cabecera,
+# parámetros, token CSRF), así el 304 no consulta las atenciones. Las respuestas
+# quedan "private, no-cache": el navegador siempre revalida y ningún proxy
+# compartido las guarda.
+
+
+def calcular_etag(*partes):
+    return quote_etag(hashlib.sha1(repr(partes).encode()).hexdigest()[:20])
+
+def no_modificada(request, etag, ultima_modificacion=None):
+    """Respuesta 304 si el navegador ya tiene esta versión, o None."""
+    # Last-Modified tiene resolución de segundos
+    marca = int(ultima_modificacion.timestamp()) if ultima_modificacion else None
+    return get_conditional_response(request, etag=etag, last_modified=marca)
+
+def con_validadores(response, etag, ultima_modificacion=None):
+    response['ETag'] = etag
+    if ultima_modificacion:
+        response['Last-Modified'] = http_date(ultima_modificacion.timestamp())
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+def _partes_de_pagina(request):
+    user = request.user
+    return (
+        request.get_full_path(), user.pk, user.is_staff or user.is_superuser, version_perfil(request),
+        get_saludo(), request.META.get('CSRF_COOKIE'),
+    )
+
+def render_condicional(request, plantilla, context, *partes):
+    """
+    `render` que responde 304 si la página no cambió. `partes` identifican los datos
+    mostrados: la clave de datos del doctor (versiones.clave_datos) y cualquier otro
+    valor de la página que no dependa de ella (indicadores). Si hay mensajes pendientes
+    siempre se renderiza para mostrarlos.
+    """
+    if len(get_messages(request)):
+        return render(request, plantilla, context)
+    # Sin Last-Modified: la versión de datos no dice cuándo cambiaron
+    etag = calcular_etag(*_partes_de_pagina(request), *partes)
+    respuesta = no_modificada(request, etag)
+    if respuesta is not None:
+        return respuesta
+    return con_validadores(render(request, plantilla, context), etag)
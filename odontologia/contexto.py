@@ -0,0 +1,91 @@
+# odontologia/contexto.py
+from django.conf import settings
+from django.templatetags.static import static
+from django.utils import timezone
+from .models import Doctor
+from .versiones import subir_versiones, version_de, GLOBAL
+
+# --- Datos del usuario para la cabecera de todas las páginas ---
+# El context processor `cabecera` entrega saludo, nombre, foto y rol a base.html,
+# así las vistas no los calculan una por una. El perfil Doctor se resuelve una sola
+# vez por petición (`obtener_doctor`) y el nombre y la foto se guardan en la sesión,
+# validados por una versión del perfil que sube cada vez que se guarda el Doctor o su
+# usuario (ver signals.py). La versión está en la base (VersionDatos, como las de
+# versiones.py): un cambio hecho en otro worker se ve en la página siguiente.
+# Se desactiva con PERFIL_EN_SESION = False.
+
+CLAVE_SESION = 'perfil_cabecera'
+FOTO_POR_DEFECTO = 'images/doctor_placeholder.png'
+
+
+def get_saludo():
+    now = timezone.localtime(timezone.now())
+    hora_actual = now.hour
+    if 5 <= hora_actual < 12: return "Buenos días"
+    elif 12 <= hora_actual < 20: return "Buenas tardes"
+    else: return "Buenas noches"
+
+def obtener_doctor(request):
+    """Perfil Doctor del usuario de la petición, o None. Se consulta una sola vez por petición."""
+    if not hasattr(request, '_doctor'):
+        try:
+            request._doctor = request.user.doctor
+        except (Doctor.DoesNotExist, AttributeError): # Admin sin perfil o usuario anónimo
+            request._doctor = None
+    return request._doctor
+
+
+# --- Versión del perfil (invalida la copia en sesión) ---
+
+def clave_perfil(user_id):
+    """Clave de VersionDatos del perfil del usuario."""
+    return f"perfil.{user_id}"
+
+def version_perfil(request):
+    """Versión del perfil del usuario de la petición. Se consulta una sola vez por petición."""
+    if not hasattr(request, '_version_perfil'):
+        request._version_perfil = version_de(clave_perfil(request.user.pk))
+    return request._version_perfil
+
+def invalidar_perfil(user_id):
+    # También la global: las tablas globales muestran el nombre del doctor (un solo UPDATE)
+    subir_versiones([clave_perfil(user_id), GLOBAL])
+
+
+def _perfil_doctor(request):
+    user = request.user
+    perfil = {'nombre': user.first_name or user.username, 'foto': static(FOTO_POR_DEFECTO), 'foto_webp': None}
+    doctor = obtener_doctor(request)
+    if doctor and doctor.foto_perfil:
+        perfil['foto'] = doctor.miniatura_url
+        perfil['foto_webp'] = doctor.miniatura_webp_url
+    return perfil
+
+def _perfil_en_sesion(request):
+    version = version_perfil(request)
+    guardado = request.session.get(CLAVE_SESION)
+    if guardado and guardado.get('version') == version:
+        return guardado
+    perfil = _perfil_doctor(request)
+    request.session[CLAVE_SESION] = dict(perfil, version=version)
+    return perfil
+
+def cabecera(request):
+    """Context processor: saludo, nombre_doctor, doctor_profile_pic(_webp) y es_admin."""
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated:
+        return {}
+    admin = user.is_staff or user.is_superuser
+    if admin:
+        perfil = {'nombre': f"Admin. {user.first_name}", 'foto': static(FOTO_POR_DEFECTO), 'foto_webp': None}
+    elif getattr(settings, 'PERFIL_EN_SESION', True) and hasattr(request, 'session'):
+        perfil = _perfil_en_sesion(request)
+    else:
+        perfil = _perfil_doctor(request)
+    return {
+        'saludo': get_saludo(),
+        'nombre_doctor': perfil['nombre'],
+        'doctor_profile_pic': perfil['foto'],
+        'doctor_profile_pic_webp': perfil['foto_webp'],
+        'es_admin': admin,
+    }
@@ -0,0 +1,23 @@
+# odontologia/ejecutor_pruebas.py
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+# --- Ejecutor de `manage.py test` ---
+# Los tests no ejecutan collectstatic, así que no existe el manifiesto que necesita
+# CompressedManifestStaticFilesStorage para resolver {% static %}: mientras corren se
+# usa el almacenamiento simple de archivos estáticos.
+
+
+class EjecutorPruebas(DiscoverRunner):
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        from django.conf import settings
+        self._almacenamiento = override_settings(STORAGES={
+            **settings.STORAGES,
+            'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+        })
+        self._almacenamiento.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._almacenamiento.disable()
+        super().teardown_test_environment(**kwargs)
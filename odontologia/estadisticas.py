@@ -0,0 +1,59 @@
+# odontologia/estadisticas.py
+import datetime
+from decimal import Decimal
+from django.core.cache import cache
+from django.db.models import Count, Sum, Q, Value, DecimalField
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from .models import Atencion
+from . import versiones
+
+# --- Indicadores del Panel Principal ---
+# Se calculan en una sola consulta con agregación condicional y se guardan en
+# caché por doctor (o global para administradores) durante unos segundos.
+# La clave lleva la versión de datos del doctor (versiones.clave_datos), que está en
+# la base: cuando signals.py o un comando la sube, todos los workers dejan de usar
+# la entrada anterior aunque cada uno tenga su propia caché.
+
+TTL_ESTADISTICAS = 60 # segundos
+GLOBAL = 'global'
+
+
+def _clave(datos, hoy):
+    # La fecha va en la clave: al cambiar el día, "Pacientes Hoy" parte de cero
+    return f"dashboard:estadisticas:{datos}:{hoy.isoformat()}"
+
+def _rango_mes(hoy):
+    inicio = hoy.replace(day=1)
+    siguiente = (inicio + datetime.timedelta(days=32)).replace(day=1)
+    return inicio, siguiente
+
+def calcular_estadisticas(doctor_id=None, hoy=None):
+    """Pacientes de hoy, atenciones totales, facturado del mes y ganancia del doctor (50%) del mes."""
+    hoy = hoy or timezone.localdate()
+    inicio_mes, siguiente_mes = _rango_mes(hoy)
+    atenciones = Atencion.objects.all()
+    if doctor_id:
+        atenciones = atenciones.filter(doctor_id=doctor_id)
+
+    del_mes = Q(fecha__gte=inicio_mes, fecha__lt=siguiente_mes)
+    cero = Value(Decimal('0.00'), output_field=DecimalField(max_digits=12, decimal_places=2))
+    return atenciones.aggregate(
+        total_pacientes_hoy=Count('pk', filter=Q(fecha=hoy)),
+        atenciones_realizadas=Count('pk'),
+        facturado_mensual=Coalesce(Sum('boleta__total_tratamientos', filter=del_mes), cero),
+        ganancia_mensual=Coalesce(Sum('boleta__ganancia_neta_doctor', filter=del_mes), cero),
+    )
+
+def estadisticas_dashboard(doctor_id=None, clave_datos=None):
+    """
+    Versión en caché de `calcular_estadisticas` (doctor_id=None para la vista global).
+    `clave_datos` evita volver a consultar la versión si la vista ya la tiene.
+    """
+    hoy = timezone.localdate()
+    clave = _clave(clave_datos or versiones.clave_datos(doctor_id), hoy)
+    datos = cache.get(clave)
+    if datos is None:
+        datos = calcular_estadisticas(doctor_id, hoy)
+        cache.set(clave, datos, TTL_ESTADISTICAS)
+    return datos
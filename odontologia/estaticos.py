@@ -0,0 +1,220 @@
+# odontologia/estaticos.py
+import hashlib
+import re
+import urllib.request
+from pathlib import Path
+from django.conf import settings
+
+# --- Librerías de terceros servidas desde static/vendor ---
+# Bootstrap, Font Awesome, Poppins y FullCalendar se descargan en desarrollo (comando
+# `vendorizar_estaticos`), en versiones fijas, y se suben al repositorio junto con
+# static/vendor/SHA256SUMS. El despliegue nunca descarga. Mientras static/vendor no
+# esté en el repositorio las plantillas siguen cargando estas librerías desde el CDN;
+# al subirlo, se cambian las etiquetas por {% static 'vendor/...' %} y build.sh vuelve
+# a comprobar los archivos contra las sumas (`vendorizar_estaticos --comprobar`).
+# WhiteNoise los sirve como el resto de los estáticos: nombre con hash, variantes
+# .br/.gz y "Cache-Control: immutable".
+# El CSS se recorta a las clases que aparecen en las plantillas, el código de la app
+# y el JS de Bootstrap (que agrega clases como show o collapsing): si una plantilla
+# empieza a usar una clase o un ícono nuevo hay que volver a ejecutar el comando.
+
+CDN = 'https://cdn.jsdelivr.net/npm/'
+BOOTSTRAP = 'bootstrap@5.3.2'
+FONTAWESOME = '@fortawesome/fontawesome-free@6.5.2'
+POPPINS = '@fontsource/poppins@5.0.8'
+FULLCALENDAR = 'fullcalendar@6.1.10'
+
+PESOS_POPPINS = (300, 400, 500, 600, 700) # 300 lo usa .lead
+FUENTES_FONTAWESOME = ('fa-solid-900', 'fa-regular-400') # fas y far; sin brands ni compatibilidad v4
+# Latín básico y extendido-A parcial (español incluido), igual que el subconjunto "latin" de Google Fonts
+RANGO_LATIN = (
+    'U+0000-00FF,U+0131,U+0152-0153,U+02BB-02BC,U+02C6,U+02DA,U+02DC,U+0304,U+0308,U+0329,'
+    'U+2000-206F,U+2074,U+20AC,U+2122,U+2191,U+2193,U+2212,U+2215,U+FEFF,U+FFFD'
+)
+# Clases armadas en la plantilla que no aparecen escritas completas (alert-{{ message.tags }})
+CLASES_DINAMICAS = {f'alert-{tag}' for tag in ('debug', 'info', 'success', 'warning', 'danger', 'error')}
+
+# (ruta en static/vendor, ruta en el CDN, tratamiento)
+ARCHIVOS = [
+    ('bootstrap/bootstrap.bundle.min.js', f'{BOOTSTRAP}/dist/js/bootstrap.bundle.min.js', 'js'),
+    ('fullcalendar/index.global.min.js', f'{FULLCALENDAR}/index.global.min.js', 'js'),
+    ('bootstrap/bootstrap.min.css', f'{BOOTSTRAP}/dist/css/bootstrap.min.css', 'css'),
+    ('fontawesome/css/all.min.css', f'{FONTAWESOME}/css/all.min.css', 'css'),
+    *[(f'fontawesome/webfonts/{nombre}.woff2', f'{FONTAWESOME}/webfonts/{nombre}.woff2', 'binario') for nombre in FUENTES_FONTAWESOME],
+    *[(f'poppins/poppins-latin-{peso}-normal.woff2', f'{POPPINS}/files/poppins-latin-{peso}-normal.woff2', 'binario') for peso in PESOS_POPPINS],
+]
+CSS_POPPINS = 'poppins/poppins.css'
+SUMAS = 'SHA256SUMS' # formato de sha256sum, en static/vendor
+
+
+def destino():
+    return Path(settings.BASE_DIR) / 'static' / 'vendor'
+
+def _rutas():
+    return [*(a[0] for a in ARCHIVOS), CSS_POPPINS]
+
+def _sha256(archivo):
+    return hashlib.sha256(archivo.read_bytes()).hexdigest()
+
+def _guardar_sumas(base):
+    lineas = [f"{_sha256(base / ruta)}  {ruta}\n" for ruta in _rutas()]
+    (base / SUMAS).write_text(''.join(lineas), encoding='utf-8')
+
+def comprobar():
+    """Problemas de static/vendor frente a SHA256SUMS (archivos que faltan o cambiaron); [] si está bien."""
+    base = destino()
+    if not (base / SUMAS).exists():
+        return [f"Falta static/vendor/{SUMAS}: ejecute vendorizar_estaticos y suba static/vendor al repositorio."]
+    esperadas = dict(
+        reversed(linea.split(None, 1)) for linea in (base / SUMAS).read_text(encoding='utf-8').splitlines() if linea.strip()
+    )
+    problemas = []
+    for ruta in _rutas():
+        archivo = base / ruta
+        if not archivo.exists():
+            problemas.append(f"Falta {ruta}.")
+        elif esperadas.get(ruta) != _sha256(archivo):
+            problemas.append(f"{ruta} no coincide con {SUMAS}.")
+    return problemas
+
+def _descargar(ruta_cdn):
+    with urllib.request.urlopen(CDN + ruta_cdn, timeout=30) as respuesta:
+        return respuesta.read()
+
+
+# --- Recorte de CSS ---
+
+def _fin_de_cadena(css, i):
+    comilla = css[i]
+    i += 1
+    while css[i] != comilla:
+        i += 2 if css[i] == '\\' else 1
+    return i
+
+def _partir(css):
+    """Sentencias de primer nivel como (prelude, cuerpo); cuerpo es None en comentarios y @import/@charset."""
+    sentencias = []
+    i = inicio = profundidad = apertura = 0
+    while i < len(css):
+        c = css[i]
+        if c in '"\'':
+            i = _fin_de_cadena(css, i)
+        elif css.startswith('/*', i):
+            fin = css.index('*/', i + 2) + 2
+            if profundidad == 0:
+                if css.startswith('/*!', i): # Licencia: se conserva
+                    sentencias.append((css[i:fin], None))
+                inicio = fin
+            i = fin
+            continue
+        elif c == '{':
+            if profundidad == 0:
+                apertura = i
+            profundidad += 1
+        elif c == '}':
+            profundidad -= 1
+            if profundidad == 0:
+                sentencias.append((css[inicio:apertura].strip(), css[apertura + 1:i]))
+                inicio = i + 1
+        elif c == ';' and profundidad == 0:
+            sentencias.append((css[inicio:i + 1].strip(), None))
+            inicio = i + 1
+        i += 1
+    return sentencias
+
+def _selectores(prelude):
+    partes, actual, profundidad = [], '', 0
+    for c in prelude:
+        profundidad += (c == '(') - (c == ')')
+        if c == ',' and profundidad == 0:
+            partes.append(actual)
+            actual = ''
+        else:
+            actual += c
+    return [*partes, actual]
+
+def _se_usa(selector, usadas):
+    # Lo que va entre paréntesis (:not(.disabled), :has(...)) no decide si el selector aplica
+    while '(' in selector:
+        sin_grupos = re.sub(r'\([^()]*\)', '', selector)
+        if sin_grupos == selector:
+            break
+        selector = sin_grupos
+    return all(clase in usadas for clase in re.findall(r'\.(-?[_a-zA-Z][\w-]*)', selector))
+
+def recortar_css(css, usadas):
+    """Quita las reglas cuyos selectores nombran alguna clase que no está en `usadas`."""
+    partes = []
+    for prelude, cuerpo in _partir(css):
+        if cuerpo is None:
+            partes.append(prelude)
+        elif prelude.startswith(('@media', '@supports', '@container', '@layer')):
+            interior = recortar_css(cuerpo, usadas)
+            if interior:
+                partes.append(f'{prelude}{{{interior}}}')
+        elif prelude.startswith('@'): # @font-face, @keyframes, ...
+            partes.append(f'{prelude}{{{cuerpo}}}')
+        else:
+            selectores = [s for s in _selectores(prelude) if _se_usa(s, usadas)]
+            if selectores:
+                partes.append(f"{','.join(selectores)}{{{cuerpo}}}")
+    return ''.join(partes)
+
+def _fuentes_fontawesome(css):
+    """Deja solo las @font-face de FUENTES_FONTAWESOME y solo en woff2."""
+    def reemplazar(m):
+        nombres = re.findall(r'webfonts/([\w-]+)\.woff2', m.group(0))
+        if not nombres or nombres[0] not in FUENTES_FONTAWESOME:
+            return ''
+        return re.sub(r'src:[^;}]+', f'src:url(../webfonts/{nombres[0]}.woff2) format("woff2")', m.group(0))
+    return re.sub(r'@font-face\{[^}]*\}', reemplazar, css)
+
+def _sin_mapas(texto):
+    # collectstatic con Manifest falla si el .map referenciado no existe
+    return re.sub(r'\n?(/\*# sourceMappingURL=[^*]*\*/|//# sourceMappingURL=\S*)', '', texto)
+
+def palabras_usadas(*textos):
+    """Todo identificador que aparece en plantillas, código y estáticos propios: puede ser una clase."""
+    raiz = Path(settings.BASE_DIR)
+    fuentes = [*raiz.glob('odontologia/**/*.html'), *raiz.glob('odontologia/**/*.py'), *raiz.glob('templates/**/*.html')]
+    fuentes += [p for p in raiz.glob('static/**/*') if p.suffix in ('.css', '.js') and 'vendor' not in p.parts]
+    contenido = [p.read_text(encoding='utf-8', errors='ignore') for p in fuentes]
+    return set(re.findall(r'[A-Za-z_][\w-]*', '\n'.join([*contenido, *textos]))) | CLASES_DINAMICAS
+
+def css_poppins():
+    return ''.join(
+        f"@font-face{{font-family:'Poppins';font-style:normal;font-weight:{peso};font-display:swap;"
+        f"src:url(poppins-latin-{peso}-normal.woff2) format('woff2');unicode-range:{RANGO_LATIN}}}\n"
+        for peso in PESOS_POPPINS
+    )
+
+
+def vendorizar(descargar=_descargar):
+    """
+    Descarga las librerías en static/vendor, recorta su CSS, genera la hoja de Poppins
+    y escribe SHA256SUMS con las sumas de lo guardado. Devuelve [(ruta, bytes descargados, bytes guardados)].
+    """
+    base = destino()
+    originales = {ruta: descargar(ruta_cdn) for ruta, ruta_cdn, _ in ARCHIVOS}
+    usadas = palabras_usadas(originales['bootstrap/bootstrap.bundle.min.js'].decode('utf-8'))
+
+    resultado = []
+    for ruta, _, tratamiento in ARCHIVOS:
+        datos = originales[ruta]
+        if tratamiento != 'binario':
+            texto = _sin_mapas(datos.decode('utf-8'))
+            if tratamiento == 'css':
+                texto = recortar_css(texto, usadas)
+                if ruta.startswith('fontawesome/'):
+                    texto = _fuentes_fontawesome(texto)
+            datos = texto.encode('utf-8')
+        archivo = base / ruta
+        archivo.parent.mkdir(parents=True, exist_ok=True)
+        archivo.write_bytes(datos)
+        resultado.append((ruta, len(originales[ruta]), len(datos)))
+
+    poppins = css_poppins().encode('utf-8')
+    (base / CSS_POPPINS).write_bytes(poppins)
+    resultado.append((CSS_POPPINS, 0, len(poppins)))
+    _guardar_sumas(base)
+    return resultado
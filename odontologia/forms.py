@@ -1,13 +1,45 @@
 # odontologia/forms.py
 from django import forms
-from .models import Atencion, DetalleAtencion, Doctor
+from .models import Atencion, DetalleAtencion, Doctor, Paciente, Tratamiento
+from .agenda import mensaje_choque
+from . import rut as rut_utils
+from .fotos import validar_foto, procesar_foto
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
-import re 
-from itertools import cycle
+from django.forms import BaseInlineFormSet
+from django.utils.functional import cached_property
 from datetime import date 
 
-class AtencionForm(forms.ModelForm):
+# SQLite no nombra la restricción única violada, solo sus columnas
+COLUMNAS_HORARIO_SQLITE = 'odontologia_atencion.paciente_rut, odontologia_atencion.fecha, odontologia_atencion.hora_atencion'
+
+def restriccion_de_horario(error):
+    """'choque' o 'horario' si el IntegrityError viene de una restricción de horario de Atencion; si no, None."""
+    texto = str(error)
+    if 'atencion_doctor_sin_choques' in texto:
+        return 'choque'
+    if 'atencion_paciente_horario_uniq' in texto or COLUMNAS_HORARIO_SQLITE in texto:
+        return 'horario'
+    return None
+
+class ErroresHorarioMixin:
+    """Muestra como errores del formulario los choques y horarios repetidos que impide la base."""
+
+    def error_de_integridad(self, error):
+        """
+        Agrega el error del formulario que corresponde a un IntegrityError al guardar la
+        atención (y sus detalles). Devuelve False si no viene de una restricción de Atencion.
+        """
+        restriccion = restriccion_de_horario(error)
+        if restriccion == 'choque':
+            self.add_error('hora_atencion', mensaje_choque(self.instance))
+        elif restriccion == 'horario':
+            self.add_error(None, f"El paciente con RUT {self.instance.paciente_rut} ya tiene hora ese día a esa misma hora.")
+        else:
+            return False
+        return True
+
+class AtencionForm(ErroresHorarioMixin, forms.ModelForm):
     # Validación explícita del campo numérico de edad
     paciente_edad = forms.IntegerField(
         label="Edad",
@@ -43,74 +75,97 @@ class AtencionForm(forms.ModelForm):
             'metodo_pago': forms.Select(attrs={'class': 'form-select'}),
         }
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # atencion_paciente_horario_uniq la revisa la base al guardar (ver error_de_integridad)
+        self.instance.revisar_horario_paciente = False
+
     def clean(self):
         cleaned_data = super().clean()
         rut = cleaned_data.get('paciente_rut')
-        fecha = cleaned_data.get('fecha')
-        hora = cleaned_data.get('hora_atencion')
         nombre_nuevo = cleaned_data.get('paciente_nombre', '').strip()
         apellido_nuevo = cleaned_data.get('paciente_apellido', '').strip()
 
-        # Validación 1: Duplicidad de Horario
-        if rut and fecha and hora:
-            coincidencias = Atencion.objects.filter(
-                paciente_rut=rut, fecha=fecha, hora_atencion=hora
-            ).exclude(pk=self.instance.pk)
-            if coincidencias.exists():
-                raise ValidationError(f"El paciente con RUT {rut} ya tiene hora ese día a esa misma hora.")
+        # La duplicidad de horario (mismo RUT, fecha y hora) y los choques del doctor los
+        # impide la base al guardar: ver error_de_integridad
 
-        # Validación 2: Identidad Única
+        # Validación: Identidad Única (una sola búsqueda por la llave única de la ficha maestra)
+        self._corregir_ficha = False
         if rut and nombre_nuevo and apellido_nuevo:
-            paciente_previo = Atencion.objects.filter(paciente_rut=rut).exclude(pk=self.instance.pk).first()
+            paciente_previo = Paciente.objects.filter(rut=rut).first()
             if paciente_previo:
-                nombre_reg = paciente_previo.paciente_nombre.strip()
-                apellido_reg = paciente_previo.paciente_apellido.strip()
+                nombre_reg = paciente_previo.nombre.strip()
+                apellido_reg = paciente_previo.apellido.strip()
                 if (nombre_nuevo.lower() != nombre_reg.lower()) or (apellido_nuevo.lower() != apellido_reg.lower()):
-                    raise ValidationError({
-                        'paciente_rut': f"Conflicto: El RUT {rut} pertenece a {nombre_reg} {apellido_reg}."
-                    })
+                    # Editar una atención ya vinculada a esta ficha, sin cambiar el RUT, corrige el
+                    # nombre de la ficha (p. ej. un error de tipeo); cualquier otro caso es un conflicto
+                    misma_ficha = (
+                        self.instance.pk and self.instance.paciente_id == paciente_previo.pk
+                        and self.instance.paciente_rut == rut
+                    )
+                    if not misma_ficha:
+                        raise ValidationError({
+                            'paciente_rut': f"Conflicto: El RUT {rut} pertenece a {nombre_reg} {apellido_reg}."
+                        })
+                    paciente_previo.nombre, paciente_previo.apellido = nombre_nuevo, apellido_nuevo
+                    self._corregir_ficha = True
+                # Atencion.save() reutiliza la ficha ya cargada
+                self.instance.paciente = paciente_previo
         return cleaned_data
 
+    def save(self, commit=True):
+        atencion = super().save(commit)
+        if commit and self._corregir_ficha:
+            atencion.paciente.save(update_fields=['nombre', 'apellido'])
+        return atencion
+
     def clean_paciente_rut(self):
         rut = self.cleaned_data.get('paciente_rut')
         if not rut: return rut
-        rut = rut.strip().upper().replace('.', '').replace(' ', '')
-        
-        if not re.match(r'^\d{1,8}-[\dK]$', rut):
-            raise ValidationError("Formato inválido. Use: 12345678-9")
-        
-        cuerpo, dv_ingresado = rut.split('-')
-        try:
-            cuerpo_num = int(cuerpo)
-        except ValueError:
-            raise ValidationError("El cuerpo del RUT debe ser numérico.")
-        
-        if cuerpo_num < 1000000: raise ValidationError("RUT inválido (muy bajo).")
-        if cuerpo_num >= 30000000: raise ValidationError("RUT inválido (fuera de rango).")
-        
-        reversed_digits = map(int, reversed(cuerpo))
-        factors = cycle(range(2, 8))
-        s = sum(d * f for d, f in zip(reversed_digits, factors))
-        res = (-s) % 11
-        if res == 10: dv_esperado = 'K'
-        else: dv_esperado = str(res)
-        
-        if dv_ingresado != dv_esperado:
-            raise ValidationError("RUT inválido. Dígito verificador incorrecto.")
-        return rut
+        return validar_rut(rut)
+
+def validar_rut(valor):
+    """Normaliza y valida un RUT (módulo 11, ver rut.py). Devuelve '12345678-9' o lanza ValidationError."""
+    validado = rut_utils.validar(valor)
+    if validado.error:
+        raise ValidationError(validado.error)
+    return validado.rut
 
 # --- OTROS FORMULARIOS ---
 
 class DetalleAtencionForm(forms.ModelForm):
     class Meta:
         model = DetalleAtencion
-        fields = ['especialidad', 'descripcion', 'valor']
+        fields = ['especialidad', 'tratamiento', 'descripcion', 'valor']
         widgets = {
             'especialidad': forms.Select(attrs={'class': 'form-select'}),
+            'tratamiento': forms.Select(attrs={'class': 'form-select form-select-sm mt-1'}),
             'descripcion': forms.TextInput(attrs={'class': 'form-control'}),
             'valor': forms.NumberInput(attrs={'class': 'form-control', 'placeholder': '$ 0'}),
         }
 
+    def __init__(self, *args, tratamientos=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        # El tratamiento del catálogo define la duración de la atención en la agenda
+        campo = self.fields['tratamiento']
+        campo.empty_label = 'Sin tratamiento del catálogo'
+        campo.label_from_instance = lambda t: f"{t.nombre} ({t.duracion_aproximada} min)"
+        if tratamientos is not None:
+            # Opciones ya cargadas por el formset: no se consulta el catálogo en cada fila
+            campo.choices = [('', campo.empty_label)] + [(t.pk, campo.label_from_instance(t)) for t in tratamientos]
+
+class DetalleAtencionFormSet(BaseInlineFormSet):
+    """Formset de detalles que lee el catálogo de tratamientos una sola vez para todas las filas."""
+
+    @cached_property
+    def tratamientos(self):
+        return list(Tratamiento.objects.order_by('nombre'))
+
+    def get_form_kwargs(self, index):
+        kwargs = super().get_form_kwargs(index)
+        kwargs['tratamientos'] = self.tratamientos
+        return kwargs
+
 class UserUpdateForm(forms.ModelForm):
     email = forms.EmailField(
         widget=forms.EmailInput(attrs={'class': 'form-control', 'placeholder': 'ejemplo@correo.com'}),
@@ -128,7 +183,19 @@ class UserUpdateForm(forms.ModelForm):
         model = User
         fields = ['first_name', 'last_name', 'email']
 
+class FotoPerfilField(forms.ImageField):
+    """Revisa peso y dimensiones (fotos.validar_foto) antes de que ImageField decodifique la imagen."""
+    def to_python(self, data):
+        if data not in self.empty_values:
+            validar_foto(data)
+        return super().to_python(data)
+
 class DoctorProfileForm(forms.ModelForm):
+    foto_perfil = FotoPerfilField(
+        label="Foto de Perfil", required=False,
+        widget=forms.FileInput(attrs={'class': 'form-control', 'accept': 'image/jpeg,image/png,image/webp'}),
+    )
+
     class Meta:
         model = Doctor
         fields = ['rut', 'fecha_nacimiento', 'foto_perfil']
@@ -136,7 +203,6 @@ class DoctorProfileForm(forms.ModelForm):
             'rut': forms.TextInput(attrs={'class': 'form-control'}),
             # CORRECCIÓN FECHA AQUÍ TAMBIÉN
             'fecha_nacimiento': forms.DateInput(format='%Y-%m-%d', attrs={'class': 'form-control', 'type': 'date'}),
-            'foto_perfil': forms.FileInput(attrs={'class': 'form-control'}),
         }
 
     def clean_fecha_nacimiento(self):
@@ -154,4 +220,41 @@ class DoctorProfileForm(forms.ModelForm):
             if edad > 65:
                 raise ValidationError(f"La edad máxima permitida es 65 años. (Calculada: {edad} años).")
                 
-        return fecha_nacimiento
\ No newline at end of file
+        return fecha_nacimiento
+
+    def save(self, commit=True):
+        doctor = super().save(commit)
+        # Foto nueva: se guarda sin EXIF y se generan las miniaturas (ver fotos.py)
+        if commit and 'foto_perfil' in self.changed_data and doctor.foto_perfil:
+            procesar_foto(doctor)
+        return doctor
+
+class DoctorAdminForm(forms.ModelForm):
+    """Formulario del admin: la foto pasa por las mismas validaciones que en Editar Perfil."""
+    foto_perfil = FotoPerfilField(label="Foto de Perfil", required=False)
+
+    class Meta:
+        model = Doctor
+        fields = '__all__'
+
+class AtencionAdminForm(ErroresHorarioMixin, forms.ModelForm):
+    """
+    Formulario del admin. Los choques y horarios repetidos los impide la base al guardar;
+    AtencionAdmin.changeform_view vuelve a validar con ese IntegrityError en `error_previo`.
+    """
+    error_previo = None
+
+    class Meta:
+        model = Atencion
+        fields = '__all__'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Igual que AtencionForm: sin consulta previa, que además no evita la carrera entre dos guardados
+        self.instance.revisar_horario_paciente = False
+
+    def _post_clean(self):
+        super()._post_clean()
+        if self.error_previo is not None:
+            self.error_de_integridad(self.error_previo)
+
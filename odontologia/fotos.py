@@ -0,0 +1,95 @@
+# odontologia/fotos.py
+import io
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+# --- Fotos de perfil de los doctores ---
+# El original subido se valida antes de decodificarlo (tamaño del archivo y de la
+# imagen según su cabecera), se guarda re-codificado sin EXIF (la cámara del celular
+# incluye ubicación GPS) y se generan miniaturas cuadradas en WebP y JPEG. Las
+# páginas muestran las miniaturas (pocos KB) en vez del original.
+
+TAMANO_MAXIMO = 5 * 1024 * 1024 # 5 MB
+PIXELES_MAXIMOS = 40_000_000 # ~ 8000 x 5000; más que eso es sospechoso (bomba de descompresión)
+FORMATOS_PERMITIDOS = {'JPEG', 'MPO', 'PNG', 'WEBP'}
+LADO_ORIGINAL = 1600 # El original se guarda con este lado mayor como máximo
+LADO_MINIATURA = 200 # Avatares de 80-100 px, al doble para pantallas de alta densidad
+EXTENSIONES_MINIATURA = ['webp', 'jpg']
+
+
+def validar_foto(archivo):
+    """
+    Rechaza archivos demasiado grandes o que no sean imágenes permitidas. Solo lee
+    la cabecera de la imagen: el tamaño en pixeles se revisa antes de decodificarla.
+    """
+    if archivo.size > TAMANO_MAXIMO:
+        raise ValidationError(f"La foto no puede superar los {TAMANO_MAXIMO // (1024 * 1024)} MB.")
+    posicion = archivo.tell()
+    try:
+        with Image.open(archivo) as img:
+            formato, (ancho, alto) = img.format, img.size
+    except Image.DecompressionBombError:
+        raise ValidationError("La imagen es demasiado grande.")
+    except (UnidentifiedImageError, OSError):
+        raise ValidationError("El archivo no es una imagen válida.")
+    finally:
+        archivo.seek(posicion)
+    if formato not in FORMATOS_PERMITIDOS:
+        raise ValidationError("Formato no permitido. Use JPG, PNG o WebP.")
+    if ancho * alto > PIXELES_MAXIMOS:
+        raise ValidationError(f"La imagen es demasiado grande ({ancho} x {alto} pixeles).")
+
+def _a_rgb(img):
+    """Aplica la orientación EXIF y aplana la transparencia sobre fondo blanco."""
+    img = ImageOps.exif_transpose(img)
+    if img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info):
+        img = img.convert('RGBA')
+        fondo = Image.new('RGB', img.size, 'white')
+        fondo.paste(img, mask=img.getchannel('A'))
+        return fondo
+    return img.convert('RGB')
+
+def _codificar(img, formato, **opciones):
+    # Sin pasar exif= Pillow no copia los metadatos de la imagen original
+    destino = io.BytesIO()
+    img.save(destino, formato, **opciones)
+    return ContentFile(destino.getvalue())
+
+def ruta_miniatura(doctor_id, version, extension):
+    return f"fotos_perfil/miniaturas/{doctor_id}-{version}.{extension}"
+
+def _guardar(nombre, contenido):
+    # Nombres fijos por versión: si quedó un archivo huérfano con el mismo nombre se reemplaza
+    if default_storage.exists(nombre):
+        default_storage.delete(nombre)
+    default_storage.save(nombre, contenido)
+
+def procesar_foto(doctor):
+    """
+    Re-codifica el original sin EXIF y genera las miniaturas de una nueva versión
+    (`Doctor.foto_version`), borrando los archivos de la versión anterior.
+    """
+    with doctor.foto_perfil.open('rb') as archivo, Image.open(archivo) as original:
+        img = _a_rgb(original)
+
+    version = doctor.foto_version + 1
+    anteriores = [doctor.foto_perfil.name] + [
+        ruta_miniatura(doctor.pk, doctor.foto_version, ext) for ext in EXTENSIONES_MINIATURA
+    ] if doctor.foto_version else [doctor.foto_perfil.name]
+
+    grande = img.copy()
+    grande.thumbnail((LADO_ORIGINAL, LADO_ORIGINAL), Image.Resampling.LANCZOS)
+    doctor.foto_perfil.save(f"{doctor.pk}-{version}.jpg", _codificar(grande, 'JPEG', quality=88, optimize=True), save=False)
+
+    miniatura = ImageOps.fit(img, (LADO_MINIATURA, LADO_MINIATURA), Image.Resampling.LANCZOS)
+    _guardar(ruta_miniatura(doctor.pk, version, 'webp'), _codificar(miniatura, 'WEBP', quality=80, method=6))
+    _guardar(ruta_miniatura(doctor.pk, version, 'jpg'), _codificar(miniatura, 'JPEG', quality=85, optimize=True, progressive=True))
+
+    doctor.foto_version = version
+    doctor.save(update_fields=['foto_perfil', 'foto_version'])
+    for nombre in anteriores:
+        compartido = type(doctor).objects.filter(foto_perfil=nombre).exists()
+        if nombre != doctor.foto_perfil.name and not compartido:
+            default_storage.delete(nombre)
@@ -0,0 +1,341 @@
+# odontologia/importacion.py
+import csv
+import datetime
+import re
+from decimal import Decimal, InvalidOperation
+from pathlib import Path
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import transaction
+from .models import Atencion, DetalleAtencion, Doctor, Paciente, DURACION_POR_DEFECTO
+from . import rut as rut_utils
+from .agenda import AgendaDia, agendas
+from .boletas import recalcular_boletas
+from .resumenes import recalcular_periodos, periodo_de
+
+# --- Carga masiva de atenciones desde CSV o Excel ---
+# Las filas se leen en streaming y se insertan por lotes con bulk_create. Filas
+# consecutivas con el mismo doctor, RUT, fecha y hora son una sola atención con
+# varios tratamientos. Como bulk_create no pasa por save() ni por las señales,
+# cada lote vincula la ficha del paciente y recalcula boletas y resúmenes.
+# Los tratamientos importados no vienen del catálogo: cada atención dura
+# DURACION_POR_DEFECTO y no puede cruzarse con otra del mismo doctor.
+
+COLUMNAS_OBLIGATORIAS = ['fecha', 'hora_atencion', 'paciente_rut', 'paciente_nombre', 'paciente_apellido']
+COLUMNAS_OPCIONALES = [
+    'doctor_rut', 'paciente_edad', 'paciente_sexo', 'paciente_email', 'paciente_celular',
+    'motivo_visita', 'metodo_pago', 'especialidad', 'descripcion', 'valor',
+]
+FORMATOS_FECHA = ['%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y']
+FORMATOS_HORA = ['%H:%M', '%H:%M:%S']
+EDAD_MAXIMA = 65 # Mismo límite que AtencionForm
+
+
+# --- Lectura ---
+
+def _normalizar_encabezado(valor):
+    return str(valor or '').strip().lower().replace(' ', '_')
+
+def _leer_csv(ruta, codificacion):
+    with open(ruta, newline='', encoding=codificacion) as archivo:
+        muestra = archivo.read(4096)
+        archivo.seek(0)
+        try:
+            dialecto = csv.Sniffer().sniff(muestra, delimiters=',;\t')
+        except csv.Error:
+            dialecto = csv.excel
+        lector = csv.reader(archivo, dialecto)
+        encabezados = [_normalizar_encabezado(c) for c in next(lector, [])]
+        yield encabezados
+        yield from lector
+
+def _leer_xlsx(ruta, hoja):
+    from openpyxl import load_workbook
+    libro = load_workbook(ruta, read_only=True, data_only=True)
+    try:
+        ws = libro[hoja] if hoja else libro.worksheets[0]
+        filas = ws.iter_rows(values_only=True)
+        yield [_normalizar_encabezado(c) for c in next(filas, ())]
+        yield from filas
+    finally:
+        libro.close()
+
+def leer_filas(ruta, hoja=None, codificacion='utf-8-sig'):
+    """
+    Genera (numero_fila, {columna: valor}) sin cargar el archivo completo en memoria.
+    La primera fila debe traer los encabezados (nombres de campo de Atencion).
+    """
+    if Path(ruta).suffix.lower() in ('.xlsx', '.xlsm'):
+        filas = _leer_xlsx(ruta, hoja)
+    else:
+        filas = _leer_csv(ruta, codificacion)
+    encabezados = next(filas, [])
+    faltantes = [c for c in COLUMNAS_OBLIGATORIAS if c not in encabezados]
+    if faltantes:
+        raise ValueError(f"Faltan columnas obligatorias: {', '.join(faltantes)}")
+    for numero, valores in enumerate(filas, start=2):
+        if not any(v not in (None, '') for v in valores):
+            continue # fila vacía
+        yield numero, dict(zip(encabezados, valores))
+
+
+# --- Validación ---
+
+def _texto(valor):
+    if valor is None:
+        return ''
+    if isinstance(valor, float) and valor.is_integer():
+        valor = int(valor) # Excel entrega los números como float
+    return str(valor).strip()
+
+def _fecha(valor):
+    if isinstance(valor, datetime.datetime):
+        return valor.date()
+    if isinstance(valor, datetime.date):
+        return valor
+    texto = _texto(valor)
+    for formato in FORMATOS_FECHA:
+        try:
+            return datetime.datetime.strptime(texto, formato).date()
+        except ValueError:
+            pass
+    raise ValidationError(f"Fecha inválida: '{texto}'.")
+
+def _hora(valor):
+    if isinstance(valor, datetime.datetime):
+        return valor.time()
+    if isinstance(valor, datetime.time):
+        return valor
+    texto = _texto(valor)
+    for formato in FORMATOS_HORA:
+        try:
+            return datetime.datetime.strptime(texto, formato).time()
+        except ValueError:
+            pass
+    raise ValidationError(f"Hora inválida: '{texto}'.")
+
+def _opcion(valor, opciones, defecto, campo):
+    """Acepta el código ('EF') o la etiqueta ('Efectivo') de un campo con choices."""
+    texto = _texto(valor)
+    if not texto:
+        return defecto
+    for codigo, etiqueta in opciones:
+        if texto.upper() == codigo or texto.lower() == etiqueta.lower():
+            return codigo
+    raise ValidationError(f"Valor inválido para {campo}: '{texto}'.")
+
+def _monto(valor):
+    """Acepta números de Excel, '15000.50' y el formato local '$15.000' o '15.000,50'."""
+    if isinstance(valor, (int, float, Decimal)):
+        return Decimal(str(valor))
+    texto = _texto(valor).replace('$', '').replace(' ', '')
+    if ',' in texto or re.fullmatch(r'\d{1,3}(\.\d{3})+', texto):
+        texto = texto.replace('.', '').replace(',', '.')
+    try:
+        return Decimal(texto)
+    except InvalidOperation:
+        raise ValidationError(f"Valor inválido: '{texto}'.")
+
+def _largo(texto, maximo, campo):
+    if len(texto) > maximo:
+        raise ValidationError(f"{campo} supera los {maximo} caracteres.")
+    return texto
+
+def validar_fila(datos, doctores, doctor_defecto=None):
+    """
+    Convierte una fila del archivo en (campos de Atencion, DetalleAtencion o None).
+    Lanza ValidationError con el primer problema encontrado.
+    """
+    doctor_rut = Paciente.normalizar_rut(_texto(datos.get('doctor_rut')))
+    if doctor_rut:
+        if doctor_rut not in doctores:
+            raise ValidationError(f"No existe un doctor con RUT {doctor_rut}.")
+        doctor_id = doctores[doctor_rut]
+    elif doctor_defecto:
+        doctor_id = doctor_defecto
+    else:
+        raise ValidationError("La fila no indica doctor_rut y no se usó --doctor.")
+
+    rut = rut_utils.validar(_texto(datos.get('paciente_rut')))
+    if not rut.rut:
+        raise ValidationError("Falta el RUT del paciente.")
+    if rut.error:
+        raise ValidationError(rut.error)
+    nombre = _largo(_texto(datos.get('paciente_nombre')), 50, 'El nombre')
+    apellido = _largo(_texto(datos.get('paciente_apellido')), 50, 'El apellido')
+    if not nombre or not apellido:
+        raise ValidationError("Faltan el nombre o el apellido del paciente.")
+
+    edad = _texto(datos.get('paciente_edad'))
+    if edad:
+        try:
+            edad = int(edad)
+        except ValueError:
+            raise ValidationError(f"Edad inválida: '{edad}'.")
+        if not 0 <= edad <= EDAD_MAXIMA:
+            raise ValidationError(f"La edad debe estar entre 0 y {EDAD_MAXIMA} años.")
+    email = _texto(datos.get('paciente_email')) or None
+    if email:
+        validate_email(email)
+
+    atencion = {
+        'doctor_id': doctor_id,
+        'fecha': _fecha(datos.get('fecha')),
+        'hora_atencion': _hora(datos.get('hora_atencion')),
+        'paciente_rut': rut.rut,
+        'paciente_nombre': nombre,
+        'paciente_apellido': apellido,
+        'paciente_edad': edad if edad != '' else None,
+        'paciente_sexo': _opcion(datos.get('paciente_sexo'), Atencion.PACIENTE_SEXO_CHOICES, 'O', 'paciente_sexo'),
+        'paciente_email': email,
+        'paciente_celular': _largo(_texto(datos.get('paciente_celular')), 15, 'El celular') or None,
+        'motivo_visita': _largo(_texto(datos.get('motivo_visita')), 200, 'El motivo'),
+        'metodo_pago': _opcion(datos.get('metodo_pago'), Atencion.METODOS_PAGO, 'EF', 'metodo_pago'),
+    }
+
+    descripcion = _largo(_texto(datos.get('descripcion')), 1000, 'La descripción')
+    valor = _texto(datos.get('valor'))
+    especialidad = _texto(datos.get('especialidad'))
+    if not (descripcion or valor or especialidad):
+        return atencion, None
+    valor = _monto(datos.get('valor')) if valor else Decimal('0.00')
+    if not valor.is_finite() or valor < 0 or valor >= Decimal('1e8'):
+        raise ValidationError("El valor del tratamiento está fuera de rango.")
+    detalle = DetalleAtencion(
+        especialidad=_opcion(especialidad, DetalleAtencion.ESPECIALIDADES, 'OTRO', 'especialidad'),
+        descripcion=descripcion, valor=valor.quantize(Decimal('0.01')),
+    )
+    return atencion, detalle
+
+
+def _clave(atencion):
+    return (atencion['doctor_id'], atencion['paciente_rut'], atencion['fecha'], atencion['hora_atencion'])
+
+def agrupar_en_lotes(filas, doctores, tamano, doctor_defecto=None):
+    """
+    Valida las filas y genera lotes de (lista de atenciones, lista de errores, números
+    de las filas válidas). Cada atención es (numero_fila, campos, [detalles]). Un lote
+    nunca separa los tratamientos de una misma atención.
+    """
+    lote, errores, numeros = [], [], []
+    for numero, datos in filas:
+        try:
+            atencion, detalle = validar_fila(datos, doctores, doctor_defecto)
+        except ValidationError as e:
+            errores.append((numero, ' '.join(e.messages)))
+            continue
+        if lote and _clave(lote[-1][1]) == _clave(atencion):
+            if detalle:
+                lote[-1][2].append(detalle)
+            numeros.append(numero)
+            continue
+        if len(lote) >= tamano:
+            yield lote, errores, numeros
+            lote, errores, numeros = [], [], []
+        lote.append((numero, atencion, [detalle] if detalle else []))
+        numeros.append(numero)
+    if lote or errores:
+        yield lote, errores, numeros
+
+
+# --- Escritura ---
+
+def _descartar_duplicadas(lote, errores):
+    """Quita las atenciones que repiten RUT, fecha y hora (en el lote o en la base)."""
+    existentes = set(
+        Atencion.objects.filter(
+            paciente_rut__in={a['paciente_rut'] for _, a, _ in lote},
+            fecha__in={a['fecha'] for _, a, _ in lote},
+        ).values_list('paciente_rut', 'fecha', 'hora_atencion')
+    )
+    validas = []
+    for numero, atencion, detalles in lote:
+        horario = (atencion['paciente_rut'], atencion['fecha'], atencion['hora_atencion'])
+        if horario in existentes:
+            errores.append((numero, f"El paciente con RUT {horario[0]} ya tiene hora ese día a esa misma hora."))
+            continue
+        existentes.add(horario)
+        validas.append((numero, atencion, detalles))
+    return validas
+
+def _descartar_choques(lote, errores):
+    """Quita las atenciones que se cruzan con otra del mismo doctor (en la base o antes en el lote)."""
+    if not lote:
+        return lote
+    fechas = [a['fecha'] for _, a, _ in lote]
+    ocupadas = agendas({a['doctor_id'] for _, a, _ in lote}, min(fechas), max(fechas))
+    validas = []
+    for numero, atencion, detalles in lote:
+        clave = (atencion['doctor_id'], atencion['fecha'])
+        hora = atencion['hora_atencion']
+        inicio = hora.hour * 60 + hora.minute
+        fin = inicio + DURACION_POR_DEFECTO
+        cruces = ocupadas[clave].choques(inicio, fin)
+        if cruces:
+            desde, hasta, _ = cruces[0]
+            errores.append((numero, (
+                f"El doctor ya tiene una atención de {desde // 60:02d}:{desde % 60:02d} a {hasta // 60:02d}:{hasta % 60:02d} "
+                f"que se cruza con este horario ({DURACION_POR_DEFECTO} min)."
+            )))
+            continue
+        ocupadas[clave] = AgendaDia(ocupadas[clave].intervalos + [(inicio, fin, 0)])
+        validas.append((numero, atencion, detalles))
+    return validas
+
+def _vincular_pacientes(lote, errores):
+    """
+    Resuelve la ficha maestra de cada RUT con una consulta, crea las que faltan y
+    actualiza los datos de contacto, igual que Paciente.desde_atencion.
+    """
+    pacientes = Paciente.objects.in_bulk({a['paciente_rut'] for _, a, _ in lote}, field_name='rut')
+    nuevos, modificados, validas = {}, {}, []
+    for numero, atencion, detalles in lote:
+        rut = atencion['paciente_rut']
+        paciente = pacientes.get(rut) or nuevos.get(rut)
+        if paciente is None:
+            nuevos[rut] = Paciente(
+                rut=rut, nombre=atencion['paciente_nombre'], apellido=atencion['paciente_apellido'],
+                sexo=atencion['paciente_sexo'], email=atencion['paciente_email'], celular=atencion['paciente_celular'],
+            )
+        elif (paciente.nombre.strip().lower() != atencion['paciente_nombre'].lower()
+              or paciente.apellido.strip().lower() != atencion['paciente_apellido'].lower()):
+            errores.append((numero, f"Conflicto: El RUT {rut} pertenece a {paciente.nombre} {paciente.apellido}."))
+            continue
+        elif rut in pacientes:
+            for campo in ('sexo', 'email', 'celular'):
+                valor = atencion[f'paciente_{campo}']
+                if valor and getattr(paciente, campo) != valor:
+                    setattr(paciente, campo, valor)
+                    modificados[rut] = paciente
+        validas.append((numero, atencion, detalles))
+
+    if nuevos:
+        Paciente.objects.bulk_create(nuevos.values())
+    if modificados:
+        Paciente.objects.bulk_update(modificados.values(), ['sexo', 'email', 'celular'])
+    fichas = {**pacientes, **nuevos}
+    for _, atencion, _ in validas:
+        atencion['paciente_id'] = fichas[atencion['paciente_rut']].pk
+    return validas
+
+def guardar_lote(lote, errores):
+    """
+    Inserta un lote en una transacción y devuelve (atenciones creadas, detalles creados).
+    Las filas rechazadas se agregan a `errores`.
+    """
+    with transaction.atomic():
+        lote = _vincular_pacientes(_descartar_choques(_descartar_duplicadas(lote, errores), errores), errores)
+        atenciones = Atencion.objects.bulk_create([Atencion(**campos) for _, campos, _ in lote])
+        detalles = []
+        for atencion, (_, _, detalles_fila) in zip(atenciones, lote):
+            for detalle in detalles_fila:
+                detalle.atencion_id = atencion.pk
+                detalles.append(detalle)
+        DetalleAtencion.objects.bulk_create(detalles)
+
+        recalcular_boletas(a.pk for a in atenciones)
+        recalcular_periodos(periodo_de(a.doctor_id, a.fecha) for a in atenciones)
+    return atenciones, detalles
+
+def doctores_por_rut():
+    return {Paciente.normalizar_rut(rut): pk for rut, pk in Doctor.objects.values_list('rut', 'pk')}
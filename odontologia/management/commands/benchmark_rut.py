@@ -0,0 +1,101 @@
+# odontologia/management/commands/benchmark_rut.py
+
+import random
+import re
+import statistics
+import time
+from itertools import cycle
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand
+from odontologia.rut import validar_lote, digito_verificador
+
+
+def validar_rut_original(rut):
+    """
+    Implementación original de forms.validar_rut (dígito a dígito), que ahora usa rut.py.
+    Se conserva como referencia: la línea base de este comando y el oráculo de los tests.
+    """
+    rut = rut.strip().upper().replace('.', '').replace(' ', '')
+
+    if not re.match(r'^\d{1,8}-[\dK]$', rut):
+        raise ValidationError("Formato inválido. Use: 12345678-9")
+
+    cuerpo, dv_ingresado = rut.split('-')
+    cuerpo_num = int(cuerpo)
+    if cuerpo_num < 1000000: raise ValidationError("RUT inválido (muy bajo).")
+    if cuerpo_num >= 30000000: raise ValidationError("RUT inválido (fuera de rango).")
+
+    reversed_digits = map(int, reversed(cuerpo))
+    factors = cycle(range(2, 8))
+    s = sum(d * f for d, f in zip(reversed_digits, factors))
+    res = (-s) % 11
+    if res == 10: dv_esperado = 'K'
+    else: dv_esperado = str(res)
+
+    if dv_ingresado != dv_esperado:
+        raise ValidationError("RUT inválido. Dígito verificador incorrecto.")
+    return rut
+
+
+def _muestra(cantidad, semilla):
+    """RUT con formatos variados: válidos con y sin puntos, dígito erróneo y basura."""
+    azar = random.Random(semilla)
+    ruts = []
+    for _ in range(cantidad):
+        cuerpo = azar.randrange(1000000, 30000000)
+        dv = digito_verificador(cuerpo)
+        tipo = azar.random()
+        if tipo < 0.6:
+            ruts.append(f"{cuerpo}-{dv}")
+        elif tipo < 0.8:
+            ruts.append(f"{cuerpo:,}".replace(',', '.') + f"-{dv.lower()}")
+        elif tipo < 0.95:
+            ruts.append(f"{cuerpo}-{'0' if dv != '0' else '1'}")
+        else:
+            ruts.append(azar.choice(['', 'abc', '123', f"{cuerpo}{dv}"]))
+    return ruts
+
+
+def _por_valor(ruts):
+    """Camino original del formulario: un RUT a la vez, con excepciones para los inválidos."""
+    resultado = []
+    for rut in ruts:
+        try:
+            resultado.append(validar_rut_original(rut))
+        except ValidationError:
+            resultado.append(None)
+    return resultado
+
+
+class Command(BaseCommand):
+    help = 'Compara el tiempo de validar RUT uno a uno (algoritmo original de forms.validar_rut) contra rut.validar_lote.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cantidad', type=int, default=100000, help='RUT por medición.')
+        parser.add_argument('--repeticiones', type=int, default=5, help='Mediciones por implementación.')
+        parser.add_argument('--semilla', type=int, default=2024, help='Semilla para generar la muestra.')
+
+    def handle(self, *args, **options):
+        ruts = _muestra(options['cantidad'], options['semilla'])
+        esperados = _por_valor(ruts)
+        obtenidos = [r.rut if r.error is None else None for r in validar_lote(ruts)]
+        if esperados != obtenidos:
+            distintos = sum(1 for a, b in zip(esperados, obtenidos) if a != b)
+            self.stdout.write(self.style.ERROR(f"Las implementaciones difieren en {distintos} RUT."))
+            return
+
+        tiempos = {}
+        for nombre, funcion in (('original (uno a uno)', _por_valor), ('rut.validar_lote', validar_lote)):
+            mediciones = []
+            for _ in range(options['repeticiones']):
+                inicio = time.perf_counter()
+                funcion(ruts)
+                mediciones.append(time.perf_counter() - inicio)
+            tiempos[nombre] = statistics.median(mediciones)
+
+        for nombre, segundos in tiempos.items():
+            self.stdout.write(
+                f"{nombre:32} {segundos * 1000:9.1f} ms  ({len(ruts) / segundos:,.0f} RUT/s)"
+            )
+        base, lote = tiempos.values()
+        self.stdout.write(self.style.SUCCESS(f"Resultados idénticos. Aceleración: {base / lote:.1f}x"))
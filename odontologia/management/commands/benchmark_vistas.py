@@ -0,0 +1,150 @@
+# odontologia/management/commands/benchmark_vistas.py
+
+import datetime
+import json
+import statistics
+import time
+import tracemalloc
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from odontologia.models import Atencion, TrabajoReporte
+from odontologia.sembrado import sembrar, limpiar
+from odontologia.trabajos import procesar
+
+
+def _percentil(tiempos, p):
+    if len(tiempos) == 1:
+        return tiempos[0]
+    return statistics.quantiles(tiempos, n=100, method='inclusive')[p - 1]
+
+
+class Command(BaseCommand):
+    help = (
+        'Mide dashboard, lista_atenciones, ver_calendario (y su feed), atencion_json y el Excel por doctor '
+        'con el cliente de pruebas de Django sobre datos sembrados de distintos tamaños. Usa la base '
+        'configurada en settings (SQLite o PostgreSQL) y borra lo sembrado al terminar.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tamanos', type=int, nargs='+', default=[10000, 100000, 1000000], help='Atenciones sembradas en cada medición.')
+        parser.add_argument('--repeticiones', type=int, default=20, help='Peticiones medidas por vista.')
+        parser.add_argument('--con-cache', action='store_true', help='No vaciar la caché antes de cada petición (mide el caso caliente).')
+        parser.add_argument('--conservar', action='store_true', help='No borrar los datos sembrados al terminar.')
+        parser.add_argument('--json', dest='salida_json', help='Guarda los resultados en este archivo JSON.')
+        parser.add_argument('--semilla', type=int, default=2024)
+        parser.add_argument('--forzar', action='store_true', help='Permite ejecutarlo con DEBUG = False.')
+
+    def handle(self, *args, **options):
+        if not settings.DEBUG and not options['forzar']:
+            raise CommandError("DEBUG está desactivado (¿base de producción?). Use --forzar si de verdad quiere medir aquí.")
+        self.repeticiones = max(options['repeticiones'], 1)
+        self.vaciar_cache = not options['con_cache']
+        self.stdout.write(f"Base de datos: {connection.vendor} ({connection.settings_dict['NAME']})")
+
+        resultados = []
+        # El cliente de pruebas usa el host "testserver"
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+            try:
+                for tamano in sorted(options['tamanos']):
+                    limpiar()
+                    inicio = time.perf_counter()
+                    creado = sembrar(tamano, semilla=options['semilla'])
+                    self.stdout.write(self.style.MIGRATE_HEADING(
+                        f"\n{tamano:,} atenciones sembradas en {time.perf_counter() - inicio:.1f} s "
+                        f"({len(creado['doctores'])} doctores)"
+                    ))
+                    for fila in self._medir_tamano(creado):
+                        resultados.append(dict(fila, tamano=tamano))
+                        self._imprimir(fila)
+            finally:
+                if not options['conservar']:
+                    limpiar()
+
+        if options['salida_json']:
+            with open(options['salida_json'], 'w', encoding='utf-8') as archivo:
+                json.dump({'base': connection.vendor, 'resultados': resultados}, archivo, indent=2)
+            self.stdout.write(f"Resultados guardados en {options['salida_json']}")
+
+    def _medir_tamano(self, creado):
+        doctor = creado['doctores'][0]
+        ultima = Atencion.objects.filter(doctor=doctor).order_by('-fecha', '-hora_atencion', '-id').first()
+        hoy = timezone.localdate()
+        inicio_mes = hoy.replace(day=1)
+        rango = {'start': inicio_mes.isoformat(), 'end': (inicio_mes + datetime.timedelta(days=42)).isoformat()}
+
+        for rol, usuario in (('admin', creado['admin']), ('doctor', doctor.user)):
+            cliente = Client()
+            cliente.force_login(usuario)
+            vistas = [
+                ('dashboard', lambda c=cliente: c.get(reverse('dashboard'))),
+                ('lista_atenciones', lambda c=cliente: c.get(reverse('lista_atenciones'))),
+                ('ver_calendario', lambda c=cliente: c.get(reverse('ver_calendario'))),
+                ('calendario_eventos_json', lambda c=cliente: c.get(reverse('calendario_eventos_json'), rango)),
+                ('atencion_json', lambda c=cliente: c.get(reverse('atencion_json', args=[ultima.pk]))),
+            ]
+            if rol == 'admin':
+                vistas += [
+                    ('descargar_excel_doctor', lambda c=cliente: self._encolar_excel(c, doctor, usuario)),
+                    ('descargar_excel_doctor (worker)', lambda: self._generar_excel(doctor, usuario)),
+                ]
+            for nombre, peticion in vistas:
+                yield dict(self._medir(peticion), vista=nombre, rol=rol)
+
+    def _encolar_excel(self, cliente, doctor, admin):
+        respuesta = cliente.post(reverse('descargar_excel_doctor', args=[doctor.pk]), HTTP_ACCEPT='application/json')
+        # Sin worker el trabajo queda pendiente: se borra para que el siguiente POST encole de nuevo
+        TrabajoReporte.objects.filter(solicitado_por=admin).delete()
+        return respuesta
+
+    def _generar_excel(self, doctor, admin):
+        """Lo que hace el worker `procesar_reportes` con ese trabajo (el archivo se borra enseguida)."""
+        trabajo = TrabajoReporte.objects.create(
+            tipo='EXCEL_DOCTOR', parametros={'doctor_id': doctor.pk}, solicitado_por=admin, estado='PROCESANDO', intentos=1,
+        )
+        procesar(trabajo)
+        if trabajo.estado != 'LISTO':
+            raise CommandError(f"El Excel falló: {trabajo.error}")
+        trabajo.archivo.delete(save=False)
+        trabajo.delete()
+
+    def _una(self, peticion):
+        if self.vaciar_cache:
+            cache.clear()
+        respuesta = peticion()
+        codigo = getattr(respuesta, 'status_code', 200)
+        if codigo >= 400:
+            raise CommandError(f"La petición respondió {codigo}.")
+        return respuesta
+
+    def _medir(self, peticion):
+        self._una(peticion) # Calentamiento (plantillas compiladas, conexiones)
+        tiempos = []
+        for _ in range(self.repeticiones):
+            inicio = time.perf_counter()
+            self._una(peticion)
+            tiempos.append((time.perf_counter() - inicio) * 1000)
+
+        # Consultas y memoria en una corrida aparte, para no inflar los tiempos
+        tracemalloc.start()
+        try:
+            with CaptureQueriesContext(connection) as consultas:
+                self._una(peticion)
+            _, pico = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        return {
+            'p50_ms': round(_percentil(tiempos, 50), 2), 'p95_ms': round(_percentil(tiempos, 95), 2),
+            'consultas': len(consultas), 'memoria_kb': round(pico / 1024),
+        }
+
+    def _imprimir(self, fila):
+        self.stdout.write(
+            f"  {fila['rol']:6} {fila['vista']:32} p50 {fila['p50_ms']:9.1f} ms   p95 {fila['p95_ms']:9.1f} ms   "
+            f"{fila['consultas']:3} consultas   {fila['memoria_kb']:>8,} KB"
+        )
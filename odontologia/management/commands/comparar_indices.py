@@ -0,0 +1,116 @@
+# odontologia/management/commands/comparar_indices.py
+
+import datetime
+import statistics
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from odontologia.busqueda import buscar_atenciones
+from odontologia.models import Atencion, Doctor
+
+# Además de Atencion._meta.indexes: en PostgreSQL el índice GIN de la búsqueda de texto
+# (0017) y las restricciones cuyos índices también usa el planificador (0020). En SQLite
+# la restricción única es parte de la tabla y no se puede borrar.
+INDICES_POSTGRES = ['atencion_busqueda_idx']
+RESTRICCIONES_POSTGRES = ['atencion_paciente_horario_uniq', 'atencion_doctor_sin_choques']
+
+
+class _Rollback(Exception):
+    """Se lanza para deshacer el borrado temporal de índices."""
+
+
+class Command(BaseCommand):
+    help = (
+        'Muestra el plan de ejecución (EXPLAIN) y el tiempo de las consultas más usadas sobre Atencion. '
+        'Con --sin-indices repite la medición dentro de una transacción que borra los índices y luego '
+        'se revierte. ¡No usar --sin-indices en producción: bloquea la tabla mientras dura!'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeticiones', type=int, default=20, help='Ejecuciones por consulta para medir el tiempo.')
+        parser.add_argument('--sin-indices', action='store_true', help='Compara contra la misma consulta sin los índices de Atencion.')
+
+    def handle(self, *args, **options):
+        atencion = Atencion.objects.order_by('-id').first()
+        if atencion is None:
+            raise CommandError('No hay atenciones registradas. Cargue datos antes de medir.')
+
+        if connection.vendor == 'postgresql':
+            # Estadísticas frescas para que el planificador elija con datos reales
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE odontologia_atencion')
+
+        consultas = self._consultas(atencion)
+        con_indices = self._medir(consultas, options['repeticiones'])
+        sin_indices = None
+        if options['sin_indices']:
+            # Conexión nueva: el módulo sqlite3 reutiliza sentencias preparadas y mostraría el plan anterior
+            connection.close()
+            try:
+                with transaction.atomic():
+                    self._borrar_indices()
+                    sin_indices = self._medir(consultas, options['repeticiones'])
+                    raise _Rollback
+            except _Rollback:
+                pass
+
+        self.stdout.write(f"Motor: {connection.vendor} | Atenciones: {Atencion.objects.count()}\n")
+        for nombre in consultas:
+            self.stdout.write(self.style.MIGRATE_HEADING(nombre))
+            self._mostrar('Con índices', *con_indices[nombre])
+            if sin_indices:
+                self._mostrar('Sin índices', *sin_indices[nombre])
+
+    def _consultas(self, atencion):
+        doctor = Doctor.objects.get(pk=atencion.doctor_id)
+        orden = ('-fecha', '-hora_atencion', '-id')
+        return {
+            'Listado por doctor (dashboard / listas / Excel)': Atencion.objects.filter(doctor=doctor).order_by(*orden)[:25],
+            'Listado global (admin)': Atencion.objects.order_by(*orden)[:25],
+            'Calendario (rango de fechas)': Atencion.objects.filter(
+                fecha__gte=atencion.fecha - datetime.timedelta(days=35), fecha__lt=atencion.fecha + datetime.timedelta(days=7)
+            ),
+            'Agenda del doctor (agenda.agendas, choques y horas libres)': Atencion.objects.filter(
+                doctor_id__in=[doctor.pk], fecha__range=(atencion.fecha, atencion.fecha + datetime.timedelta(days=13)),
+            ).values_list('doctor_id', 'fecha', 'hora_atencion', 'duracion', 'pk'),
+            'Horario del paciente (atencion_paciente_horario_uniq)': Atencion.objects.filter(
+                paciente_rut=atencion.paciente_rut, fecha=atencion.fecha, hora_atencion=atencion.hora_atencion
+            )[:1],
+            'Buscador de texto (busqueda.buscar_atenciones)': buscar_atenciones(
+                Atencion.objects.all(), f"{atencion.paciente_apellido} {atencion.paciente_nombre[:3]}"
+            )[:25],
+        }
+
+    def _medir(self, consultas, repeticiones):
+        resultados = {}
+        for nombre, queryset in consultas.items():
+            plan = queryset.explain()
+            tiempos = []
+            for _ in range(repeticiones):
+                inicio = time.perf_counter()
+                list(queryset.all())
+                tiempos.append((time.perf_counter() - inicio) * 1000)
+            resultados[nombre] = (plan, statistics.median(tiempos))
+        return resultados
+
+    def _borrar_indices(self):
+        # DROP INDEX y DROP CONSTRAINT son transaccionales tanto en PostgreSQL como en SQLite
+        nombres = [indice.name for indice in Atencion._meta.indexes]
+        restricciones = []
+        if connection.vendor == 'postgresql':
+            nombres += INDICES_POSTGRES
+            restricciones = RESTRICCIONES_POSTGRES
+        else:
+            self.stdout.write(self.style.WARNING(
+                "La restricción única de horario es parte de la tabla en este motor: se mide con su índice."
+            ))
+        with connection.cursor() as cursor:
+            for nombre in nombres:
+                cursor.execute(f'DROP INDEX IF EXISTS {connection.ops.quote_name(nombre)}')
+            for nombre in restricciones:
+                cursor.execute(f'ALTER TABLE odontologia_atencion DROP CONSTRAINT IF EXISTS {connection.ops.quote_name(nombre)}')
+
+    def _mostrar(self, titulo, plan, mediana_ms):
+        self.stdout.write(f"  {titulo}: {mediana_ms:.2f} ms (mediana)")
+        for linea in plan.splitlines():
+            self.stdout.write(f"      {linea}")
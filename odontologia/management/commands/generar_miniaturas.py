@@ -0,0 +1,27 @@
+# odontologia/management/commands/generar_miniaturas.py
+
+from django.core.management.base import BaseCommand
+from odontologia.models import Doctor
+from odontologia.fotos import procesar_foto
+
+
+class Command(BaseCommand):
+    help = 'Genera las miniaturas (WebP y JPEG, sin EXIF) de las fotos de perfil que aún no las tienen.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--todas', action='store_true', help='Vuelve a procesar también las fotos que ya tienen miniaturas.')
+
+    def handle(self, *args, **options):
+        doctores = Doctor.objects.exclude(foto_perfil='').exclude(foto_perfil__isnull=True)
+        if not options['todas']:
+            doctores = doctores.filter(foto_version=0)
+
+        procesadas = fallidas = 0
+        for doctor in doctores:
+            try:
+                procesar_foto(doctor)
+                procesadas += 1
+            except Exception as e: # Archivo ausente o dañado: se informa y se sigue con el resto
+                fallidas += 1
+                self.stdout.write(self.style.WARNING(f"Doctor {doctor.pk}: no se pudo procesar {doctor.foto_perfil.name} ({e})"))
+        self.stdout.write(self.style.SUCCESS(f"Listo. {procesadas} fotos procesadas, {fallidas} con errores."))
@@ -0,0 +1,94 @@
+# odontologia/management/commands/importar_atenciones.py
+
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, transaction
+from odontologia.models import Paciente
+from odontologia.versiones import invalidar_datos
+from odontologia.importacion import (
+    COLUMNAS_OBLIGATORIAS, COLUMNAS_OPCIONALES, leer_filas, agrupar_en_lotes, guardar_lote, doctores_por_rut,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Importa atenciones desde un archivo CSV o XLSX, en lotes transaccionales. '
+        f"Columnas obligatorias: {', '.join(COLUMNAS_OBLIGATORIAS)}. "
+        f"Opcionales: {', '.join(COLUMNAS_OPCIONALES)}."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('archivo', help='Ruta del archivo .csv o .xlsx (la primera fila son los encabezados).')
+        parser.add_argument('--doctor', help='RUT del doctor para las filas sin columna doctor_rut.')
+        parser.add_argument('--lote', type=int, default=500, help='Atenciones por lote (cada lote es una transacción).')
+        parser.add_argument('--hoja', help='Nombre de la hoja del Excel (por defecto la primera).')
+        parser.add_argument('--codificacion', default='utf-8-sig', help='Codificación del CSV.')
+        parser.add_argument('--solo-verificar', action='store_true', help='Valida el archivo completo y deshace cada lote sin guardar nada.')
+
+    def handle(self, *args, **options):
+        doctores = doctores_por_rut()
+        doctor_defecto = None
+        if options['doctor']:
+            doctor_defecto = doctores.get(Paciente.normalizar_rut(options['doctor']))
+            if doctor_defecto is None:
+                raise CommandError(f"No existe un doctor con RUT {options['doctor']}.")
+
+        try:
+            filas = leer_filas(options['archivo'], options['hoja'], options['codificacion'])
+            lotes = agrupar_en_lotes(filas, doctores, max(options['lote'], 1), doctor_defecto)
+            self._importar(lotes, options['solo_verificar'])
+        except (OSError, ValueError, KeyError) as e:
+            raise CommandError(f"No se pudo leer el archivo: {e}")
+
+    def _importar(self, lotes, solo_verificar):
+        inicio = time.perf_counter()
+        total_filas = total_atenciones = total_detalles = total_errores = 0
+        doctores_afectados = set()
+
+        for numero_lote, (lote, errores, numeros) in enumerate(lotes, start=1):
+            filas_lote = len(numeros) + len(errores)
+            if lote:
+                errores_validacion = len(errores)
+                try:
+                    with transaction.atomic():
+                        atenciones, detalles = guardar_lote(lote, errores)
+                        # En modo verificación se revisan duplicados, choques y conflictos de identidad y se deshace
+                        transaction.set_rollback(solo_verificar)
+                except DatabaseError as e:
+                    # El rollback deshizo el lote completo: los rechazos de guardar_lote ya no
+                    # aplican y ninguna fila válida del lote quedó importada
+                    del errores[errores_validacion:]
+                    errores.extend(
+                        (numero, f"No se importó: el lote de las filas {numeros[0]} a {numeros[-1]} falló ({e}).")
+                        for numero in numeros
+                    )
+                    atenciones, detalles = [], []
+                total_atenciones += len(atenciones)
+                total_detalles += len(detalles)
+                doctores_afectados.update(a.doctor_id for a in atenciones)
+
+            for fila, mensaje in sorted(errores):
+                self.stdout.write(self.style.WARNING(f"Fila {fila}: {mensaje}"))
+            total_errores += len(errores)
+            total_filas += filas_lote
+
+            transcurrido = time.perf_counter() - inicio
+            self.stdout.write(
+                f"Lote {numero_lote}: {total_filas} filas leídas, {total_atenciones} atenciones guardadas "
+                f"({total_filas / transcurrido:.0f} filas/s)."
+            )
+
+        # bulk_create no dispara las señales que limpian los indicadores y las tablas en caché
+        if not solo_verificar:
+            for doctor_id in doctores_afectados:
+                invalidar_datos(doctor_id)
+
+        transcurrido = time.perf_counter() - inicio
+        velocidad = total_filas / transcurrido if transcurrido else 0
+        resumen = (
+            f"{total_filas} filas en {transcurrido:.1f} s ({velocidad:.0f} filas/s): "
+            f"{total_atenciones} atenciones y {total_detalles} tratamientos importados, {total_errores} filas con errores."
+        )
+        if solo_verificar:
+            resumen = f"Verificación sin escribir cambios. {resumen}"
+        self.stdout.write((self.style.WARNING if total_errores else self.style.SUCCESS)(resumen))
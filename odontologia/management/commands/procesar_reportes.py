@@ -0,0 +1,54 @@
+# odontologia/management/commands/procesar_reportes.py
+
+import signal
+import time
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from odontologia.trabajos import tomar_siguiente, procesar, reencolar_abandonados, purgar_antiguos
+
+
+class Command(BaseCommand):
+    help = (
+        'Worker de la cola de reportes: genera los archivos pedidos desde la intranet y los deja en '
+        'MEDIA_ROOT/reportes/. Debe correr como un proceso aparte de gunicorn, con acceso al mismo '
+        'MEDIA_ROOT, y la web con REPORTES_CON_WORKER=1; sin eso la web genera los reportes.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--una-vez', action='store_true', help='Procesa lo pendiente y termina (útil para cron).')
+        parser.add_argument('--intervalo', type=float, default=2.0, help='Segundos de espera cuando la cola está vacía.')
+        parser.add_argument('--retener-dias', type=int, default=7, help='Días que se guardan los reportes terminados.')
+
+    def handle(self, *args, **options):
+        self.detener = False
+        # Render/systemd envían SIGTERM al reiniciar: terminar el trabajo en curso y salir
+        signal.signal(signal.SIGTERM, self._detener)
+        signal.signal(signal.SIGINT, self._detener)
+
+        reencolados = reencolar_abandonados()
+        borrados = purgar_antiguos(options['retener_dias'])
+        self.stdout.write(f"Worker iniciado ({reencolados} trabajos reencolados, {borrados} reportes antiguos borrados).")
+
+        ultimo_mantenimiento = time.monotonic()
+        while not self.detener:
+            close_old_connections()
+            trabajo = tomar_siguiente()
+            if trabajo is None:
+                if options['una_vez']:
+                    break
+                if time.monotonic() - ultimo_mantenimiento > 3600:
+                    reencolar_abandonados()
+                    purgar_antiguos(options['retener_dias'])
+                    ultimo_mantenimiento = time.monotonic()
+                time.sleep(options['intervalo'])
+                continue
+
+            inicio = time.perf_counter()
+            procesar(trabajo)
+            estilo = self.style.SUCCESS if trabajo.estado == 'LISTO' else self.style.WARNING
+            self.stdout.write(estilo(f"{trabajo} en {time.perf_counter() - inicio:.1f} s"))
+
+        self.stdout.write("Worker detenido.")
+
+    def _detener(self, *args):
+        self.detener = True
@@ -0,0 +1,59 @@
+# odontologia/management/commands/reconciliar_boletas.py
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from odontologia.models import Atencion, Boleta
+from odontologia.boletas import calcular_totales, guardar_boletas
+
+
+class Command(BaseCommand):
+    help = (
+        'Crea las boletas faltantes y corrige las que no coinciden con sus detalles, en lotes. '
+        'Es una corrección manual: la carga inicial la hizo la migración 0024 y las señales mantienen las boletas.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=1000, help='Atenciones por lote (cada lote es una transacción).')
+        parser.add_argument('--solo-verificar', action='store_true', help='Informa diferencias sin escribir nada.')
+
+    def handle(self, *args, **options):
+        lote = options['lote']
+        solo_verificar = options['solo_verificar']
+        revisadas = creadas = corregidas = 0
+        ultimo_id = 0
+
+        while True:
+            ids = list(
+                Atencion.objects.filter(pk__gt=ultimo_id).order_by('pk').values_list('pk', flat=True)[:lote]
+            )
+            if not ids:
+                break
+            ultimo_id = ids[-1]
+
+            with transaction.atomic():
+                esperados = calcular_totales(ids)
+                actuales = {
+                    atencion_id: (tratamientos, examenes, ganancia)
+                    for atencion_id, tratamientos, examenes, ganancia in Boleta.objects.filter(atencion_id__in=ids).values_list(
+                        'atencion_id', 'total_tratamientos', 'total_examenes', 'ganancia_neta_doctor'
+                    )
+                }
+                diferencias = {}
+                for atencion_id, totales in esperados.items():
+                    if atencion_id not in actuales:
+                        creadas += 1
+                        diferencias[atencion_id] = totales
+                    elif actuales[atencion_id] != totales:
+                        corregidas += 1
+                        diferencias[atencion_id] = totales
+                if diferencias and not solo_verificar:
+                    guardar_boletas(diferencias)
+
+            revisadas += len(ids)
+            self.stdout.write(f"Revisadas {revisadas} atenciones...")
+
+        accion = 'por crear' if solo_verificar else 'creadas'
+        accion_corr = 'por corregir' if solo_verificar else 'corregidas'
+        self.stdout.write(self.style.SUCCESS(
+            f"Listo. {revisadas} atenciones revisadas, {creadas} boletas {accion}, {corregidas} {accion_corr}."
+        ))
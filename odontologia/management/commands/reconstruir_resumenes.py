@@ -0,0 +1,46 @@
+# odontologia/management/commands/reconstruir_resumenes.py
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from odontologia.models import ResumenMensualDoctor
+from odontologia.resumenes import calcular_todo, CAMPOS_TOTALES
+
+
+def _por_clave(filas):
+    return {
+        (f.doctor_id, f.anio, f.mes, f.especialidad): tuple(getattr(f, campo) for campo in CAMPOS_TOTALES)
+        for f in filas
+    }
+
+
+class Command(BaseCommand):
+    help = 'Regenera desde cero los resúmenes mensuales por doctor y verifica que coincidan con los detalles.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--solo-verificar', action='store_true', help='Compara la tabla actual con los detalles sin escribir nada.')
+
+    def handle(self, *args, **options):
+        filas = calcular_todo()
+        esperadas = _por_clave(filas)
+
+        if not options['solo_verificar']:
+            with transaction.atomic():
+                ResumenMensualDoctor.objects.all().delete()
+                ResumenMensualDoctor.objects.bulk_create(filas, batch_size=1000)
+            self.stdout.write(f"Se regeneraron {len(filas)} filas de resumen.")
+
+        actuales = _por_clave(ResumenMensualDoctor.objects.all())
+        faltantes = esperadas.keys() - actuales.keys()
+        sobrantes = actuales.keys() - esperadas.keys()
+        distintas = [clave for clave in esperadas.keys() & actuales.keys() if esperadas[clave] != actuales[clave]]
+
+        for titulo, claves in (('Faltan', faltantes), ('Sobran', sobrantes), ('Difieren', distintas)):
+            for doctor_id, anio, mes, especialidad in sorted(claves):
+                self.stdout.write(self.style.WARNING(f"{titulo}: doctor {doctor_id} {mes:02d}/{anio} {especialidad}"))
+
+        if faltantes or sobrantes or distintas:
+            raise CommandError(
+                f"El resumen no coincide con los detalles ({len(faltantes)} faltantes, "
+                f"{len(sobrantes)} sobrantes, {len(distintas)} distintas)."
+            )
+        self.stdout.write(self.style.SUCCESS(f"Verificado: {len(actuales)} filas coinciden con los detalles."))
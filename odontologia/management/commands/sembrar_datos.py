@@ -0,0 +1,48 @@
+# odontologia/management/commands/sembrar_datos.py
+
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from odontologia.sembrado import sembrar, limpiar, PREFIJO_USUARIO
+
+
+class Command(BaseCommand):
+    help = (
+        'Crea doctores, pacientes, atenciones, tratamientos y exámenes sintéticos para pruebas de rendimiento. '
+        f"Lo sembrado se reconoce por el prefijo de usuario '{PREFIJO_USUARIO}' y se borra con --limpiar."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--atenciones', type=int, help='Cantidad de atenciones a crear (por defecto 10.000).')
+        parser.add_argument('--doctores', type=int, help='Cantidad de doctores (por defecto según el volumen).')
+        parser.add_argument('--dias', type=int, default=730, help='Días hacia atrás desde hoy en que se reparten las atenciones.')
+        parser.add_argument('--semilla', type=int, default=2024, help='Semilla del generador (mismos datos con la misma semilla).')
+        parser.add_argument('--lote', type=int, default=5000, help='Atenciones por transacción.')
+        parser.add_argument('--limpiar', action='store_true', help='Borra lo sembrado antes (sin otras opciones, solo borra).')
+        parser.add_argument('--forzar', action='store_true', help='Permite ejecutarlo con DEBUG = False.')
+
+    def handle(self, *args, **options):
+        if not settings.DEBUG and not options['forzar']:
+            raise CommandError("DEBUG está desactivado (¿base de producción?). Use --forzar si de verdad quiere sembrar aquí.")
+
+        if options['limpiar']:
+            borradas = limpiar()
+            self.stdout.write(f"Se borraron {borradas} atenciones sembradas.")
+            if options['atenciones'] is None:
+                return
+
+        inicio = time.perf_counter()
+
+        def progreso(hechas, total):
+            segundos = time.perf_counter() - inicio
+            self.stdout.write(f"  {hechas:>9,} / {total:,} atenciones ({hechas / segundos:,.0f} por segundo)")
+
+        creado = sembrar(
+            options['atenciones'] or 10000, doctores=options['doctores'], dias=options['dias'],
+            semilla=options['semilla'], lote=max(options['lote'], 1), progreso=progreso,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Listo en {time.perf_counter() - inicio:.1f} s: {creado['atenciones']:,} atenciones, "
+            f"{len(creado['doctores'])} doctores y {creado['pacientes']:,} pacientes. "
+            f"Administrador: {creado['admin'].username}"
+        ))
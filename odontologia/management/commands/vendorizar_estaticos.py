@@ -0,0 +1,36 @@
+# odontologia/management/commands/vendorizar_estaticos.py
+
+from django.core.management.base import BaseCommand, CommandError
+from odontologia.estaticos import vendorizar, comprobar, destino, SUMAS
+
+
+class Command(BaseCommand):
+    help = (
+        'Descarga Bootstrap, Font Awesome, Poppins y FullCalendar (versiones fijas) en static/vendor, '
+        'recortando el CSS a las clases que usan las plantillas, y escribe sus sumas SHA-256. Vuelva a '
+        'ejecutarlo si una plantilla usa una clase o un ícono nuevo, y suba static/vendor al repositorio.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--comprobar', action='store_true',
+            help=f'No descarga: falla si falta un archivo o no coincide con {SUMAS} (para build.sh).',
+        )
+
+    def handle(self, *args, **options):
+        if options['comprobar']:
+            problemas = comprobar()
+            if problemas:
+                raise CommandError("static/vendor no está completo:\n  " + "\n  ".join(problemas))
+            self.stdout.write(self.style.SUCCESS(f"static/vendor coincide con {SUMAS}."))
+            return
+
+        try:
+            resultado = vendorizar()
+        except OSError as e: # Sin red, CDN caído o error HTTP
+            raise CommandError(f"No se pudo descargar: {e}")
+
+        for ruta, descargado, guardado in resultado:
+            detalle = f"{descargado / 1024:8.1f} KB -> {guardado / 1024:8.1f} KB" if descargado != guardado else f"{guardado / 1024:8.1f} KB"
+            self.stdout.write(f"  {ruta:45} {detalle}")
+        self.stdout.write(self.style.SUCCESS(f"Listo en {destino()} (sumas en {SUMAS}); súbalo al repositorio."))
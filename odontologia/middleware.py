@@ -0,0 +1,138 @@
+# odontologia/middleware.py
+import hashlib
+import json
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack
+from django.conf import settings
+from django.db import connections
+
+# --- Instrumentación de consultas SQL por petición ---
+# Envuelve cada consulta con connection.execute_wrapper y al terminar la petición
+# informa cantidad de consultas, tiempo total en la base, consultas repetidas (misma
+# forma de SQL, típico de un N+1) y las más lentas. Los datos salen en la cabecera
+# Server-Timing (visible en la pestaña Red del navegador) y en el log
+# "odontologia.sql"; si se pasan los umbrales de INSTRUMENTACION_SQL se registra
+# como WARNING para que aparezca en los logs de producción.
+
+logger = logging.getLogger('odontologia.sql')
+
+CONFIGURACION_POR_DEFECTO = {
+    'ACTIVA': True,
+    'SERVER_TIMING': 'staff', # 'siempre', 'staff' (solo administradores o DEBUG) o 'nunca'
+    'MAX_CONSULTAS': 50, # Más consultas que esto en una petición => WARNING
+    'MAX_REPETIDAS': 5, # Una misma forma de SQL repetida más veces => WARNING (N+1)
+    'MAX_MS_DB': 500, # Tiempo total en la base sobre este valor => WARNING
+    'LENTAS': 3, # Consultas más lentas que se informan
+    'LARGO_SQL': 300, # Caracteres de SQL que se guardan en el log por consulta
+}
+
+_LITERALES = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_LISTAS = re.compile(r"\((?:\s*%s\s*,)+\s*%s\s*\)")
+_ESPACIOS = re.compile(r"\s+")
+
+
+def configuracion():
+    return {**CONFIGURACION_POR_DEFECTO, **getattr(settings, 'INSTRUMENTACION_SQL', {})}
+
+def huella(sql):
+    """Forma normalizada del SQL: sin literales y con las listas IN (%s, %s, ...) colapsadas."""
+    sql = _LITERALES.sub('?', sql)
+    sql = _LISTAS.sub('(...)', sql)
+    return _ESPACIOS.sub(' ', sql).strip()
+
+
+class RegistroConsultas:
+    """execute_wrapper que anota SQL y duración de cada consulta ejecutada."""
+
+    def __init__(self):
+        self.consultas = [] # (duración en ms, sql)
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.consultas.append(((time.perf_counter() - inicio) * 1000, sql))
+
+    @property
+    def tiempo_total(self):
+        return sum(duracion for duracion, _ in self.consultas)
+
+    def repetidas(self):
+        """[(huella, veces)] de las formas de SQL que se ejecutaron más de una vez, de mayor a menor."""
+        conteo = Counter(huella(sql) for _, sql in self.consultas)
+        return [(forma, veces) for forma, veces in conteo.most_common() if veces > 1]
+
+    def mas_lentas(self, cantidad):
+        return sorted(self.consultas, key=lambda c: c[0], reverse=True)[:cantidad]
+
+
+class InstrumentacionSQLMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        config = configuracion()
+        if not config['ACTIVA']:
+            return self.get_response(request)
+
+        registro = RegistroConsultas()
+        inicio = time.perf_counter()
+        with ExitStack() as pila:
+            for conexion in connections.all():
+                pila.enter_context(conexion.execute_wrapper(registro))
+            response = self.get_response(request)
+        total_ms = (time.perf_counter() - inicio) * 1000
+
+        repetidas = registro.repetidas()
+        excedida = (
+            len(registro.consultas) > config['MAX_CONSULTAS']
+            or (repetidas and repetidas[0][1] > config['MAX_REPETIDAS'])
+            or registro.tiempo_total > config['MAX_MS_DB']
+        )
+        self._registrar(request, response, registro, repetidas, total_ms, excedida, config)
+        if self._mostrar_server_timing(request, config):
+            response['Server-Timing'] = self._server_timing(registro, repetidas, total_ms)
+        return response
+
+    def _mostrar_server_timing(self, request, config):
+        modo = config['SERVER_TIMING']
+        if modo == 'siempre':
+            return True
+        if modo == 'staff':
+            user = getattr(request, 'user', None)
+            return settings.DEBUG or bool(user and (user.is_staff or user.is_superuser))
+        return False
+
+    def _server_timing(self, registro, repetidas, total_ms):
+        metricas = [
+            f'db;dur={registro.tiempo_total:.1f};desc="{len(registro.consultas)} consultas"',
+            f'app;dur={total_ms - registro.tiempo_total:.1f}',
+        ]
+        if repetidas:
+            metricas.append(f'dup;desc="{sum(veces for _, veces in repetidas)} repetidas"')
+        return ', '.join(metricas)
+
+    def _registrar(self, request, response, registro, repetidas, total_ms, excedida, config):
+        nivel = logging.WARNING if excedida else logging.DEBUG
+        if not logger.isEnabledFor(nivel):
+            return
+        largo = config['LARGO_SQL']
+        datos = {
+            'ruta': request.path,
+            'metodo': request.method,
+            'vista': getattr(request.resolver_match, 'view_name', None),
+            'estado': response.status_code,
+            'consultas': len(registro.consultas),
+            'ms_db': round(registro.tiempo_total, 2),
+            'ms_total': round(total_ms, 2),
+            'repetidas': [
+                {'huella': hashlib.sha1(forma.encode()).hexdigest()[:10], 'veces': veces, 'sql': forma[:largo]}
+                for forma, veces in repetidas[:5]
+            ],
+            'lentas': [{'ms': round(ms, 2), 'sql': sql[:largo]} for ms, sql in registro.mas_lentas(config['LENTAS'])],
+        }
+        logger.log(nivel, json.dumps(datos, ensure_ascii=False), extra={'sql_stats': datos})
@@ -0,0 +1,56 @@
+# Generated by Django 5.2.7 on 2026-10-17 21:27
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+# Índice trigram para `paciente_rut__icontains`. En PostgreSQL Django traduce el filtro
+# a UPPER("paciente_rut"::text) LIKE UPPER('%...%'), así que el índice usa la misma expresión.
+# En otros motores (SQLite en desarrollo) no hay equivalente y se omite.
+CREAR_INDICE_TRIGRAM = (
+    'CREATE INDEX IF NOT EXISTS atencion_rut_trgm_idx ON odontologia_atencion '
+    'USING gin ((UPPER("paciente_rut"::text)) gin_trgm_ops)'
+)
+BORRAR_INDICE_TRIGRAM = 'DROP INDEX IF EXISTS atencion_rut_trgm_idx'
+
+
+def crear_indice_trigram(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    schema_editor.execute(CREAR_INDICE_TRIGRAM)
+
+
+def borrar_indice_trigram(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(BORRAR_INDICE_TRIGRAM)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('odontologia', '0009_boleta_total_examenes_examenatencion'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='atencion',
+            index=models.Index(fields=['doctor', '-fecha', '-hora_atencion', '-id'], name='atencion_doctor_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='atencion',
+            index=models.Index(fields=['-fecha', '-hora_atencion', '-id'], name='atencion_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='atencion',
+            index=models.Index(fields=['paciente_rut', 'fecha', 'hora_atencion'], name='atencion_rut_fecha_hora_idx'),
+        ),
+        # El índice simple de la FK queda cubierto por el prefijo de atencion_doctor_fecha_idx
+        migrations.AlterField(
+            model_name='atencion',
+            name='doctor',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.PROTECT, to='odontologia.doctor', verbose_name='Doctor'),
+        ),
+        migrations.RunPython(crear_indice_trigram, borrar_indice_trigram),
+    ]
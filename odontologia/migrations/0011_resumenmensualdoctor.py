@@ -0,0 +1,57 @@
+# Generated by Django 5.2.7 on 2026-10-17 21:31
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import ExtractYear, ExtractMonth
+
+
+def poblar_resumenes(apps, schema_editor):
+    # Carga inicial desde los detalles existentes (equivale a `manage.py reconstruir_resumenes`)
+    DetalleAtencion = apps.get_model('odontologia', 'DetalleAtencion')
+    ResumenMensualDoctor = apps.get_model('odontologia', 'ResumenMensualDoctor')
+    filas = DetalleAtencion.objects.annotate(
+        anio=ExtractYear('atencion__fecha'), mes=ExtractMonth('atencion__fecha')
+    ).values('atencion__doctor_id', 'anio', 'mes', 'especialidad').annotate(
+        cantidad_atenciones=Count('atencion', distinct=True), cantidad_tratamientos=Count('pk'), total_facturado=Sum('valor')
+    ).order_by()
+    ResumenMensualDoctor.objects.bulk_create([
+        ResumenMensualDoctor(
+            doctor_id=f['atencion__doctor_id'], anio=f['anio'], mes=f['mes'], especialidad=f['especialidad'],
+            cantidad_atenciones=f['cantidad_atenciones'], cantidad_tratamientos=f['cantidad_tratamientos'],
+            total_facturado=f['total_facturado'],
+            ganancia_doctor=(f['total_facturado'] * Decimal('0.5')).quantize(Decimal('0.01')),
+        )
+        for f in filas
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('odontologia', '0010_atencion_indices'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumenMensualDoctor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('anio', models.PositiveSmallIntegerField(verbose_name='Año')),
+                ('mes', models.PositiveSmallIntegerField(verbose_name='Mes')),
+                ('especialidad', models.CharField(choices=[('OPER', 'Operatoria'), ('ENDO', 'Endodoncia'), ('ORTO', 'Ortodoncia'), ('CIRU', 'Cirugía'), ('IMPL', 'Implantes'), ('PEDIA', 'Odontopediatría'), ('HIGI', 'Higiene Oral'), ('OTRO', 'Otro')], max_length=5, verbose_name='Especialidad')),
+                ('cantidad_atenciones', models.PositiveIntegerField(default=0, verbose_name='Atenciones')),
+                ('cantidad_tratamientos', models.PositiveIntegerField(default=0, verbose_name='Tratamientos')),
+                ('total_facturado', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Total Facturado')),
+                ('ganancia_doctor', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Ganancia Doctor')),
+                ('doctor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='resumenes_mensuales', to='odontologia.doctor', verbose_name='Doctor')),
+            ],
+            options={
+                'verbose_name': 'Resumen Mensual',
+                'verbose_name_plural': 'Resúmenes Mensuales',
+                'constraints': [models.UniqueConstraint(fields=('doctor', 'anio', 'mes', 'especialidad'), name='resumen_doctor_periodo_uniq')],
+            },
+        ),
+        migrations.RunPython(poblar_resumenes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,92 @@
+# Generated by Django 5.2.7 on 2026-10-17 21:33
+
+import django.db.models.deletion
+from collections import defaultdict
+from django.db import migrations, models
+
+
+def _normalizar(rut):
+    return (rut or '').strip().upper().replace('.', '').replace(' ', '')
+
+
+def poblar_pacientes(apps, schema_editor):
+    """
+    Deduplica las fichas por RUT normalizado y crea una por cada RUT que aparezca
+    en las atenciones (con los datos de su atención más reciente). Luego vincula
+    cada atención y deja su RUT en formato normalizado.
+    """
+    Paciente = apps.get_model('odontologia', 'Paciente')
+    Atencion = apps.get_model('odontologia', 'Atencion')
+
+    # 1. Fichas existentes: unificar las que solo difieren en el formato del RUT. Se conserva
+    # la más antigua; los duplicados se borran antes de renombrarla (rut es único)
+    grupos = defaultdict(list)
+    for paciente in Paciente.objects.order_by('pk'):
+        grupos[_normalizar(paciente.rut)].append(paciente)
+    fichas = {}
+    for rut, (paciente, *duplicados) in grupos.items():
+        if duplicados:
+            Paciente.objects.filter(pk__in=[d.pk for d in duplicados]).delete() # nadie las referenciaba todavía
+        if paciente.rut != rut:
+            paciente.rut = rut
+            paciente.save(update_fields=['rut'])
+        fichas[rut] = paciente.pk
+
+    # 2. Un paciente por RUT de las atenciones, tomando la atención más reciente
+    ruts_originales = defaultdict(set)
+    nuevos = {}
+    filas = Atencion.objects.exclude(paciente_rut='').order_by('-fecha', '-hora_atencion', '-id').values_list(
+        'paciente_rut', 'paciente_nombre', 'paciente_apellido', 'paciente_sexo', 'paciente_email', 'paciente_celular'
+    )
+    for rut_original, nombre, apellido, sexo, email, celular in filas.iterator(chunk_size=2000):
+        rut = _normalizar(rut_original)
+        ruts_originales[rut].add(rut_original)
+        if rut not in fichas and rut not in nuevos:
+            nuevos[rut] = Paciente(rut=rut, nombre=nombre, apellido=apellido, sexo=sexo, email=email, celular=celular)
+    Paciente.objects.bulk_create(nuevos.values(), batch_size=1000)
+    fichas.update(Paciente.objects.filter(rut__in=list(nuevos)).values_list('rut', 'pk'))
+
+    # 3. Vincular atenciones (una actualización por variante de RUT)
+    for rut, originales in ruts_originales.items():
+        Atencion.objects.filter(paciente_rut__in=originales).update(paciente_id=fichas[rut], paciente_rut=rut)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('odontologia', '0011_resumenmensualdoctor'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='atencion',
+            name='paciente',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='atenciones', to='odontologia.paciente', verbose_name='Paciente'),
+        ),
+        migrations.AddField(
+            model_name='paciente',
+            name='apellido',
+            field=models.CharField(blank=True, default='', max_length=50, verbose_name='Apellido'),
+        ),
+        migrations.AddField(
+            model_name='paciente',
+            name='celular',
+            field=models.CharField(blank=True, max_length=15, null=True, verbose_name='Celular'),
+        ),
+        migrations.AddField(
+            model_name='paciente',
+            name='email',
+            field=models.EmailField(blank=True, max_length=254, null=True, verbose_name='Email'),
+        ),
+        migrations.AddField(
+            model_name='paciente',
+            name='sexo',
+            field=models.CharField(choices=[('M', 'Masculino'), ('F', 'Femenino'), ('O', 'Otro')], default='O', max_length=1, verbose_name='Sexo'),
+        ),
+        migrations.AlterField(
+            model_name='paciente',
+            name='nombre',
+            field=models.CharField(max_length=100, verbose_name='Nombre'),
+        ),
+        migrations.RunPython(poblar_pacientes, migrations.RunPython.noop),
+    ]
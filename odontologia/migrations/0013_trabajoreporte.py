@@ -0,0 +1,38 @@
+# Generated by Django 5.2.7 on 2026-10-17 21:38
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('odontologia', '0012_paciente_ficha_maestra'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrabajoReporte',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('EXCEL_DOCTOR', 'Reporte Financiero por Doctor')], max_length=20, verbose_name='Tipo')),
+                ('parametros', models.JSONField(blank=True, default=dict, verbose_name='Parámetros')),
+                ('estado', models.CharField(choices=[('PENDIENTE', 'Pendiente'), ('PROCESANDO', 'Procesando'), ('LISTO', 'Listo'), ('ERROR', 'Error')], default='PENDIENTE', max_length=10, verbose_name='Estado')),
+                ('creado', models.DateTimeField(auto_now_add=True, verbose_name='Solicitado')),
+                ('iniciado', models.DateTimeField(blank=True, null=True, verbose_name='Iniciado')),
+                ('terminado', models.DateTimeField(blank=True, null=True, verbose_name='Terminado')),
+                ('intentos', models.PositiveSmallIntegerField(default=0, verbose_name='Intentos')),
+                ('error', models.TextField(blank=True, default='', verbose_name='Error')),
+                ('archivo', models.FileField(blank=True, upload_to='reportes/%Y/%m/', verbose_name='Archivo')),
+                ('nombre_archivo', models.CharField(blank=True, default='', max_length=150, verbose_name='Nombre de descarga')),
+                ('solicitado_por', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='trabajos_reporte', to=settings.AUTH_USER_MODEL, verbose_name='Solicitado por')),
+            ],
+            options={
+                'verbose_name': 'Trabajo de Reporte',
+                'verbose_name_plural': 'Trabajos de Reporte',
+                'indexes': [models.Index(fields=['estado', 'creado'], name='trabajo_estado_creado_idx')],
+            },
+        ),
+    ]
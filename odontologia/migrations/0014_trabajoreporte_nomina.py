@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-17 21:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('odontologia', '0013_trabajoreporte'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='trabajoreporte',
+            name='tipo',
+            field=models.CharField(choices=[('EXCEL_DOCTOR', 'Reporte Financiero por Doctor'), ('NOMINA', 'Nómina Consolidada de Doctores')], max_length=20, verbose_name='Tipo'),
+        ),
+    ]
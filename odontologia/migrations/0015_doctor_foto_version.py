@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-17 21:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('odontologia', '0014_trabajoreporte_nomina'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='doctor',
+            name='foto_version',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Versión de la Foto'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.7 on 2026-10-17 22:05
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('odontologia', '0015_doctor_foto_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='atencion',
+            name='actualizado',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now, verbose_name='Última Modificación'),
+            preserve_default=False,
+        ),
+    ]
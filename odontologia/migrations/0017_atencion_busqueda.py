@@ -0,0 +1,172 @@
+from django.db import migrations
+
+
+# Índice de texto para odontologia/busqueda.py. Se mantiene con triggers (no con señales)
+# para que también cubra bulk_create (importar_atenciones, sembrar_datos) y las
+# actualizaciones masivas. El RUT se indexa sin puntos ni guion ('12345678k').
+# Todas las sentencias se pueden repetir: en SQLite, una migración posterior que
+# reconstruya odontologia_atencion (AlterField) borra sus triggers y debe volver a
+# ejecutar crear_indice_texto.
+
+# --- PostgreSQL: columna tsvector + índice GIN; configuración spanish sin acentos ---
+POSTGRES_CREAR = [
+    'CREATE EXTENSION IF NOT EXISTS unaccent',
+    """
+    DO $$ BEGIN
+        IF NOT EXISTS (SELECT 1 FROM pg_ts_config WHERE cfgname = 'odontologia_es') THEN
+            CREATE TEXT SEARCH CONFIGURATION odontologia_es (COPY = spanish);
+            ALTER TEXT SEARCH CONFIGURATION odontologia_es
+                ALTER MAPPING FOR hword, hword_part, word WITH unaccent, spanish_stem;
+        END IF;
+    END $$
+    """,
+    'ALTER TABLE odontologia_atencion ADD COLUMN IF NOT EXISTS busqueda tsvector',
+    """
+    CREATE OR REPLACE FUNCTION odontologia_atencion_documento(
+        p_id bigint, p_nombre text, p_apellido text, p_rut text, p_motivo text
+    ) RETURNS tsvector LANGUAGE sql STABLE AS $$
+        SELECT setweight(to_tsvector('odontologia_es', coalesce(p_nombre, '') || ' ' || coalesce(p_apellido, '')), 'A')
+            || setweight(to_tsvector('simple', lower(regexp_replace(coalesce(p_rut, ''), '[^0-9Kk]', '', 'g'))), 'A')
+            || setweight(to_tsvector('odontologia_es', coalesce(p_motivo, '')), 'B')
+            || setweight(to_tsvector('odontologia_es', coalesce(
+                (SELECT string_agg(descripcion, ' ') FROM odontologia_detalleatencion WHERE atencion_id = p_id), ''
+            )), 'C')
+    $$
+    """,
+    """
+    CREATE OR REPLACE FUNCTION odontologia_atencion_busqueda() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        NEW.busqueda := odontologia_atencion_documento(NEW.id, NEW.paciente_nombre, NEW.paciente_apellido, NEW.paciente_rut, NEW.motivo_visita);
+        RETURN NEW;
+    END $$
+    """,
+    """
+    CREATE OR REPLACE FUNCTION odontologia_detalle_busqueda() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        IF TG_OP <> 'INSERT' THEN
+            UPDATE odontologia_atencion SET busqueda = odontologia_atencion_documento(id, paciente_nombre, paciente_apellido, paciente_rut, motivo_visita)
+            WHERE id = OLD.atencion_id;
+        END IF;
+        IF TG_OP <> 'DELETE' THEN
+            UPDATE odontologia_atencion SET busqueda = odontologia_atencion_documento(id, paciente_nombre, paciente_apellido, paciente_rut, motivo_visita)
+            WHERE id = NEW.atencion_id;
+        END IF;
+        RETURN NULL;
+    END $$
+    """,
+    'DROP TRIGGER IF EXISTS atencion_busqueda_trg ON odontologia_atencion',
+    """
+    CREATE TRIGGER atencion_busqueda_trg
+        BEFORE INSERT OR UPDATE OF paciente_nombre, paciente_apellido, paciente_rut, motivo_visita ON odontologia_atencion
+        FOR EACH ROW EXECUTE FUNCTION odontologia_atencion_busqueda()
+    """,
+    'DROP TRIGGER IF EXISTS detalle_busqueda_trg ON odontologia_detalleatencion',
+    """
+    CREATE TRIGGER detalle_busqueda_trg
+        AFTER INSERT OR DELETE OR UPDATE OF descripcion, atencion_id ON odontologia_detalleatencion
+        FOR EACH ROW EXECUTE FUNCTION odontologia_detalle_busqueda()
+    """,
+    # Atenciones existentes
+    """
+    UPDATE odontologia_atencion
+    SET busqueda = odontologia_atencion_documento(id, paciente_nombre, paciente_apellido, paciente_rut, motivo_visita)
+    """,
+    'CREATE INDEX IF NOT EXISTS atencion_busqueda_idx ON odontologia_atencion USING gin (busqueda)',
+]
+POSTGRES_BORRAR = [
+    'DROP TRIGGER IF EXISTS detalle_busqueda_trg ON odontologia_detalleatencion',
+    'DROP TRIGGER IF EXISTS atencion_busqueda_trg ON odontologia_atencion',
+    'DROP FUNCTION IF EXISTS odontologia_detalle_busqueda()',
+    'DROP FUNCTION IF EXISTS odontologia_atencion_busqueda()',
+    'DROP FUNCTION IF EXISTS odontologia_atencion_documento(bigint, text, text, text, text)',
+    'DROP INDEX IF EXISTS atencion_busqueda_idx',
+    'ALTER TABLE odontologia_atencion DROP COLUMN IF EXISTS busqueda',
+    'DROP TEXT SEARCH CONFIGURATION IF EXISTS odontologia_es',
+]
+
+# --- SQLite (desarrollo): tabla FTS5 con rowid = id de la atención ---
+SQLITE_NOMBRE = "NEW.paciente_nombre || ' ' || NEW.paciente_apellido"
+SQLITE_RUT = "replace(replace(replace(upper(NEW.paciente_rut), '.', ''), '-', ''), ' ', '')"
+SQLITE_DETALLES = "(SELECT group_concat(descripcion, ' ') FROM odontologia_detalleatencion WHERE atencion_id = {id})"
+
+SQLITE_CREAR = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS odontologia_atencion_fts
+    USING fts5(nombre, rut, motivo, detalles, tokenize = 'unicode61 remove_diacritics 2')
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS atencion_fts_ai AFTER INSERT ON odontologia_atencion BEGIN
+        INSERT INTO odontologia_atencion_fts (rowid, nombre, rut, motivo, detalles)
+        VALUES (NEW.id, {SQLITE_NOMBRE}, {SQLITE_RUT}, NEW.motivo_visita, {SQLITE_DETALLES.format(id='NEW.id')});
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS atencion_fts_au
+    AFTER UPDATE OF paciente_nombre, paciente_apellido, paciente_rut, motivo_visita ON odontologia_atencion BEGIN
+        UPDATE odontologia_atencion_fts SET nombre = {SQLITE_NOMBRE}, rut = {SQLITE_RUT}, motivo = NEW.motivo_visita
+        WHERE rowid = NEW.id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS atencion_fts_ad AFTER DELETE ON odontologia_atencion BEGIN
+        DELETE FROM odontologia_atencion_fts WHERE rowid = OLD.id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS detalle_fts_ai AFTER INSERT ON odontologia_detalleatencion BEGIN
+        UPDATE odontologia_atencion_fts SET detalles = {SQLITE_DETALLES.format(id='NEW.atencion_id')} WHERE rowid = NEW.atencion_id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS detalle_fts_au AFTER UPDATE OF descripcion, atencion_id ON odontologia_detalleatencion BEGIN
+        UPDATE odontologia_atencion_fts SET detalles = {SQLITE_DETALLES.format(id='OLD.atencion_id')} WHERE rowid = OLD.atencion_id;
+        UPDATE odontologia_atencion_fts SET detalles = {SQLITE_DETALLES.format(id='NEW.atencion_id')} WHERE rowid = NEW.atencion_id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS detalle_fts_ad AFTER DELETE ON odontologia_detalleatencion BEGIN
+        UPDATE odontologia_atencion_fts SET detalles = {SQLITE_DETALLES.format(id='OLD.atencion_id')} WHERE rowid = OLD.atencion_id;
+    END
+    """,
+    # Atenciones existentes
+    'DELETE FROM odontologia_atencion_fts',
+    f"""
+    INSERT INTO odontologia_atencion_fts (rowid, nombre, rut, motivo, detalles)
+    SELECT NEW.id, {SQLITE_NOMBRE}, {SQLITE_RUT}, NEW.motivo_visita, {SQLITE_DETALLES.format(id='NEW.id')}
+    FROM odontologia_atencion AS NEW
+    """,
+]
+SQLITE_BORRAR = [
+    *(f'DROP TRIGGER IF EXISTS {nombre}' for nombre in (
+        'atencion_fts_ai', 'atencion_fts_au', 'atencion_fts_ad', 'detalle_fts_ai', 'detalle_fts_au', 'detalle_fts_ad',
+    )),
+    'DROP TABLE IF EXISTS odontologia_atencion_fts',
+]
+
+SENTENCIAS = {
+    'postgresql': (POSTGRES_CREAR, POSTGRES_BORRAR),
+    'sqlite': (SQLITE_CREAR, SQLITE_BORRAR),
+}
+
+
+def crear_indice_texto(apps, schema_editor):
+    crear, _ = SENTENCIAS.get(schema_editor.connection.vendor, ((), ()))
+    for sentencia in crear:
+        schema_editor.execute(sentencia)
+
+
+def borrar_indice_texto(apps, schema_editor):
+    _, borrar = SENTENCIAS.get(schema_editor.connection.vendor, ((), ()))
+    for sentencia in borrar:
+        schema_editor.execute(sentencia)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('odontologia', '0016_atencion_actualizado'),
+    ]
+
+    operations = [
+        migrations.RunPython(crear_indice_texto, borrar_indice_texto),
+    ]
@@ -0,0 +1,41 @@
+from django.db import migrations
+
+
+# Índices para buscar fichas por prefijo (odontologia/autocompletar.py).
+# En PostgreSQL Django traduce `nombre__istartswith` a UPPER("nombre"::text) LIKE UPPER('...%'),
+# así que el índice usa esa expresión con text_pattern_ops (LIKE con prefijo no usa un
+# índice normal fuera de la collation C). `rut__startswith` ya lo cubre el índice
+# odontologia_paciente_rut_..._like que Django crea junto al unique.
+# En SQLite LIKE no distingue mayúsculas y solo usa índices COLLATE NOCASE.
+INDICES = {
+    'postgresql': [
+        ('paciente_nombre_prefijo_idx', '(UPPER("nombre"::text) text_pattern_ops)'),
+        ('paciente_apellido_prefijo_idx', '(UPPER("apellido"::text) text_pattern_ops)'),
+    ],
+    'sqlite': [
+        ('paciente_rut_prefijo_idx', '("rut" COLLATE NOCASE)'),
+        ('paciente_nombre_prefijo_idx', '("nombre" COLLATE NOCASE)'),
+        ('paciente_apellido_prefijo_idx', '("apellido" COLLATE NOCASE)'),
+    ],
+}
+
+
+def crear_indices(apps, schema_editor):
+    for nombre, columnas in INDICES.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(f'CREATE INDEX IF NOT EXISTS {nombre} ON odontologia_paciente {columnas}')
+
+
+def borrar_indices(apps, schema_editor):
+    for nombre, _ in INDICES.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(f'DROP INDEX IF EXISTS {nombre}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('odontologia', '0017_atencion_busqueda'),
+    ]
+
+    operations = [
+        migrations.RunPython(crear_indices, borrar_indices),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.7 on 2026-10-17 22:06
+
+import importlib
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+# En SQLite AddField NOT NULL reconstruye odontologia_atencion y con ella se pierden los
+# triggers del índice de texto (0017): se vuelven a crear (las sentencias son repetibles).
+def recrear_indice_texto(apps, schema_editor):
+    importlib.import_module('odontologia.migrations.0017_atencion_busqueda').crear_indice_texto(apps, schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('odontologia', '0018_paciente_indices_prefijo'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='atencion',
+            name='duracion',
+            field=models.PositiveSmallIntegerField(default=30, editable=False, verbose_name='Duración (min)'),
+        ),
+        migrations.AddField(
+            model_name='detalleatencion',
+            name='tratamiento',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='detalles', to='odontologia.tratamiento', verbose_name='Tratamiento del Catálogo'),
+        ),
+        migrations.RunPython(recrear_indice_texto, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,159 @@
+# Generated by Django 5.2.7 on 2026-10-17 22:11
+
+import importlib
+from collections import defaultdict
+from django.db import migrations, models
+from django.db.models import Count
+from django.utils import timezone
+
+
+# 'atencion_doctor_sin_choques': un doctor no puede tener dos atenciones que se crucen
+# ([hora_atencion, hora_atencion + duracion), ver agenda.py). En PostgreSQL es una
+# restricción de exclusión (btree_gist para combinar doctor_id = con el && de los rangos);
+# en SQLite, triggers que abortan con el mismo nombre. AtencionForm.error_de_integridad
+# traduce ambas violaciones al error del formulario.
+# Antes no se impedían los choques, así que solo rige para las atenciones desde el día en
+# que se aplica la migración: las históricas pueden cruzarse y deben poder editarse.
+# revisar_conflictos detiene la migración, listándolas, si hay filas que las violarían.
+# Las sentencias se pueden repetir: en SQLite una migración que reconstruya la tabla
+# borra los triggers y debe volver a ejecutar crear_restriccion_choques.
+
+def _postgres(desde):
+    return [
+        'CREATE EXTENSION IF NOT EXISTS btree_gist',
+        'ALTER TABLE odontologia_atencion DROP CONSTRAINT IF EXISTS atencion_doctor_sin_choques',
+        f"""
+        ALTER TABLE odontologia_atencion ADD CONSTRAINT atencion_doctor_sin_choques EXCLUDE USING gist (
+            doctor_id WITH =,
+            tsrange(fecha + hora_atencion, fecha + hora_atencion + duracion * interval '1 minute') WITH &&
+        ) WHERE (fecha >= DATE '{desde.isoformat()}')
+        """,
+    ]
+
+def _minutos(tabla):
+    return (
+        f"(CAST(substr({tabla}.hora_atencion, 1, 2) AS INTEGER) * 60 "
+        f"+ CAST(substr({tabla}.hora_atencion, 4, 2) AS INTEGER))"
+    )
+
+def _sqlite(desde):
+    choque = (
+        f"NEW.fecha >= '{desde.isoformat()}' AND EXISTS (SELECT 1 FROM odontologia_atencion AS otra "
+        f"WHERE otra.doctor_id = NEW.doctor_id AND otra.fecha = NEW.fecha {{excluir}}"
+        f"AND {_minutos('otra')} < {_minutos('NEW')} + NEW.duracion "
+        f"AND {_minutos('NEW')} < {_minutos('otra')} + otra.duracion)"
+    )
+    return [
+        f"""
+        CREATE TRIGGER IF NOT EXISTS atencion_sin_choques_bi BEFORE INSERT ON odontologia_atencion
+        WHEN {choque.format(excluir='')} BEGIN
+            SELECT RAISE(ABORT, 'atencion_doctor_sin_choques');
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS atencion_sin_choques_bu
+        BEFORE UPDATE OF doctor_id, fecha, hora_atencion, duracion ON odontologia_atencion
+        WHEN {choque.format(excluir='AND otra.id <> NEW.id ')} BEGIN
+            SELECT RAISE(ABORT, 'atencion_doctor_sin_choques');
+        END
+        """,
+    ]
+
+CREAR = {'postgresql': _postgres, 'sqlite': _sqlite}
+BORRAR = {
+    'postgresql': ['ALTER TABLE odontologia_atencion DROP CONSTRAINT IF EXISTS atencion_doctor_sin_choques'],
+    'sqlite': ['DROP TRIGGER IF EXISTS atencion_sin_choques_bi', 'DROP TRIGGER IF EXISTS atencion_sin_choques_bu'],
+}
+
+
+MAX_LISTADAS = 50
+
+
+def _inicio(atencion):
+    return atencion.hora_atencion.hour * 60 + atencion.hora_atencion.minute
+
+
+def revisar_conflictos(apps, schema_editor):
+    """
+    Antes de crear las restricciones: lista las atenciones que las violarían (mismo paciente
+    a la misma hora, o un doctor con atenciones cruzadas desde hoy) y detiene la migración
+    para corregirlas a mano, en vez de fallar a mitad del despliegue con un IntegrityError.
+    """
+    Atencion = apps.get_model('odontologia', 'Atencion')
+    conflictos = []
+
+    repetidas = (
+        Atencion.objects.values('paciente_rut', 'fecha', 'hora_atencion')
+        .annotate(n=Count('id')).filter(n__gt=1).order_by('fecha', 'hora_atencion')
+    )
+    for fila in repetidas:
+        ids = Atencion.objects.filter(
+            paciente_rut=fila['paciente_rut'], fecha=fila['fecha'], hora_atencion=fila['hora_atencion'],
+        ).order_by('id').values_list('id', flat=True)
+        conflictos.append(
+            f"RUT {fila['paciente_rut']} el {fila['fecha']} a las {fila['hora_atencion']:%H:%M}: "
+            f"atenciones {', '.join(map(str, ids))}"
+        )
+
+    por_dia = defaultdict(list)
+    futuras = Atencion.objects.filter(fecha__gte=timezone.localdate()).only('doctor_id', 'fecha', 'hora_atencion', 'duracion')
+    for atencion in futuras.order_by('doctor_id', 'fecha', 'hora_atencion', 'id'):
+        por_dia[atencion.doctor_id, atencion.fecha].append(atencion)
+    for (doctor_id, fecha), atenciones in por_dia.items():
+        previa = None
+        for atencion in atenciones:
+            if previa and _inicio(atencion) < _inicio(previa) + previa.duracion:
+                conflictos.append(
+                    f"Doctor {doctor_id} el {fecha}: la atención {atencion.pk} ({atencion.hora_atencion:%H:%M}) "
+                    f"se cruza con la {previa.pk} ({previa.hora_atencion:%H:%M}, {previa.duracion} min)"
+                )
+            if not previa or _inicio(atencion) + atencion.duracion > _inicio(previa) + previa.duracion:
+                previa = atencion
+
+    if conflictos:
+        listado = '\n'.join(f'  - {c}' for c in conflictos[:MAX_LISTADAS])
+        resto = len(conflictos) - MAX_LISTADAS
+        if resto > 0:
+            listado += f'\n  ... y {resto} más'
+        raise RuntimeError(
+            f"Hay {len(conflictos)} atenciones que violan las nuevas restricciones de horario. "
+            f"Corríjalas (cambiando la hora o eliminando el duplicado) y vuelva a migrar:\n{listado}"
+        )
+
+
+def crear_restriccion_choques(apps, schema_editor):
+    crear = CREAR.get(schema_editor.connection.vendor)
+    for sentencia in crear(timezone.localdate()) if crear else []:
+        schema_editor.execute(sentencia)
+
+
+def borrar_restriccion_choques(apps, schema_editor):
+    for sentencia in BORRAR.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(sentencia)
+
+
+# En SQLite AddConstraint reconstruye odontologia_atencion: se pierden los triggers de 0017
+def recrear_indice_texto(apps, schema_editor):
+    importlib.import_module('odontologia.migrations.0017_atencion_busqueda').crear_indice_texto(apps, schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('odontologia', '0019_atencion_duracion'),
+    ]
+
+    operations = [
+        migrations.RunPython(revisar_conflictos, migrations.RunPython.noop),
+        # El índice de la restricción reemplaza a atencion_rut_fecha_hora_idx (mismas columnas)
+        migrations.AddConstraint(
+            model_name='atencion',
+            constraint=models.UniqueConstraint(fields=('paciente_rut', 'fecha', 'hora_atencion'), name='atencion_paciente_horario_uniq'),
+        ),
+        migrations.RemoveIndex(
+            model_name='atencion',
+            name='atencion_rut_fecha_hora_idx',
+        ),
+        migrations.RunPython(recrear_indice_texto, migrations.RunPython.noop),
+        migrations.RunPython(crear_restriccion_choques, borrar_restriccion_choques),
+    ]
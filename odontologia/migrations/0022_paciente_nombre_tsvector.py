@@ -0,0 +1,41 @@
+from django.db import migrations
+
+
+# Búsqueda de fichas por palabras del nombre (odontologia/autocompletar.py). En PostgreSQL
+# cada palabra se busca como prefijo (`palabra:*`) en un tsvector 'simple' (sin raíces ni
+# palabras vacías) de nombre y apellido, con un índice GIN sobre la misma expresión.
+# Reemplaza a los índices UPPER(...) text_pattern_ops de la 0018, que solo servían para
+# el comienzo del nombre: las palabras siguientes ('maria jo' -> 'María José') quedaban en
+# un LIKE '% jo%' que recorre la tabla. En SQLite siguen los índices COLLATE NOCASE.
+DOCUMENTO = """to_tsvector('simple', "nombre" || ' ' || "apellido")"""
+PREFIJO_0018 = [
+    ('paciente_nombre_prefijo_idx', '(UPPER("nombre"::text) text_pattern_ops)'),
+    ('paciente_apellido_prefijo_idx', '(UPPER("apellido"::text) text_pattern_ops)'),
+]
+
+
+def crear_indice(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(f'CREATE INDEX IF NOT EXISTS paciente_nombre_tsv_idx ON odontologia_paciente USING gin (({DOCUMENTO}))')
+    for nombre, _ in PREFIJO_0018:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {nombre}')
+
+
+def borrar_indice(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for nombre, columnas in PREFIJO_0018:
+        schema_editor.execute(f'CREATE INDEX IF NOT EXISTS {nombre} ON odontologia_paciente {columnas}')
+    schema_editor.execute('DROP INDEX IF EXISTS paciente_nombre_tsv_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('odontologia', '0021_versiondatos'),
+    ]
+
+    operations = [
+        migrations.RunPython(crear_indice, borrar_indice),
+    ]
@@ -0,0 +1,33 @@
+from django.db import migrations
+
+
+# El índice trigram de la 0010 servía a `paciente_rut__icontains` (el buscador por RUT).
+# Desde la 0017 el buscador usa la columna tsvector `busqueda` (el RUT se indexa sin
+# puntos ni guion), así que ninguna consulta lo usa y solo encarecía cada escritura.
+# La extensión pg_trgm queda instalada: borrarla afectaría a otras bases del servidor.
+CREAR_INDICE_TRIGRAM = (
+    'CREATE INDEX IF NOT EXISTS atencion_rut_trgm_idx ON odontologia_atencion '
+    'USING gin ((UPPER("paciente_rut"::text)) gin_trgm_ops)'
+)
+
+
+def borrar_indice_trigram(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS atencion_rut_trgm_idx')
+
+
+def crear_indice_trigram(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        schema_editor.execute(CREAR_INDICE_TRIGRAM)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('odontologia', '0022_paciente_nombre_tsvector'),
+    ]
+
+    operations = [
+        migrations.RunPython(borrar_indice_trigram, crear_indice_trigram),
+    ]
@@ -0,0 +1,59 @@
+from decimal import Decimal
+from django.db import migrations
+from django.db.models import Sum
+
+
+def reconciliar_boletas(apps, schema_editor):
+    # Carga única de los totales materializados (equivale a `manage.py reconciliar_boletas`):
+    # crea las boletas faltantes y corrige las que no coinciden con sus detalles. Antes se
+    # ejecutaba en cada despliegue; desde aquí las señales las mantienen y el comando queda
+    # para correcciones manuales.
+    Atencion = apps.get_model('odontologia', 'Atencion')
+    Boleta = apps.get_model('odontologia', 'Boleta')
+    DetalleAtencion = apps.get_model('odontologia', 'DetalleAtencion')
+    ExamenAtencion = apps.get_model('odontologia', 'ExamenAtencion')
+    ultimo_id = 0
+    while True:
+        ids = list(Atencion.objects.filter(pk__gt=ultimo_id).order_by('pk').values_list('pk', flat=True)[:1000])
+        if not ids:
+            break
+        ultimo_id = ids[-1]
+        tratamientos = dict(
+            DetalleAtencion.objects.filter(atencion_id__in=ids)
+            .values('atencion_id').annotate(total=Sum('valor')).values_list('atencion_id', 'total')
+        )
+        examenes = dict(
+            ExamenAtencion.objects.filter(atencion_id__in=ids)
+            .values('atencion_id').annotate(total=Sum('costo_total')).values_list('atencion_id', 'total')
+        )
+        actuales = {
+            atencion_id: (total_tratamientos, total_examenes, ganancia)
+            for atencion_id, total_tratamientos, total_examenes, ganancia in Boleta.objects.filter(atencion_id__in=ids).values_list(
+                'atencion_id', 'total_tratamientos', 'total_examenes', 'ganancia_neta_doctor'
+            )
+        }
+        boletas = []
+        for atencion_id in ids:
+            total_tratamientos = tratamientos.get(atencion_id) or Decimal('0.00')
+            total_examenes = examenes.get(atencion_id) or Decimal('0.00')
+            ganancia = (total_tratamientos * Decimal('0.5')).quantize(Decimal('0.01'))
+            if actuales.get(atencion_id) != (total_tratamientos, total_examenes, ganancia):
+                boletas.append(Boleta(
+                    atencion_id=atencion_id, total_tratamientos=total_tratamientos,
+                    total_examenes=total_examenes, ganancia_neta_doctor=ganancia,
+                ))
+        Boleta.objects.bulk_create(
+            boletas, update_conflicts=True, unique_fields=['atencion'],
+            update_fields=['total_tratamientos', 'total_examenes', 'ganancia_neta_doctor'],
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('odontologia', '0023_borrar_indice_trigram'),
+    ]
+
+    operations = [
+        migrations.RunPython(reconciliar_boletas, migrations.RunPython.noop),
+    ]
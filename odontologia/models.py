@@ -5,6 +5,9 @@ from django.core.validators import MinValueValidator, MaxLengthValidator
 from django.utils import timezone
 import datetime # Necesario para la validación de fecha y hora
 import decimal # Para el default de DecimalField
+from django.core.files.storage import default_storage
+from . import rut as rut_utils
+from .fotos import ruta_miniatura
 
 # --- Modelos Principales ---
 class Doctor(models.Model):
@@ -12,19 +15,70 @@ class Doctor(models.Model):
     rut = models.CharField(max_length=15, unique=True, verbose_name="RUT")
     foto_perfil = models.ImageField(upload_to='fotos_perfil/', blank=True, null=True, verbose_name="Foto de Perfil")
     fecha_nacimiento = models.DateField(null=True, blank=True, verbose_name="Fecha de Nacimiento")
+    foto_version = models.PositiveIntegerField(default=0, editable=False, verbose_name="Versión de la Foto") # Sube con cada foto procesada (ver fotos.py)
     class Meta: verbose_name = "Doctor"; verbose_name_plural = "Doctores"
     def __str__(self): return f"{self.user.first_name} {self.user.last_name}"
 
-class Paciente(models.Model): # Mantenemos por si acaso
-    nombre = models.CharField(max_length=100, verbose_name="Nombre Completo")
+    def _url_miniatura(self, extension):
+        if not self.foto_perfil or not self.foto_version:
+            return None
+        return default_storage.url(ruta_miniatura(self.pk, self.foto_version, extension))
+
+    @property
+    def miniatura_url(self):
+        """Miniatura JPEG de la foto (o el original si aún no se procesó); None sin foto."""
+        if self.foto_perfil and not self.foto_version:
+            return self.foto_perfil.url
+        return self._url_miniatura('jpg')
+
+    @property
+    def miniatura_webp_url(self):
+        return self._url_miniatura('webp')
+
+class Paciente(models.Model): # Ficha maestra: una por RUT, las atenciones la referencian
+    SEXO_CHOICES = [('M', 'Masculino'), ('F', 'Femenino'), ('O', 'Otro')]
+
+    nombre = models.CharField(max_length=100, verbose_name="Nombre")
+    apellido = models.CharField(max_length=50, verbose_name="Apellido", default='', blank=True)
     rut = models.CharField(max_length=15, unique=True, verbose_name="RUT")
+    sexo = models.CharField(max_length=1, choices=SEXO_CHOICES, verbose_name="Sexo", default='O')
+    email = models.EmailField(verbose_name="Email", blank=True, null=True)
+    celular = models.CharField(max_length=15, verbose_name="Celular", blank=True, null=True)
     class Meta: verbose_name = "Paciente"; verbose_name_plural = "Pacientes"
-    def __str__(self): return self.nombre
+    def __str__(self): return f"{self.nombre} {self.apellido}".strip()
+
+    @staticmethod
+    def normalizar_rut(rut):
+        """'12.345.678-k ' -> '12345678-K' (mismo formato que guarda AtencionForm)."""
+        return rut_utils.normalizar(rut)
+
+    @classmethod
+    def desde_atencion(cls, atencion):
+        """Obtiene (o crea) la ficha del RUT de la atención y actualiza sus datos de contacto."""
+        paciente, creado = cls.objects.get_or_create(
+            rut=cls.normalizar_rut(atencion.paciente_rut),
+            defaults={
+                'nombre': atencion.paciente_nombre, 'apellido': atencion.paciente_apellido,
+                'sexo': atencion.paciente_sexo, 'email': atencion.paciente_email, 'celular': atencion.paciente_celular,
+            },
+        )
+        if not creado:
+            cambios = {
+                campo: valor for campo, valor in (
+                    ('sexo', atencion.paciente_sexo), ('email', atencion.paciente_email), ('celular', atencion.paciente_celular),
+                ) if valor and getattr(paciente, campo) != valor
+            }
+            if cambios:
+                for campo, valor in cambios.items(): setattr(paciente, campo, valor)
+                paciente.save(update_fields=list(cambios))
+        return paciente
+
+DURACION_POR_DEFECTO = 30 # minutos, para atenciones sin tratamientos del catálogo (ver agenda.py)
 
 class Tratamiento(models.Model): # Catálogo general
     nombre = models.CharField(max_length=50, verbose_name="Nombre del Tratamiento")
     costo_base = models.DecimalField(max_digits=10, decimal_places=2, validators=[MinValueValidator(0)], verbose_name="Costo Base", default=0)
-    duracion_aproximada = models.PositiveIntegerField(default=30, help_text="Duración en minutos", verbose_name="Duración Aproximada (min)")
+    duracion_aproximada = models.PositiveIntegerField(default=DURACION_POR_DEFECTO, help_text="Duración en minutos", verbose_name="Duración Aproximada (min)")
     class Meta: verbose_name = "Tratamiento"; verbose_name_plural = "Tratamientos"
     def __str__(self): return self.nombre
 
@@ -40,7 +94,9 @@ class Atencion(models.Model):
     METODOS_PAGO = [('EF', 'Efectivo'), ('TC', 'Tarjeta de Crédito'), ('TD', 'Tarjeta de Débito'), ('TR', 'Transferencia')]
     PACIENTE_SEXO_CHOICES = [('M', 'Masculino'), ('F', 'Femenino'), ('O', 'Otro')]
 
-    doctor = models.ForeignKey(Doctor, on_delete=models.PROTECT, verbose_name="Doctor")
+    # Sin índice propio: lo cubre el prefijo de 'atencion_doctor_fecha_idx'
+    doctor = models.ForeignKey(Doctor, on_delete=models.PROTECT, verbose_name="Doctor", db_index=False)
+    paciente = models.ForeignKey(Paciente, on_delete=models.PROTECT, related_name='atenciones', verbose_name="Paciente", null=True, blank=True, editable=False)
     fecha = models.DateField(verbose_name="Fecha de Atención", default=datetime.date.today)
     hora_atencion = models.TimeField(verbose_name="Hora de Atención", default=datetime.time(9, 0))
     motivo_visita = models.CharField(max_length=200, verbose_name="Motivo de la Visita", default='')
@@ -52,13 +108,49 @@ class Atencion(models.Model):
     paciente_sexo = models.CharField(max_length=1, choices=PACIENTE_SEXO_CHOICES, verbose_name="Sexo del Paciente", default='O')
     paciente_email = models.EmailField(verbose_name="Email del Paciente", blank=True, null=True) # Lo hacemos opcional de nuevo para que coincida con el form
     paciente_celular = models.CharField(max_length=15, verbose_name="Celular del Paciente", blank=True, null=True)
+    # Sube con cada guardado y cuando cambian sus detalles o exámenes (ver boletas.marcar_para_recalculo);
+    # es el validador de las respuestas condicionales (ETag / Last-Modified, ver condicional.py)
+    actualizado = models.DateTimeField(auto_now=True, verbose_name="Última Modificación")
+    # Minutos que ocupa en la agenda del doctor: suma de la duración de los tratamientos del
+    # catálogo elegidos en sus detalles, o DURACION_POR_DEFECTO (ver agenda.py)
+    duracion = models.PositiveSmallIntegerField(default=DURACION_POR_DEFECTO, editable=False, verbose_name="Duración (min)")
 
     class Meta:
         verbose_name = "Atención"
         verbose_name_plural = "Atenciones"
+        indexes = [
+            # Listados por doctor ordenados por fecha/hora (dashboard, listas, Excel, paginación por cursor)
+            models.Index(fields=['doctor', '-fecha', '-hora_atencion', '-id'], name='atencion_doctor_fecha_idx'),
+            # Listado global del admin y rango de fechas del calendario
+            models.Index(fields=['-fecha', '-hora_atencion', '-id'], name='atencion_fecha_idx'),
+            # La búsqueda de texto usa la columna tsvector `busqueda` (PostgreSQL) o la tabla FTS5
+            # (SQLite), con sus propios índices (migración 0017; ver busqueda.py).
+        ]
+        constraints = [
+            # Un paciente no puede tener dos horas iguales (su índice sirve también para buscar por RUT).
+            # Los choques de horario de un doctor los impide 'atencion_doctor_sin_choques' (migración 0020).
+            models.UniqueConstraint(fields=['paciente_rut', 'fecha', 'hora_atencion'], name='atencion_paciente_horario_uniq'),
+        ]
     def __str__(self):
         return f"Atención de {self.doctor} a {self.paciente_nombre} {self.paciente_apellido} el {self.fecha}"
 
+    # En False full_clean() no revisa 'atencion_paciente_horario_uniq' con una consulta antes
+    # de guardar: queda a cargo de la base. Lo usa AtencionForm, que traduce el IntegrityError
+    revisar_horario_paciente = True
+
+    def validate_constraints(self, exclude=None):
+        if not self.revisar_horario_paciente:
+            exclude = {*(exclude or ()), 'paciente_rut'} # la única restricción con paciente_rut
+        super().validate_constraints(exclude=exclude)
+
+    def save(self, *args, **kwargs):
+        # Vincula la ficha maestra del paciente (AtencionForm.clean ya la deja cargada si existe)
+        if self.paciente_rut:
+            vinculado = Atencion.paciente.is_cached(self) and self.paciente is not None
+            if not (vinculado and self.paciente.rut == self.paciente_rut):
+                self.paciente = Paciente.desde_atencion(self)
+        super().save(*args, **kwargs)
+
 class DetalleAtencion(models.Model):
     ESPECIALIDADES = [
         ('OPER', 'Operatoria'), ('ENDO', 'Endodoncia'), ('ORTO', 'Ortodoncia'),
@@ -66,6 +158,7 @@ class DetalleAtencion(models.Model):
         ('HIGI', 'Higiene Oral'), ('OTRO', 'Otro'),
     ]
     atencion = models.ForeignKey(Atencion, related_name='detalles', on_delete=models.CASCADE, verbose_name="Atención")
+    tratamiento = models.ForeignKey(Tratamiento, on_delete=models.SET_NULL, null=True, blank=True, related_name='detalles', verbose_name="Tratamiento del Catálogo")
     especialidad = models.CharField(max_length=5, choices=ESPECIALIDADES, verbose_name="Especialidad", default='OTRO')
     descripcion = models.TextField(max_length=1000, validators=[MaxLengthValidator(1000)], verbose_name="Descripción del Tratamiento", default='')
     valor = models.DecimalField(max_digits=10, decimal_places=2, validators=[MinValueValidator(0)], verbose_name="Valor", default=decimal.Decimal('0.00'))
@@ -90,6 +183,9 @@ class ExamenAtencion(models.Model):
         return f"{self.cantidad}x {self.descripcion} para {self.atencion}"
 # ----------------------------------------------------
 
+# Porcentaje de lo cobrado que corresponde al doctor
+PORCENTAJE_DOCTOR = decimal.Decimal('0.5')
+
 class Boleta(models.Model):
     atencion = models.OneToOneField(Atencion, on_delete=models.CASCADE, verbose_name="Atención Asociada")
     total_tratamientos = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name="Total Tratamientos")
@@ -99,4 +195,66 @@ class Boleta(models.Model):
     ganancia_neta_doctor = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name="Ganancia Neta Doctor")
     fecha_emision = models.DateTimeField(auto_now_add=True, verbose_name="Fecha de Emisión")
     class Meta: verbose_name = "Boleta"; verbose_name_plural = "Boletas"
-    def __str__(self): return f"Boleta para la atención del {self.atencion.fecha} (ID: {self.id})"
\ No newline at end of file
+    def __str__(self): return f"Boleta para la atención del {self.atencion.fecha} (ID: {self.id})"
+
+# --- Resúmenes (tablas derivadas, se mantienen solas; ver resumenes.py) ---
+
+class ResumenMensualDoctor(models.Model):
+    doctor = models.ForeignKey(Doctor, on_delete=models.CASCADE, related_name='resumenes_mensuales', verbose_name="Doctor")
+    anio = models.PositiveSmallIntegerField(verbose_name="Año")
+    mes = models.PositiveSmallIntegerField(verbose_name="Mes")
+    especialidad = models.CharField(max_length=5, choices=DetalleAtencion.ESPECIALIDADES, verbose_name="Especialidad")
+    cantidad_atenciones = models.PositiveIntegerField(default=0, verbose_name="Atenciones")
+    cantidad_tratamientos = models.PositiveIntegerField(default=0, verbose_name="Tratamientos")
+    total_facturado = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name="Total Facturado")
+    ganancia_doctor = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name="Ganancia Doctor")
+
+    class Meta:
+        verbose_name = "Resumen Mensual"
+        verbose_name_plural = "Resúmenes Mensuales"
+        constraints = [
+            models.UniqueConstraint(fields=['doctor', 'anio', 'mes', 'especialidad'], name='resumen_doctor_periodo_uniq'),
+        ]
+    def __str__(self):
+        return f"{self.doctor} {self.mes:02d}/{self.anio} - {self.get_especialidad_display()}"
+
+# --- Cola de reportes (se procesan fuera de la petición; ver trabajos.py) ---
+
+class TrabajoReporte(models.Model):
+    TIPOS = [('EXCEL_DOCTOR', 'Reporte Financiero por Doctor'), ('NOMINA', 'Nómina Consolidada de Doctores')]
+    ESTADOS = [('PENDIENTE', 'Pendiente'), ('PROCESANDO', 'Procesando'), ('LISTO', 'Listo'), ('ERROR', 'Error')]
+
+    tipo = models.CharField(max_length=20, choices=TIPOS, verbose_name="Tipo")
+    parametros = models.JSONField(default=dict, blank=True, verbose_name="Parámetros")
+    estado = models.CharField(max_length=10, choices=ESTADOS, default='PENDIENTE', verbose_name="Estado")
+    solicitado_por = models.ForeignKey(User, on_delete=models.CASCADE, related_name='trabajos_reporte', verbose_name="Solicitado por")
+    creado = models.DateTimeField(auto_now_add=True, verbose_name="Solicitado")
+    iniciado = models.DateTimeField(null=True, blank=True, verbose_name="Iniciado")
+    terminado = models.DateTimeField(null=True, blank=True, verbose_name="Terminado")
+    intentos = models.PositiveSmallIntegerField(default=0, verbose_name="Intentos")
+    error = models.TextField(blank=True, default='', verbose_name="Error")
+    archivo = models.FileField(upload_to='reportes/%Y/%m/', blank=True, verbose_name="Archivo")
+    nombre_archivo = models.CharField(max_length=150, blank=True, default='', verbose_name="Nombre de descarga")
+
+    class Meta:
+        verbose_name = "Trabajo de Reporte"
+        verbose_name_plural = "Trabajos de Reporte"
+        indexes = [
+            # El worker busca el pendiente más antiguo
+            models.Index(fields=['estado', 'creado'], name='trabajo_estado_creado_idx'),
+        ]
+    def __str__(self):
+        return f"{self.get_tipo_display()} #{self.pk} ({self.get_estado_display()})"
+
+
+# --- Versión de los datos de cada doctor (compartida por todos los procesos; ver versiones.py) ---
+
+class VersionDatos(models.Model):
+    clave = models.CharField(max_length=20, primary_key=True, verbose_name="Clave") # id del doctor, 'global' o 'perfil.<id del usuario>'
+    version = models.BigIntegerField(default=0, verbose_name="Versión")
+
+    class Meta:
+        verbose_name = "Versión de Datos"
+        verbose_name_plural = "Versiones de Datos"
+    def __str__(self):
+        return f"{self.clave}: {self.version}"
@@ -0,0 +1,113 @@
+# odontologia/nomina.py
+import datetime
+import io
+import os
+import re
+import tempfile
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal
+from itertools import groupby
+from operator import itemgetter
+from openpyxl import Workbook
+from .models import Atencion, Doctor
+from .reportes import atenciones_con_totales, escribir_hoja_doctor, escribir_hoja_resumen, excel_doctor_en_bytes, TAMANO_LOTE
+
+# --- Nómina consolidada de todos los doctores para un mes ---
+# Una sola consulta trae las atenciones del periodo de todos los doctores (con los
+# totales de la Boleta) y se reparte en memoria por doctor. Con formato 'zip' cada
+# Excel por doctor se genera en paralelo en un pool de procesos; con 'xlsx' todo
+# va a un solo libro (un xlsx se escribe como un único flujo, así que las hojas se
+# generan en orden, pero sin volver a consultar la base).
+
+FORMATOS = ['xlsx', 'zip']
+MAX_PROCESOS = 4
+_CARACTERES_INVALIDOS_HOJA = re.compile(r'[\[\]:*?/\\]')
+
+
+def rango_periodo(anio, mes):
+    inicio = datetime.date(anio, mes, 1)
+    return inicio, (inicio + datetime.timedelta(days=32)).replace(day=1)
+
+def _nombre_doctor(doctor):
+    return f"{doctor.user.last_name} {doctor.user.first_name}".strip() or doctor.rut
+
+def _nombres_unicos(doctores, largo):
+    """Nombre de hoja o de archivo por doctor: sin caracteres inválidos, recortado y sin repetir."""
+    nombres, usados = {}, {'resumen'}
+    for doctor in doctores:
+        base = _CARACTERES_INVALIDOS_HOJA.sub('', _nombre_doctor(doctor))[:largo].strip() or str(doctor.pk)
+        nombre, n = base, 2
+        while nombre.lower() in usados:
+            sufijo = f" ({n})"
+            nombre, n = base[:largo - len(sufijo)] + sufijo, n + 1
+        usados.add(nombre.lower())
+        nombres[doctor.pk] = nombre
+    return nombres
+
+def datos_nomina(anio, mes):
+    """
+    Devuelve (doctores, filas por doctor_id, filas del resumen) leyendo todas las
+    atenciones del mes en una consulta. Los doctores sin atenciones aparecen en cero.
+    """
+    inicio, fin = rango_periodo(anio, mes)
+    atenciones = Atencion.objects.filter(fecha__gte=inicio, fecha__lt=fin).order_by('doctor_id', '-fecha', '-hora_atencion', '-id')
+    filas = atenciones_con_totales(atenciones, por_doctor=True).iterator(chunk_size=TAMANO_LOTE)
+    por_doctor = {doctor_id: list(grupo) for doctor_id, grupo in groupby(filas, key=itemgetter(11))}
+
+    doctores = list(Doctor.objects.select_related('user').order_by('user__last_name', 'user__first_name'))
+    resumen = []
+    for doctor in doctores:
+        filas_doctor = por_doctor.get(doctor.pk, [])
+        resumen.append((
+            _nombre_doctor(doctor), doctor.rut, len(filas_doctor),
+            sum((f[6] for f in filas_doctor), Decimal('0.00')), sum((f[7] for f in filas_doctor), Decimal('0.00')),
+        ))
+    return doctores, por_doctor, resumen
+
+def _libro_resumen(resumen):
+    wb = Workbook(write_only=True)
+    escribir_hoja_resumen(wb.create_sheet("Resumen"), resumen)
+    destino = io.BytesIO()
+    wb.save(destino)
+    return destino.getvalue()
+
+def generar_nomina_xlsx(anio, mes, destino):
+    """Un libro con la hoja "Resumen" y una hoja por doctor."""
+    doctores, por_doctor, resumen = datos_nomina(anio, mes)
+    hojas = _nombres_unicos(doctores, 31) # Excel no acepta nombres de hoja de más de 31 caracteres
+    wb = Workbook(write_only=True)
+    escribir_hoja_resumen(wb.create_sheet("Resumen"), resumen)
+    for doctor in doctores:
+        escribir_hoja_doctor(wb.create_sheet(hojas[doctor.pk]), por_doctor.get(doctor.pk, []))
+    wb.save(destino)
+
+def generar_nomina_zip(anio, mes, destino, procesos=MAX_PROCESOS):
+    """Un ZIP con Resumen.xlsx y un Excel por doctor, generados en paralelo."""
+    doctores, por_doctor, resumen = datos_nomina(anio, mes)
+    archivos = _nombres_unicos(doctores, 80)
+    filas = [por_doctor.get(doctor.pk, []) for doctor in doctores]
+
+    procesos = max(1, min(procesos, len(doctores), os.cpu_count() or 1))
+    if procesos > 1:
+        # Los procesos solo reciben filas ya leídas: no abren conexiones a la base de datos
+        with ProcessPoolExecutor(max_workers=procesos) as pool:
+            libros = list(pool.map(excel_doctor_en_bytes, filas))
+    else:
+        libros = [excel_doctor_en_bytes(f) for f in filas]
+
+    with zipfile.ZipFile(destino, 'w') as zf:
+        # Un xlsx ya viene comprimido: se guarda tal cual
+        zf.writestr("Resumen.xlsx", _libro_resumen(resumen), compress_type=zipfile.ZIP_STORED)
+        for doctor, contenido in zip(doctores, libros):
+            zf.writestr(f"{archivos[doctor.pk]}.xlsx", contenido, compress_type=zipfile.ZIP_STORED)
+
+def nomina_en_archivo_temporal(anio, mes, formato='xlsx'):
+    """Devuelve (nombre de descarga, archivo temporal posicionado al inicio)."""
+    archivo = tempfile.TemporaryFile()
+    if formato == 'zip':
+        generar_nomina_zip(anio, mes, archivo)
+    else:
+        generar_nomina_xlsx(anio, mes, archivo)
+    archivo.seek(0)
+    return f"Nomina_{anio}-{mes:02d}.{formato}", archivo
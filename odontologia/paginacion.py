@@ -0,0 +1,142 @@
+# odontologia/paginacion.py
+import base64
+import binascii
+import datetime
+from django.db.models import Q
+
+# --- Paginación por cursor (keyset) para listados de Atenciones ---
+# En vez de OFFSET, cada página continúa desde la última fila vista usando la
+# llave estable (fecha, hora_atencion, id). Así la página 1.000 cuesta lo mismo que la 1.
+
+POR_PAGINA_DEFECTO = 25
+POR_PAGINA_MAX = 100
+ORDEN_ATENCIONES = ('-fecha', '-hora_atencion', '-id')
+ORDEN_ATENCIONES_INVERSO = ('fecha', 'hora_atencion', 'id')
+PK_MAXIMO = 2**63 - 1
+
+
+def codificar_cursor(atencion):
+    valor = f"{atencion.fecha.isoformat()}|{atencion.hora_atencion.isoformat()}|{atencion.pk}"
+    return base64.urlsafe_b64encode(valor.encode()).decode().rstrip('=')
+
+def decodificar_cursor(cursor):
+    """Devuelve (fecha, hora, pk) o None si el cursor no es válido."""
+    if not cursor:
+        return None
+    try:
+        relleno = '=' * (-len(cursor) % 4)
+        fecha, hora, pk = base64.urlsafe_b64decode(cursor + relleno).decode().split('|')
+        fecha, hora, pk = datetime.date.fromisoformat(fecha), datetime.time.fromisoformat(hora), int(pk)
+    except (ValueError, binascii.Error, UnicodeDecodeError):
+        return None
+    # Un cursor alterado no debe llegar a la consulta: la base rechaza una hora con zona
+    # horaria o un id fuera del rango de BigAutoField (error 500 en vez de la primera página)
+    if hora.tzinfo is not None or not 0 < pk <= PK_MAXIMO:
+        return None
+    return fecha, hora, pk
+
+def _mas_antiguas_que(fecha, hora, pk):
+    return Q(fecha__lt=fecha) | Q(fecha=fecha, hora_atencion__lt=hora) | Q(fecha=fecha, hora_atencion=hora, pk__lt=pk)
+
+def _mas_recientes_que(fecha, hora, pk):
+    return Q(fecha__gt=fecha) | Q(fecha=fecha, hora_atencion__gt=hora) | Q(fecha=fecha, hora_atencion=hora, pk__gt=pk)
+
+def leer_por_pagina(request, defecto=POR_PAGINA_DEFECTO):
+    try:
+        por_pagina = int(request.GET.get('por_pagina', defecto))
+    except ValueError:
+        por_pagina = defecto
+    return max(1, min(por_pagina, POR_PAGINA_MAX))
+
+
+class PaginaCursor:
+    """Una página de resultados con los enlaces a la página anterior/siguiente."""
+
+    def __init__(self, objetos, hay_anterior, hay_siguiente, parametros):
+        self.objetos = objetos
+        self.hay_anterior = hay_anterior
+        self.hay_siguiente = hay_siguiente
+        self._parametros = parametros
+
+    def _url(self, clave, cursor):
+        parametros = self._parametros.copy()
+        parametros[clave] = cursor
+        return '?' + parametros.urlencode()
+
+    @property
+    def url_anterior(self):
+        if not (self.hay_anterior and self.objetos): return ''
+        return self._url('antes', codificar_cursor(self.objetos[0]))
+
+    @property
+    def url_siguiente(self):
+        if not (self.hay_siguiente and self.objetos): return ''
+        return self._url('despues', codificar_cursor(self.objetos[-1]))
+
+
+def paginar_atenciones(request, atenciones, por_pagina_defecto=POR_PAGINA_DEFECTO):
+    """
+    Pagina un queryset de Atencion (más recientes primero) con cursores `?despues=`/`?antes=`.
+    Conserva el resto de los parámetros GET (por ejemplo `?q=`) en los enlaces.
+    """
+    por_pagina = leer_por_pagina(request, por_pagina_defecto)
+    atenciones = atenciones.select_related('doctor__user')
+    antes = decodificar_cursor(request.GET.get('antes'))
+    despues = decodificar_cursor(request.GET.get('despues'))
+
+    if antes:
+        # Retroceder: se recorre en orden inverso y se da vuelta el resultado
+        filas = list(atenciones.filter(_mas_recientes_que(*antes)).order_by(*ORDEN_ATENCIONES_INVERSO)[:por_pagina + 1])
+        hay_anterior = len(filas) > por_pagina
+        objetos = filas[:por_pagina][::-1]
+        hay_siguiente = True
+    else:
+        if despues:
+            atenciones = atenciones.filter(_mas_antiguas_que(*despues))
+        filas = list(atenciones.order_by(*ORDEN_ATENCIONES)[:por_pagina + 1])
+        hay_siguiente = len(filas) > por_pagina
+        objetos = filas[:por_pagina]
+        hay_anterior = despues is not None
+
+    parametros = request.GET.copy()
+    parametros.pop('antes', None)
+    parametros.pop('despues', None)
+    return PaginaCursor(objetos, hay_anterior, hay_siguiente, parametros)
+
+
+class PaginaNumerada(PaginaCursor):
+    """Página de resultados con orden propio (relevancia): los enlaces usan `?pagina=N`."""
+
+    def __init__(self, objetos, numero, hay_siguiente, parametros):
+        super().__init__(objetos, numero > 1, hay_siguiente, parametros)
+        self.numero = numero
+
+    @property
+    def url_anterior(self):
+        if not self.hay_anterior: return ''
+        return self._url('pagina', str(self.numero - 1))
+
+    @property
+    def url_siguiente(self):
+        if not self.hay_siguiente: return ''
+        return self._url('pagina', str(self.numero + 1))
+
+
+def paginar_por_numero(request, resultados, por_pagina_defecto=POR_PAGINA_DEFECTO):
+    """
+    Pagina un queryset ya ordenado (p. ej. los de busqueda.buscar_atenciones) con
+    `?pagina=N`. Usa OFFSET: el orden por relevancia no da una llave para cursores,
+    y una búsqueda rara vez se recorre más allá de unas pocas páginas.
+    """
+    por_pagina = leer_por_pagina(request, por_pagina_defecto)
+    try:
+        numero = max(1, int(request.GET.get('pagina', 1)))
+    except ValueError:
+        numero = 1
+    inicio = (numero - 1) * por_pagina
+    filas = list(resultados.select_related('doctor__user')[inicio:inicio + por_pagina + 1])
+
+    parametros = request.GET.copy()
+    for clave in ('pagina', 'antes', 'despues'):
+        parametros.pop(clave, None)
+    return PaginaNumerada(filas[:por_pagina], numero, len(filas) > por_pagina, parametros)
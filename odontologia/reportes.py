@@ -0,0 +1,175 @@
+# odontologia/reportes.py
+import io
+import tempfile
+from itertools import chain
+from decimal import Decimal
+from django.db.models import F, Max, Value, DecimalField, Window
+from django.db.models.functions import Coalesce, Length
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
+
+# --- Constantes del Reporte ---
+
+TAMANO_LOTE = 2000 # Filas que se traen de la BD por cada viaje del cursor
+
+ENCABEZADOS = ["Fecha", "Hora", "RUT Paciente", "Nombre Paciente", "Motivo", "Total Cobrado", "Ganancia Doctor (50%)"]
+# Anchos mínimos (en caracteres) de las columnas cuyo contenido tiene formato fijo
+ANCHOS_FIJOS = {0: len("dd/mm/aaaa"), 1: len("HH:MM"), 5: len("$ 999.999.999"), 6: len("$ 999.999.999")}
+
+# Estilos
+thin_border = Border(left=Side(style='thin'), right=Side(style='thin'), top=Side(style='thin'), bottom=Side(style='thin'))
+header_font = Font(name='Calibri', bold=True, color='FFFFFF', size=12)
+header_fill = PatternFill(start_color='1F497D', end_color='1F497D', fill_type='solid')
+header_alignment = Alignment(horizontal='center', vertical='center')
+money_alignment = Alignment(horizontal='right')
+total_font = Font(name='Calibri', bold=True, size=12)
+total_fill = PatternFill(start_color='FFF2CC', end_color='FFF2CC', fill_type='solid')
+FORMATO_DINERO = '$ #,##0'
+
+CONTENT_TYPE_XLSX = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+
+# --- Consultas ---
+
+def atenciones_con_totales(atenciones, por_doctor=False):
+    """
+    Lee en una sola consulta los totales ya materializados en la Boleta de cada
+    atención y el largo máximo de las columnas de texto (funciones de ventana),
+    para no recorrer las celdas de nuevo al final.
+    Con `por_doctor` los largos se calculan por doctor y cada fila termina con el doctor_id.
+    """
+    cero = Value(Decimal('0.00'))
+    particion = {'partition_by': [F('doctor_id')]} if por_doctor else {}
+    campos = [
+        'fecha', 'hora_atencion', 'paciente_rut', 'paciente_nombre', 'paciente_apellido',
+        'motivo_visita', 'total_cobrado', 'ganancia_doctor', 'largo_rut', 'largo_nombre', 'largo_motivo',
+    ]
+    return atenciones.annotate(
+        total_cobrado=Coalesce('boleta__total_tratamientos', cero, output_field=DecimalField(max_digits=12, decimal_places=2)),
+        ganancia_doctor=Coalesce('boleta__ganancia_neta_doctor', cero, output_field=DecimalField(max_digits=12, decimal_places=2)),
+        largo_rut=Window(Max(Length('paciente_rut')), **particion),
+        largo_nombre=Window(Max(Length('paciente_nombre') + Length('paciente_apellido') + 1), **particion),
+        largo_motivo=Window(Max(Length('motivo_visita')), **particion),
+    ).values_list(*campos, *(['doctor_id'] if por_doctor else []))
+
+
+# --- Escritura ---
+
+def _celda(ws, valor, font=None, fill=None, alignment=None, number_format=None):
+    cell = WriteOnlyCell(ws, value=valor)
+    cell.border = thin_border
+    if font: cell.font = font
+    if fill: cell.fill = fill
+    if alignment: cell.alignment = alignment
+    if number_format: cell.number_format = number_format
+    return cell
+
+def _ajustar_anchos(ws, largos):
+    """Fija el ancho de cada columna. En modo write-only debe hacerse antes de escribir filas."""
+    for col_num, encabezado in enumerate(ENCABEZADOS):
+        max_len = max(len(encabezado), ANCHOS_FIJOS.get(col_num, 0), largos.get(col_num) or 0)
+        ws.column_dimensions[chr(ord('A') + col_num)].width = (max_len + 2) * 1.2
+
+def escribir_hoja_doctor(ws, filas):
+    """
+    Escribe el reporte financiero de un doctor en una hoja write-only.
+    `filas` es el iterable devuelto por `atenciones_con_totales`.
+    Devuelve la tupla (total_cobrado, total_ganancias).
+    """
+    # Los largos máximos vienen repetidos en cada fila; basta con mirar la primera
+    filas = iter(filas)
+    primera = next(filas, None)
+    largos = {}
+    if primera is not None:
+        largos = {2: primera[8], 3: primera[9], 4: primera[10]}
+        filas = chain([primera], filas)
+    _ajustar_anchos(ws, largos)
+
+    ws.append([_celda(ws, h, header_font, header_fill, header_alignment) for h in ENCABEZADOS])
+
+    total_ganancias = Decimal('0.00')
+    total_cobrado = Decimal('0.00')
+    fila_num = 1
+
+    for fecha, hora, rut, nombre, apellido, motivo, total_atencion, ganancia_doctor, *_ in filas:
+        total_cobrado += total_atencion
+        total_ganancias += ganancia_doctor
+        ws.append([
+            _celda(ws, fecha.strftime("%d/%m/%Y")),
+            _celda(ws, hora.strftime("%H:%M")),
+            _celda(ws, rut),
+            _celda(ws, f"{nombre} {apellido}"),
+            _celda(ws, motivo),
+            _celda(ws, total_atencion, alignment=money_alignment, number_format=FORMATO_DINERO),
+            _celda(ws, ganancia_doctor, alignment=money_alignment, number_format=FORMATO_DINERO),
+        ])
+        fila_num += 1
+
+    # Fila Totales
+    fila_num += 1
+    ws.append(
+        [_celda(ws, "TOTALES", total_font, total_fill, Alignment(horizontal='center'))]
+        + [_celda(ws, "", total_font, total_fill) for _ in range(4)]
+        + [_celda(ws, t, total_font, total_fill, money_alignment, FORMATO_DINERO) for t in (total_cobrado, total_ganancias)]
+    )
+    ws.merged_cells.add(f"A{fila_num}:E{fila_num}")
+    return total_cobrado, total_ganancias
+
+def escribir_hoja_resumen(ws, filas):
+    """
+    Hoja de resumen de la nómina: una fila por doctor con `filas` de la forma
+    (nombre, rut, cantidad de atenciones, total cobrado, ganancia del doctor).
+    """
+    encabezados = ["Doctor", "RUT", "Atenciones", "Total Cobrado", "Ganancia Doctor (50%)"]
+    anchos = [max([len(encabezados[0])] + [len(f[0]) for f in filas]), 12, 12, 16, 24]
+    for col_num, ancho in enumerate(anchos):
+        ws.column_dimensions[chr(ord('A') + col_num)].width = (ancho + 2) * 1.2
+    ws.append([_celda(ws, h, header_font, header_fill, header_alignment) for h in encabezados])
+
+    total_atenciones, total_cobrado, total_ganancias = 0, Decimal('0.00'), Decimal('0.00')
+    for nombre, rut, cantidad, cobrado, ganancia in filas:
+        total_atenciones += cantidad
+        total_cobrado += cobrado
+        total_ganancias += ganancia
+        ws.append([
+            _celda(ws, nombre), _celda(ws, rut), _celda(ws, cantidad),
+            _celda(ws, cobrado, alignment=money_alignment, number_format=FORMATO_DINERO),
+            _celda(ws, ganancia, alignment=money_alignment, number_format=FORMATO_DINERO),
+        ])
+    fila_num = len(filas) + 2
+    ws.append(
+        [_celda(ws, "TOTALES", total_font, total_fill, Alignment(horizontal='center')), _celda(ws, "", total_font, total_fill)]
+        + [_celda(ws, total_atenciones, total_font, total_fill)]
+        + [_celda(ws, t, total_font, total_fill, money_alignment, FORMATO_DINERO) for t in (total_cobrado, total_ganancias)]
+    )
+    ws.merged_cells.add(f"A{fila_num}:B{fila_num}")
+
+def generar_excel_doctor(atenciones, destino):
+    """
+    Genera el reporte de un doctor en un Workbook write-only (memoria constante)
+    y lo guarda en `destino` (ruta o archivo binario).
+    """
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Reporte Financiero")
+    escribir_hoja_doctor(ws, atenciones_con_totales(atenciones).iterator(chunk_size=TAMANO_LOTE))
+    wb.save(destino)
+
+def excel_doctor_en_archivo_temporal(atenciones):
+    """Devuelve un archivo temporal (posicionado al inicio) con el reporte, listo para enviarse en streaming."""
+    archivo = tempfile.TemporaryFile()
+    generar_excel_doctor(atenciones, archivo)
+    archivo.seek(0)
+    return archivo
+
+def excel_doctor_en_bytes(filas):
+    """
+    Reporte de un doctor en memoria a partir de filas ya leídas (no toca la base de
+    datos), para generarlo en otro proceso de un ProcessPoolExecutor.
+    """
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Reporte Financiero")
+    escribir_hoja_doctor(ws, filas)
+    destino = io.BytesIO()
+    wb.save(destino)
+    return destino.getvalue()
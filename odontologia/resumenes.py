@@ -0,0 +1,114 @@
+# odontologia/resumenes.py
+import datetime
+from collections import defaultdict
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import Count, Sum, Q
+from django.db.models.functions import ExtractYear, ExtractMonth
+from .models import DetalleAtencion, ResumenMensualDoctor, PORCENTAJE_DOCTOR
+
+# --- Resumen mensual por doctor y especialidad ---
+# Cada fila agrupa los tratamientos de un doctor en un mes y especialidad. Cuando
+# cambia una atención o un detalle solo se recalcula su periodo (doctor, año, mes),
+# con una consulta acotada por el índice (doctor, fecha) de Atencion.
+
+CENTAVOS = Decimal('0.01')
+CAMPOS_TOTALES = ['cantidad_atenciones', 'cantidad_tratamientos', 'total_facturado', 'ganancia_doctor']
+
+
+def periodo_de(doctor_id, fecha):
+    return (doctor_id, fecha.year, fecha.month)
+
+def _agregados(detalles):
+    return detalles.annotate(
+        cantidad_atenciones=Count('atencion', distinct=True),
+        cantidad_tratamientos=Count('pk'),
+        total_facturado=Sum('valor'),
+    )
+
+def _fila(doctor_id, anio, mes, especialidad, atenciones, tratamientos, total):
+    return ResumenMensualDoctor(
+        doctor_id=doctor_id, anio=anio, mes=mes, especialidad=especialidad,
+        cantidad_atenciones=atenciones, cantidad_tratamientos=tratamientos, total_facturado=total,
+        ganancia_doctor=(total * PORCENTAJE_DOCTOR).quantize(CENTAVOS),
+    )
+
+def calcular_periodo(doctor_id, anio, mes):
+    """Filas del resumen de un doctor en un mes, calculadas desde los detalles."""
+    inicio = datetime.date(anio, mes, 1)
+    fin = (inicio + datetime.timedelta(days=32)).replace(day=1)
+    detalles = DetalleAtencion.objects.filter(
+        atencion__doctor_id=doctor_id, atencion__fecha__gte=inicio, atencion__fecha__lt=fin
+    ).values('especialidad')
+    return [
+        _fila(doctor_id, anio, mes, f['especialidad'], f['cantidad_atenciones'], f['cantidad_tratamientos'], f['total_facturado'])
+        for f in _agregados(detalles)
+    ]
+
+def calcular_todo():
+    """Todas las filas del resumen calculadas desde cero (una consulta agregada)."""
+    detalles = DetalleAtencion.objects.annotate(
+        anio=ExtractYear('atencion__fecha'), mes=ExtractMonth('atencion__fecha')
+    ).values('atencion__doctor_id', 'anio', 'mes', 'especialidad')
+    return [
+        _fila(f['atencion__doctor_id'], f['anio'], f['mes'], f['especialidad'],
+              f['cantidad_atenciones'], f['cantidad_tratamientos'], f['total_facturado'])
+        for f in _agregados(detalles).order_by()
+    ]
+
+def recalcular_periodos(periodos):
+    """Recalcula los periodos (doctor_id, año, mes) indicados y reemplaza sus filas."""
+    periodos = set(periodos)
+    if not periodos:
+        return
+    with transaction.atomic():
+        filas = []
+        for doctor_id, anio, mes in periodos:
+            filas.extend(calcular_periodo(doctor_id, anio, mes))
+        # Borrar las especialidades que quedaron sin tratamientos en esos periodos
+        vigentes = {(f.doctor_id, f.anio, f.mes, f.especialidad) for f in filas}
+        sobrantes = Q()
+        for doctor_id, anio, mes in periodos:
+            sobrantes |= Q(doctor_id=doctor_id, anio=anio, mes=mes)
+        obsoletas = [
+            pk for pk, *clave in ResumenMensualDoctor.objects.filter(sobrantes).values_list('pk', 'doctor_id', 'anio', 'mes', 'especialidad')
+            if tuple(clave) not in vigentes
+        ]
+        if obsoletas:
+            ResumenMensualDoctor.objects.filter(pk__in=obsoletas).delete()
+        if filas:
+            ResumenMensualDoctor.objects.bulk_create(
+                filas, update_conflicts=True, unique_fields=['doctor', 'anio', 'mes', 'especialidad'], update_fields=CAMPOS_TOTALES,
+            )
+
+
+# --- Lecturas para las vistas ---
+
+def resumen_anual(doctor_id, anio):
+    """
+    Devuelve (meses, especialidades, totales) de un año leyendo solo la tabla de resumen.
+    `meses` trae una entrada por cada mes 1..12 aunque no tenga movimientos.
+    """
+    meses = {mes: defaultdict(Decimal) for mes in range(1, 13)}
+    especialidades = defaultdict(lambda: defaultdict(Decimal))
+    totales = defaultdict(Decimal)
+    nombres = dict(DetalleAtencion.ESPECIALIDADES)
+
+    filas = ResumenMensualDoctor.objects.filter(doctor_id=doctor_id, anio=anio).values_list(
+        'mes', 'especialidad', 'cantidad_tratamientos', 'total_facturado', 'ganancia_doctor'
+    )
+    for mes, especialidad, tratamientos, facturado, ganancia in filas:
+        for destino in (meses[mes], especialidades[nombres.get(especialidad, especialidad)], totales):
+            destino['tratamientos'] += tratamientos
+            destino['facturado'] += facturado
+            destino['ganancia'] += ganancia
+    return (
+        [(mes, dict(valores)) for mes, valores in meses.items()],
+        sorted((nombre, dict(valores)) for nombre, valores in especialidades.items()),
+        dict(totales),
+    )
+
+def anios_con_resumen(doctor_id):
+    return list(
+        ResumenMensualDoctor.objects.filter(doctor_id=doctor_id).order_by('-anio').values_list('anio', flat=True).distinct()
+    )
@@ -0,0 +1,90 @@
+# odontologia/rut.py
+import re
+from collections import namedtuple
+
+# --- Normalización y validación de RUT ---
+# Lo usan el formulario (forms.validar_rut) y las validaciones de miles de RUT en una
+# llamada (importaciones, búsquedas, revisiones de calidad de datos). El dígito
+# verificador se obtiene con dos tablas precalculadas de sumas ponderadas en vez de
+# recorrer los dígitos uno a uno; el algoritmo original queda en benchmark_rut como
+# referencia de los tests.
+
+RUT_MINIMO = 1000000
+RUT_MAXIMO = 30000000 # excluido
+
+ERROR_FORMATO = "Formato inválido. Use: 12345678-9"
+ERROR_BAJO = "RUT inválido (muy bajo)."
+ERROR_RANGO = "RUT inválido (fuera de rango)."
+ERROR_DIGITO = "RUT inválido. Dígito verificador incorrecto."
+
+_PATRON = re.compile(r'^\d{1,8}-[\dK]$')
+_SEPARADORES = str.maketrans('', '', '. ')
+
+
+def _sumas_ponderadas(pesos):
+    """Tabla de 10.000 entradas: suma de cada dígito de un bloque de 4 por su peso (de derecha a izquierda)."""
+    tabla = []
+    for numero in range(10000):
+        suma = 0
+        for peso in pesos:
+            numero, digito = divmod(numero, 10)
+            suma += digito * peso
+        tabla.append(suma)
+    return tabla
+
+# Módulo 11 con pesos 2..7 repetidos: los 4 dígitos bajos usan 2,3,4,5 y los 4 altos 6,7,2,3
+_TABLA_BAJA = _sumas_ponderadas((2, 3, 4, 5))
+_TABLA_ALTA = _sumas_ponderadas((6, 7, 2, 3))
+_DIGITOS = '0123456789K'
+
+RutValidado = namedtuple('RutValidado', ['rut', 'clave', 'error'])
+
+
+def normalizar(rut):
+    """'12.345.678-k ' -> '12345678-K' (sin validar)."""
+    return (rut or '').strip().upper().translate(_SEPARADORES)
+
+def digito_verificador(cuerpo):
+    """Dígito verificador ('0'..'9' o 'K') de un cuerpo numérico de hasta 8 dígitos."""
+    alto, bajo = divmod(cuerpo, 10000)
+    return _DIGITOS[-(_TABLA_BAJA[bajo] + _TABLA_ALTA[alto]) % 11]
+
+def validar(rut):
+    """
+    Devuelve RutValidado(rut normalizado, clave numérica, error). `clave` es el cuerpo
+    como entero (el dígito verificador se deriva de él) y sirve como llave canónica
+    para indexar y comparar; es None si el RUT no es válido. `error` es None si es válido.
+    """
+    rut = normalizar(rut)
+    if not _PATRON.match(rut):
+        return RutValidado(rut, None, ERROR_FORMATO)
+    cuerpo, dv = rut.split('-')
+    cuerpo = int(cuerpo)
+    if cuerpo < RUT_MINIMO:
+        return RutValidado(rut, None, ERROR_BAJO)
+    if cuerpo >= RUT_MAXIMO:
+        return RutValidado(rut, None, ERROR_RANGO)
+    if dv != digito_verificador(cuerpo):
+        return RutValidado(rut, None, ERROR_DIGITO)
+    return RutValidado(rut, cuerpo, None)
+
+def validar_lote(ruts):
+    """
+    Valida una secuencia de RUT y devuelve la lista de RutValidado en el mismo orden.
+    Los valores repetidos (habituales en importaciones) se validan una sola vez.
+    """
+    vistos = {}
+    resultado = []
+    for rut in ruts:
+        validado = vistos.get(rut)
+        if validado is None:
+            validado = vistos[rut] = validar(rut)
+        resultado.append(validado)
+    return resultado
+
+def es_valido(rut):
+    return validar(rut).error is None
+
+def clave_numerica(rut):
+    """Cuerpo del RUT como entero, o None si no es válido."""
+    return validar(rut).clave
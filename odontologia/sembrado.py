@@ -0,0 +1,284 @@
+# odontologia/sembrado.py
+import datetime
+import math
+import random
+from decimal import Decimal
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+from .models import Atencion, Boleta, DetalleAtencion, Doctor, ExamenAtencion, Paciente, ResumenMensualDoctor, PORCENTAJE_DOCTOR
+from .boletas import guardar_boletas, CENTAVOS
+from .versiones import invalidar_datos
+from .resumenes import recalcular_periodos, periodo_de
+from . import rut as rut_utils
+
+# --- Datos sintéticos para pruebas de rendimiento ---
+# Genera doctores, pacientes, atenciones, tratamientos y exámenes con distribuciones
+# parecidas a las de la clínica (pacientes que vuelven, días y horas punta, carga
+# distinta por doctor, montos por especialidad) e inserta todo con bulk_create. Las
+# boletas se calculan en memoria y el resumen mensual se recalcula al final, así el
+# resultado es el mismo que si las atenciones se hubieran ingresado por el formulario.
+# Todo lo sembrado se reconoce por el prefijo de usuario y el dominio de email, y
+# `limpiar` lo borra sin tocar los datos reales.
+
+PREFIJO_USUARIO = 'sembrado_'
+DOMINIO_EMAIL = 'sembrado.invalid'
+PROMEDIO_DIARIO = 12 # Atenciones por doctor en un día hábil
+ATENCIONES_POR_PACIENTE = 4 # En promedio cada paciente vuelve varias veces
+TAMANO_LOTE = 5000
+
+# Bloques de 30 minutos: de 9:00 a 19:30 (sábado hasta 13:30), con más demanda a primera y última hora
+HORAS = [datetime.time(9 + m // 60, m % 60) for m in range(0, 11 * 60, 30)]
+PESOS_HORA = [3, 3, 2, 2, 2, 2, 1, 1, 1, 1, 2, 2, 2, 2, 3, 3, 3, 3, 2, 2, 1, 1]
+BLOQUES_SABADO = 10
+
+NOMBRES_F = ['María', 'Camila', 'Valentina', 'Javiera', 'Francisca', 'Catalina', 'Fernanda', 'Constanza', 'Daniela', 'Sofía', 'Antonia', 'Isidora', 'Paula', 'Carolina', 'Josefa']
+NOMBRES_M = ['José', 'Juan', 'Diego', 'Matías', 'Sebastián', 'Benjamín', 'Vicente', 'Tomás', 'Felipe', 'Cristóbal', 'Nicolás', 'Martín', 'Pablo', 'Ignacio', 'Joaquín']
+APELLIDOS = [
+    'González', 'Muñoz', 'Rojas', 'Díaz', 'Pérez', 'Soto', 'Contreras', 'Silva', 'Martínez', 'Sepúlveda',
+    'Morales', 'Rodríguez', 'López', 'Fuentes', 'Hernández', 'Torres', 'Araya', 'Flores', 'Espinoza', 'Valenzuela',
+    'Castillo', 'Tapia', 'Reyes', 'Gutiérrez', 'Castro', 'Pizarro', 'Álvarez', 'Vásquez', 'Sánchez', 'Fernández',
+]
+MOTIVOS = [
+    'Control', 'Dolor de muelas', 'Limpieza', 'Sensibilidad dental', 'Control de ortodoncia', 'Diente fracturado',
+    'Sangrado de encías', 'Evaluación', 'Urgencia', 'Extracción', 'Revisión de tapadura', 'Blanqueamiento',
+]
+METODOS_PAGO = ['EF', 'TD', 'TC', 'TR']
+PESOS_PAGO = [25, 35, 20, 20]
+
+# (especialidad, peso, monto mínimo, monto máximo, descripciones)
+TRATAMIENTOS = [
+    ('OPER', 30, 25000, 60000, ['Restauración de resina', 'Obturación simple', 'Reparación de tapadura']),
+    ('HIGI', 20, 20000, 40000, ['Destartraje y pulido', 'Profilaxis', 'Aplicación de flúor']),
+    ('ENDO', 12, 120000, 250000, ['Tratamiento de conducto unirradicular', 'Tratamiento de conducto multirradicular']),
+    ('ORTO', 12, 35000, 80000, ['Control de ortodoncia', 'Cambio de arco', 'Instalación de brackets']),
+    ('CIRU', 8, 50000, 150000, ['Exodoncia simple', 'Exodoncia de tercer molar', 'Biopsia']),
+    ('PEDIA', 8, 20000, 45000, ['Sellantes', 'Pulpotomía', 'Control infantil']),
+    ('IMPL', 3, 600000, 1200000, ['Instalación de implante', 'Corona sobre implante']),
+    ('OTRO', 7, 10000, 50000, ['Radiografía', 'Ajuste oclusal', 'Receta y control']),
+]
+PESOS_TRATAMIENTO = [t[1] for t in TRATAMIENTOS]
+EXAMENES = [('Radiografía panorámica', 25000), ('Radiografía periapical', 8000), ('Scanner dental', 60000), ('Modelo de estudio', 15000)]
+PROPORCION_EXAMENES = 0.15
+
+
+def _monto(azar, minimo, maximo):
+    return Decimal(round(azar.uniform(minimo, maximo), -3)).quantize(CENTAVOS)
+
+def _ruts_libres(azar, cantidad):
+    """RUT válidos al azar que no usa ningún paciente ni doctor existente."""
+    elegidos = []
+    while len(elegidos) < cantidad:
+        candidatos = {
+            f"{cuerpo}-{rut_utils.digito_verificador(cuerpo)}"
+            for cuerpo in azar.sample(range(5000000, 25000000), (cantidad - len(elegidos)) * 11 // 10 + 10)
+        } - set(elegidos)
+        candidatos = list(candidatos)
+        usados = set()
+        for i in range(0, len(candidatos), 900):
+            parte = candidatos[i:i + 900]
+            usados.update(Paciente.objects.filter(rut__in=parte).values_list('rut', flat=True))
+            usados.update(Doctor.objects.filter(rut__in=parte).values_list('rut', flat=True))
+        elegidos.extend(rut for rut in candidatos if rut not in usados)
+    return elegidos[:cantidad]
+
+def _nombre(azar):
+    sexo = azar.choices('FMO', [49, 49, 2])[0]
+    nombres = NOMBRES_F if sexo == 'F' else NOMBRES_M if sexo == 'M' else NOMBRES_F + NOMBRES_M
+    return sexo, azar.choice(nombres), f"{azar.choice(APELLIDOS)} {azar.choice(APELLIDOS)}"
+
+
+# --- Personas ---
+
+def _crear_usuario_admin():
+    admin, _ = User.objects.get_or_create(
+        username=f"{PREFIJO_USUARIO}admin",
+        defaults={'first_name': 'Sembrado', 'is_staff': True, 'is_superuser': True, 'password': make_password(None)},
+    )
+    return admin
+
+def _crear_doctores(azar, cantidad):
+    existentes = User.objects.filter(username__startswith=f"{PREFIJO_USUARIO}doctor_").count()
+    ruts = _ruts_libres(azar, cantidad)
+    usuarios = []
+    for i in range(cantidad):
+        _, nombre, apellido = _nombre(azar)
+        usuarios.append(User(
+            username=f"{PREFIJO_USUARIO}doctor_{existentes + i + 1:04d}", first_name=nombre, last_name=apellido,
+            email=f"doctor{existentes + i + 1}@{DOMINIO_EMAIL}", password=make_password(None),
+        ))
+    usuarios = User.objects.bulk_create(usuarios)
+    doctores = Doctor.objects.bulk_create([
+        Doctor(user=usuario, rut=rut, fecha_nacimiento=datetime.date(azar.randint(1960, 1995), azar.randint(1, 12), azar.randint(1, 28)))
+        for usuario, rut in zip(usuarios, ruts)
+    ])
+    # Carga relativa: algunos doctores tienen bastante más agenda que otros
+    return [(doctor, azar.uniform(0.5, 1.5)) for doctor in doctores]
+
+def _crear_pacientes(azar, cantidad):
+    pacientes = []
+    for rut in _ruts_libres(azar, cantidad):
+        sexo, nombre, apellido = _nombre(azar)
+        celular = f"+569{azar.randint(10000000, 99999999)}" if azar.random() < 0.8 else None
+        pacientes.append(Paciente(
+            rut=rut, nombre=nombre, apellido=apellido, sexo=sexo, celular=celular,
+            email=f"{rut.replace('-', '')}@{DOMINIO_EMAIL}",
+        ))
+    pacientes = Paciente.objects.bulk_create(pacientes, batch_size=2000)
+    # La edad se fija por paciente y se copia en cada atención, como hace el formulario
+    return [(p, int(azar.triangular(3, 65, 32))) for p in pacientes]
+
+
+# --- Atenciones ---
+
+def _dias_habiles(dias, hasta=None):
+    hasta = hasta or timezone.localdate()
+    inicio = hasta - datetime.timedelta(days=dias - 1)
+    fechas = (inicio + datetime.timedelta(days=n) for n in range(dias))
+    return [fecha for fecha in fechas if fecha.weekday() != 6]
+
+def _agenda(azar, dias_habiles, doctores, cantidad):
+    """
+    Genera (fecha, doctor, hora) sin repetir la hora de un doctor en el día, repartiendo
+    `cantidad` atenciones según la carga de cada doctor (los sábados media jornada).
+    """
+    # Peso de cada (día, doctor): carga del doctor, media jornada el sábado y variación diaria
+    casillas = [
+        (fecha, doctor, carga * (0.5 if fecha.weekday() == 5 else 1) * azar.uniform(0.7, 1.3))
+        for fecha in dias_habiles for doctor, carga in doctores
+    ]
+    peso_total = sum(peso for _, _, peso in casillas)
+    generadas, acumulado = 0, 0.0
+    for fecha, doctor, peso in casillas:
+        bloques = BLOQUES_SABADO if fecha.weekday() == 5 else len(HORAS)
+        # Redondeo con arrastre: sumando todas las casillas se llega a `cantidad`
+        acumulado += cantidad * peso / peso_total
+        n = min(bloques, round(acumulado) - generadas)
+        if n <= 0:
+            continue
+        horas = set()
+        while len(horas) < n:
+            horas.update(azar.choices(range(bloques), PESOS_HORA[:bloques], k=n - len(horas)))
+        for hora in sorted(horas):
+            yield fecha, doctor, HORAS[hora]
+        generadas += n
+
+def _atenciones(azar, agenda, pacientes):
+    """Agrega paciente y datos de la atención; un paciente no se repite en el mismo día."""
+    # Pocos pacientes concentran muchas visitas (tratamientos largos, ortodoncia)
+    pesos = [1 / (i + 1) ** 0.6 for i in range(len(pacientes))]
+    acumulados = []
+    total = 0
+    for peso in pesos:
+        total += peso
+        acumulados.append(total)
+    dia_actual, del_dia = None, set()
+    for fecha, doctor, hora in agenda:
+        if fecha != dia_actual:
+            dia_actual, del_dia = fecha, set()
+        indice = azar.choices(range(len(pacientes)), cum_weights=acumulados)[0]
+        while indice in del_dia:
+            indice = azar.randrange(len(pacientes))
+        del_dia.add(indice)
+        paciente, edad = pacientes[indice]
+        yield Atencion(
+            doctor=doctor, paciente=paciente, fecha=fecha, hora_atencion=hora,
+            motivo_visita=azar.choice(MOTIVOS), metodo_pago=azar.choices(METODOS_PAGO, PESOS_PAGO)[0],
+            paciente_nombre=paciente.nombre, paciente_apellido=paciente.apellido, paciente_rut=paciente.rut,
+            paciente_edad=edad, paciente_sexo=paciente.sexo, paciente_email=paciente.email, paciente_celular=paciente.celular,
+        )
+
+def _guardar_lote(azar, atenciones):
+    """Inserta un lote de atenciones con sus detalles, exámenes y boletas. Devuelve los periodos tocados."""
+    with transaction.atomic():
+        atenciones = Atencion.objects.bulk_create(atenciones, batch_size=1000)
+        detalles, examenes, totales = [], [], {}
+        for atencion in atenciones:
+            total_tratamientos = total_examenes = Decimal('0.00')
+            for _ in range(azar.choices([1, 2, 3], [60, 30, 10])[0]):
+                especialidad, _, minimo, maximo, descripciones = azar.choices(TRATAMIENTOS, PESOS_TRATAMIENTO)[0]
+                valor = _monto(azar, minimo, maximo)
+                total_tratamientos += valor
+                detalles.append(DetalleAtencion(atencion=atencion, especialidad=especialidad, descripcion=azar.choice(descripciones), valor=valor))
+            if azar.random() < PROPORCION_EXAMENES:
+                descripcion, costo = azar.choice(EXAMENES)
+                cantidad = azar.choices([1, 2], [85, 15])[0]
+                total_examenes = Decimal(costo * cantidad).quantize(CENTAVOS)
+                examenes.append(ExamenAtencion(atencion=atencion, descripcion=descripcion, cantidad=cantidad, costo_total=total_examenes))
+            totales[atencion.pk] = (total_tratamientos, total_examenes, (total_tratamientos * PORCENTAJE_DOCTOR).quantize(CENTAVOS))
+        DetalleAtencion.objects.bulk_create(detalles, batch_size=1000)
+        ExamenAtencion.objects.bulk_create(examenes, batch_size=1000)
+        guardar_boletas(totales)
+    return {periodo_de(a.doctor_id, a.fecha) for a in atenciones}
+
+def sembrar(atenciones, doctores=None, dias=730, hasta=None, semilla=2024, lote=TAMANO_LOTE, progreso=None):
+    """
+    Crea `atenciones` atenciones sintéticas en los `dias` días que terminan en `hasta`
+    (por defecto hoy). `doctores` es la cantidad de doctores a crear o una lista de
+    Doctor ya sembrados para agregarles atenciones (en días que aún no tengan); si no
+    se indica se calcula para que cada uno tenga unas PROMEDIO_DIARIO atenciones por
+    día hábil. `progreso(hechas, total)` se llama después de cada lote. Devuelve un
+    diccionario con lo creado.
+    """
+    azar = random.Random(semilla)
+    dias_habiles = _dias_habiles(dias, hasta)
+    if doctores is None:
+        doctores = max(3, math.ceil(atenciones / (len(dias_habiles) * PROMEDIO_DIARIO)))
+    admin = _crear_usuario_admin()
+    if isinstance(doctores, int):
+        doctores_creados = _crear_doctores(azar, doctores)
+    else:
+        doctores_creados = [(doctor, azar.uniform(0.5, 1.5)) for doctor in doctores]
+    # Un paciente no se repite en el día: se necesitan al menos tantos como horas tenga el día más cargado
+    cupo_diario = len(HORAS) * len(doctores_creados)
+    pacientes = _crear_pacientes(azar, max(50, cupo_diario, atenciones // ATENCIONES_POR_PACIENTE))
+
+    agenda = _agenda(azar, dias_habiles, doctores_creados, atenciones)
+    hechas, pendientes, periodos = 0, [], set()
+    for atencion in _atenciones(azar, agenda, pacientes):
+        pendientes.append(atencion)
+        if len(pendientes) >= lote:
+            periodos |= _guardar_lote(azar, pendientes)
+            hechas += len(pendientes)
+            pendientes = []
+            if progreso:
+                progreso(hechas, atenciones)
+    if pendientes:
+        periodos |= _guardar_lote(azar, pendientes)
+        hechas += len(pendientes)
+        if progreso:
+            progreso(hechas, atenciones)
+
+    recalcular_periodos(periodos)
+    for doctor, _ in doctores_creados:
+        invalidar_datos(doctor.pk)
+    return {
+        'admin': admin, 'doctores': [d for d, _ in doctores_creados],
+        'pacientes': len(pacientes), 'atenciones': hechas,
+    }
+
+
+# --- Limpieza ---
+
+def limpiar():
+    """
+    Borra todo lo sembrado. Las atenciones y sus dependientes se borran con DELETE
+    directos (sin cargar filas ni disparar señales): con un millón de filas el borrado
+    normal del ORM tardaría horas. Devuelve la cantidad de atenciones borradas.
+    """
+    doctores = list(Doctor.objects.filter(user__username__startswith=PREFIJO_USUARIO).values_list('pk', flat=True))
+    with transaction.atomic():
+        atenciones = Atencion.objects.filter(doctor_id__in=doctores)
+        borradas = atenciones.count()
+        for modelo in (DetalleAtencion, ExamenAtencion, Boleta):
+            qs = modelo.objects.filter(atencion__doctor_id__in=doctores)
+            qs._raw_delete(qs.db)
+        atenciones._raw_delete(atenciones.db)
+        ResumenMensualDoctor.objects.filter(doctor_id__in=doctores).delete()
+        Doctor.objects.filter(pk__in=doctores).delete()
+        User.objects.filter(username__startswith=PREFIJO_USUARIO).delete()
+        Paciente.objects.filter(email__endswith=f"@{DOMINIO_EMAIL}", atenciones__isnull=True).delete()
+    for doctor_id in doctores:
+        invalidar_datos(doctor_id)
+    return borradas
@@ -0,0 +1,89 @@
+# odontologia/signals.py
+from django.db import transaction
+from django.db.models.signals import post_init, post_save, post_delete
+from django.dispatch import receiver
+from django.contrib.auth.models import User
+from .models import Atencion, DetalleAtencion, ExamenAtencion, Doctor, Paciente
+from .boletas import marcar_para_recalculo
+from .resumenes import periodo_de
+from .contexto import invalidar_perfil
+from .versiones import invalidar_datos
+from .autocompletar import olvidar as olvidar_autocompletado
+
+
+def _borrado_en_cascada_de_atencion(origin):
+    """True si el borrado viene de eliminar la Atención misma (su boleta también se borra)."""
+    return isinstance(origin, Atencion) or getattr(origin, 'model', None) is Atencion
+
+def _invalidar_al_confirmar(doctor_id):
+    # Después del commit, para que nadie vuelva a llenar la caché con datos sin confirmar
+    # (la versión de datos invalida también los indicadores del panel, ver estadisticas.py)
+    transaction.on_commit(lambda: invalidar_datos(doctor_id))
+
+def _periodos_de_detalle(instance):
+    # Los exámenes no entran al resumen mensual de tratamientos
+    if isinstance(instance, ExamenAtencion):
+        return ()
+    atencion = instance.atencion
+    return (periodo_de(atencion.doctor_id, atencion.fecha),)
+
+
+@receiver(post_init, sender=Atencion)
+def recordar_periodo_original(sender, instance, **kwargs):
+    # Si cambian la fecha o el doctor hay que recalcular también el periodo anterior
+    if instance.pk and not {'doctor_id', 'fecha'} & instance.get_deferred_fields():
+        instance._periodo_original = periodo_de(instance.doctor_id, instance.fecha)
+
+@receiver(post_save, sender=Atencion)
+def atencion_guardada(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    actual = periodo_de(instance.doctor_id, instance.fecha)
+    original = getattr(instance, '_periodo_original', None)
+    periodos = {actual, original} - {None} if not created and original != actual else set()
+    marcar_para_recalculo(instance.pk if created else None, periodos)
+    instance._periodo_original = actual
+    _invalidar_al_confirmar(instance.doctor_id)
+    if original and original[0] != instance.doctor_id: # La atención pasó a otro doctor
+        _invalidar_al_confirmar(original[0])
+
+@receiver(post_delete, sender=Atencion)
+def atencion_borrada(sender, instance, **kwargs):
+    marcar_para_recalculo(periodos=[periodo_de(instance.doctor_id, instance.fecha)])
+    _invalidar_al_confirmar(instance.doctor_id)
+
+@receiver(post_save, sender=DetalleAtencion)
+@receiver(post_save, sender=ExamenAtencion)
+def detalle_guardado(sender, instance, raw=False, **kwargs):
+    if not raw:
+        marcar_para_recalculo(instance.atencion_id, _periodos_de_detalle(instance), modificada=True)
+        _invalidar_al_confirmar(instance.atencion.doctor_id)
+
+@receiver(post_delete, sender=DetalleAtencion)
+@receiver(post_delete, sender=ExamenAtencion)
+def detalle_borrado(sender, instance, origin=None, **kwargs):
+    if not _borrado_en_cascada_de_atencion(origin):
+        marcar_para_recalculo(instance.atencion_id, _periodos_de_detalle(instance), modificada=True)
+        _invalidar_al_confirmar(instance.atencion.doctor_id)
+
+
+# --- Cabecera en sesión (contexto.py) ---
+
+@receiver(post_save, sender=Doctor)
+def doctor_guardado(sender, instance, **kwargs):
+    invalidar_perfil(instance.user_id) # Sube también la versión de datos global
+
+@receiver(post_save, sender=User)
+def usuario_guardado(sender, instance, update_fields=None, **kwargs):
+    # El login solo actualiza last_login: no cambia nombre ni foto
+    if update_fields and set(update_fields) <= {'last_login'}:
+        return
+    invalidar_perfil(instance.pk)
+
+
+# --- Autocompletado de pacientes (autocompletar.py) ---
+
+@receiver(post_save, sender=Paciente)
+@receiver(post_delete, sender=Paciente)
+def paciente_cambiado(sender, **kwargs):
+    olvidar_autocompletado()
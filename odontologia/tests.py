@@ -1,3 +1,1543 @@
-from django.test import TestCase
+import base64
+import csv
+import datetime
+import io
+import random
+import re
+import tempfile
+import zipfile
+import time
+import zlib
+from decimal import Decimal
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+from unittest import mock
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.staticfiles import finders
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import DatabaseError, connection, transaction
+from django.db.models import Count, F
+from django.db.migrations.executor import MigrationExecutor
+from django.contrib.sessions.backends.db import SessionStore
+from django.test import Client, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from django.http import QueryDict
+from django.urls import reverse
+from django.utils import timezone
+from openpyxl import load_workbook
+from PIL import Image
+from . import rut, urls
+from .boletas import calcular_totales, recalculo_diferido
+from .agenda import AgendaDia
+from .autocompletar import buscar_pacientes, filtro_nombre, olvidar
+from .busqueda import buscar_atenciones, terminos
+from .contexto import cabecera, invalidar_perfil, obtener_doctor
+from .estadisticas import TTL_ESTADISTICAS, estadisticas_dashboard
+from .estaticos import comprobar, destino, recortar_css, vendorizar, CSS_POPPINS
+from .forms import validar_rut
+from .management.commands.benchmark_rut import validar_rut_original
+from .fotos import LADO_MINIATURA, TAMANO_MAXIMO, procesar_foto, ruta_miniatura, validar_foto
+from .middleware import huella
+from .nomina import _nombres_unicos, datos_nomina, generar_nomina_xlsx, generar_nomina_zip, nomina_en_archivo_temporal
+from .paginacion import codificar_cursor, decodificar_cursor, paginar_atenciones
+from .models import Atencion, Boleta, DetalleAtencion, Doctor, Paciente, ResumenMensualDoctor, TrabajoReporte, Tratamiento
+from .views import MAX_DIAS_RANGO_CALENDARIO
+from .resumenes import calcular_todo, CAMPOS_TOTALES
+from .sembrado import sembrar, limpiar
+from .versiones import clave_datos
+from .trabajos import MAX_INTENTOS, encolar, procesar, puede_ver, reencolar_abandonados, tomar_siguiente
+
+
+def _resultado_original(valor):
+    """(rut normalizado, None) si el algoritmo original del formulario lo acepta, o (None, mensaje de error)."""
+    try:
+        return validar_rut_original(valor), None
+    except ValidationError as e:
+        return None, e.messages[0]
+
+
+class RutPropiedadesTest(SimpleTestCase):
+    """
+    El módulo rut (y con él AtencionForm) debe aceptar, normalizar y rechazar exactamente
+    lo mismo que el algoritmo original del formulario.
+    """
+
+    CASOS = 5000
+
+    def setUp(self):
+        self.azar = random.Random(20240601)
+
+    def _cuerpo(self):
+        return self.azar.choice([
+            self.azar.randrange(1000000, 30000000),
+            self.azar.randrange(0, 1000000),
+            self.azar.randrange(30000000, 100000000),
+        ])
+
+    def _formatear(self, cuerpo, dv):
+        texto = str(cuerpo)
+        if self.azar.random() < 0.3:
+            texto = f"{cuerpo:,}".replace(',', '.')
+        if self.azar.random() < 0.3:
+            dv = dv.lower()
+        separador = self.azar.choice(['-', '-', '-', '', ' - ', '_'])
+        relleno = self.azar.choice(['', ' ', '\t', ' \n'])
+        return f"{relleno}{texto}{separador}{dv}{relleno}"
+
+    def _comparar(self, valor):
+        validado = rut.validar(valor)
+        esperado_rut, esperado_error = _resultado_original(valor)
+        self.assertEqual(validado.error, esperado_error, repr(valor))
+        if esperado_error is None:
+            self.assertEqual(validado.rut, esperado_rut, repr(valor))
+            self.assertEqual(validado.clave, int(esperado_rut.split('-')[0]))
+        else:
+            self.assertIsNone(validado.clave)
+        # El formulario valida con rut.py
+        try:
+            self.assertEqual((validar_rut(valor), None), (esperado_rut, esperado_error), repr(valor))
+        except ValidationError as e:
+            self.assertEqual((None, e.messages[0]), (esperado_rut, esperado_error), repr(valor))
+
+    def test_coincide_con_formulario_en_rut_generados(self):
+        for _ in range(self.CASOS):
+            cuerpo = self._cuerpo()
+            dv = self.azar.choice([rut.digito_verificador(cuerpo % 100000000), self.azar.choice('0123456789K')])
+            self._comparar(self._formatear(cuerpo, dv))
+
+    def test_coincide_con_formulario_en_texto_arbitrario(self):
+        alfabeto = '0123456789kK.- xX\t'
+        for _ in range(self.CASOS):
+            valor = ''.join(self.azar.choice(alfabeto) for _ in range(self.azar.randint(1, 14)))
+            self._comparar(valor)
+
+    def test_rut_valido_conocido(self):
+        self.assertEqual(rut.validar(' 12.345.678-5 ').rut, '12345678-5')
+        self.assertEqual(rut.clave_numerica('16666666-k'), 16666666)
+        self.assertFalse(rut.es_valido('12345678-0'))
+
+    def test_lote_mantiene_orden_y_resultados(self):
+        valores = [self._formatear(self._cuerpo(), self.azar.choice('0123456789K')) for _ in range(500)]
+        valores += valores[:100] # repetidos
+        self.assertEqual(rut.validar_lote(valores), [rut.validar(v) for v in valores])
+
+    def test_digito_verificador_coincide_con_algoritmo_del_formulario(self):
+        cuerpos = [rut.RUT_MINIMO, 9999999, 10000000, 12345678, rut.RUT_MAXIMO - 1]
+        cuerpos += [self.azar.randrange(rut.RUT_MINIMO, rut.RUT_MAXIMO) for _ in range(500)]
+        for cuerpo in cuerpos:
+            aceptados = [dv for dv in '0123456789K' if _resultado_original(f"{cuerpo}-{dv}")[1] is None]
+            self.assertEqual(aceptados, [rut.digito_verificador(cuerpo)], cuerpo)
+
+
+class SembradoTest(TestCase):
+    """Los datos sintéticos deben quedar igual que si se hubieran ingresado por el formulario."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.creado = sembrar(600, doctores=3, dias=60, semilla=7, lote=250)
+
+    def test_cantidades(self):
+        self.assertEqual(self.creado['atenciones'], 600)
+        self.assertEqual(Atencion.objects.count(), 600)
+        self.assertEqual(Atencion.objects.filter(paciente__rut=F('paciente_rut')).count(), 600)
+
+    def test_sin_horas_repetidas(self):
+        for campos in (('doctor', 'fecha', 'hora_atencion'), ('paciente_rut', 'fecha', 'hora_atencion')):
+            repetidas = Atencion.objects.values(*campos).annotate(n=Count('pk')).filter(n__gt=1)
+            self.assertFalse(repetidas.exists(), campos)
+
+    def test_boletas_y_resumenes_coinciden_con_los_detalles(self):
+        esperadas = calcular_totales(Atencion.objects.values_list('pk', flat=True))
+        actuales = {
+            b.atencion_id: (b.total_tratamientos, b.total_examenes, b.ganancia_neta_doctor) for b in Boleta.objects.all()
+        }
+        self.assertEqual(actuales, esperadas)
+        clave = lambda f: (f.doctor_id, f.anio, f.mes, f.especialidad, *(getattr(f, c) for c in CAMPOS_TOTALES))
+        self.assertEqual(sorted(map(clave, ResumenMensualDoctor.objects.all())), sorted(map(clave, calcular_todo())))
+
+    def test_dia_con_mas_atenciones_que_pacientes_minimos(self):
+        # Un lunes con 3 doctores y más atenciones que los 50 pacientes mínimos
+        creado = sembrar(60, doctores=3, dias=1, hasta=datetime.date(2026, 3, 2), semilla=3)
+        self.assertGreater(creado['atenciones'], 50)
+        self.assertGreaterEqual(creado['pacientes'], creado['atenciones'])
+        repetidas = Atencion.objects.filter(fecha=datetime.date(2026, 3, 2)).values('paciente_rut').annotate(n=Count('pk'))
+        self.assertFalse(repetidas.filter(n__gt=1).exists())
+
+    def test_limpiar_borra_solo_lo_sembrado(self):
+        real = Paciente.objects.create(rut='12345678-5', nombre='Real')
+        self.assertEqual(limpiar(), 600)
+        self.assertFalse(Atencion.objects.exists())
+        self.assertEqual(list(Paciente.objects.all()), [real])
+
+
+class PresupuestoConsultasTest(TestCase):
+    """
+    Cada ruta con nombre de odontologia/urls.py tiene un máximo de consultas por
+    petición, para administrador y para doctor, que no debe crecer con los datos: una
+    consulta perezosa nueva (un FK leído en un ciclo de la plantilla) hace fallar el
+    test y lista el SQL ejecutado.
+    """
+
+    # nombre de la ruta: ((máximo, estado) como administrador, (máximo, estado) como doctor
+    # [, 'post']). Incluye las consultas de sesión, usuario y versión del perfil, y la escritura de la sesión
+    # en la primera página que guarda los datos de la cabecera (ver contexto.py). Las rutas
+    # que solo aceptan POST se miden con el cuerpo de _parametros; un 302 esperado es una
+    # redirección propia de la ruta (por rol o al terminar), no una página sin medir. Sin
+    # worker (REPORTES_CON_WORKER) las rutas que encolan reportes también los generan.
+    PRESUPUESTO = {
+        'index': ((2, 302), (2, 302)),
+        'login': ((2, 200), (7, 200)),
+        'logout': ((4, 302), (4, 302), 'post'),
+        'dashboard': ((6, 200), (10, 200)),
+        'registrar_atencion': ((3, 302), (8, 200)),
+        'ver_perfil': ((3, 302), (7, 200)),
+        'editar_perfil': ((3, 302), (8, 302), 'post'),
+        'detalle_atencion': ((7, 200), (11, 200)),
+        'ver_calendario': ((2, 200), (7, 200)),
+        'calendario_eventos_json': ((3, 200), (4, 200)),
+        'atencion_json': ((6, 200), (6, 200)),
+        'atenciones_json': ((7, 200), (7, 200)),
+        'autocompletar_pacientes': ((3, 403), (4, 200)),
+        'agenda_libre': ((4, 200), (4, 200)),
+        'editar_atencion': ((6, 200), (10, 200)),
+        'eliminar_atencion': ((4, 200), (8, 200)),
+        'lista_doctores': ((3, 200), (2, 302)),
+        'exportar_nomina': ((9, 302), (2, 302), 'post'),
+        'atenciones_por_doctor': ((7, 200), (2, 302)),
+        'resumen_financiero_doctor': ((5, 200), (2, 302)),
+        'descargar_excel_doctor': ((10, 302), (2, 302), 'post'),
+        'lista_atenciones': ((5, 200), (9, 200)),
+        'estado_reporte': ((3, 200), (8, 200)),
+        'estado_reporte_json': ((3, 200), (3, 200)),
+        'descargar_reporte': ((3, 200), (3, 200)),
+    }
+
+    @classmethod
+    def setUpClass(cls):
+        # El reporte listo se guarda en un MEDIA_ROOT temporal
+        cls.enterClassContext(override_settings(MEDIA_ROOT=cls.enterClassContext(tempfile.TemporaryDirectory())))
+        super().setUpClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        creado = sembrar(120, doctores=2, dias=40, semilla=11)
+        cls.admin = creado['admin']
+        cls.doctor = creado['doctores'][0]
+        cls.trabajo = TrabajoReporte.objects.create(
+            tipo='EXCEL_DOCTOR', parametros={'doctor_id': cls.doctor.pk}, solicitado_por=cls.doctor.user,
+            estado='LISTO', nombre_archivo='ganancias.xlsx',
+        )
+        cls.trabajo.archivo.save('ganancias.xlsx', ContentFile(b'xlsx'))
+        # Con la versión del perfil ya creada editar_perfil mide siempre un solo UPDATE
+        invalidar_perfil(cls.doctor.user_id)
+
+    def _argumentos(self, nombre, patron):
+        if not patron.pattern.converters:
+            return []
+        if 'reporte' in nombre:
+            return [self.trabajo.pk]
+        if 'atencion' in nombre and 'atenciones' not in nombre:
+            return [Atencion.objects.filter(doctor=self.doctor).latest('fecha', 'hora_atencion', 'pk').pk]
+        if 'doctor' in nombre:
+            return [self.doctor.pk]
+        self.fail(f"La ruta '{nombre}' tiene parámetros: indique cuáles usar en _argumentos.")
+
+    def _parametros(self, nombre):
+        """Parámetros GET, o el cuerpo de las rutas que se miden con POST."""
+        if nombre == 'autocompletar_pacientes':
+            return {'q': 'ma'}
+        if nombre == 'agenda_libre':
+            hoy = timezone.localdate()
+            return {'desde': hoy.isoformat(), 'hasta': (hoy + datetime.timedelta(days=6)).isoformat()}
+        if nombre in ('calendario_eventos_json', 'atenciones_json'):
+            hoy = timezone.localdate()
+            return {'start': (hoy - datetime.timedelta(days=7)).isoformat(), 'end': (hoy + datetime.timedelta(days=35)).isoformat()}
+        if nombre == 'exportar_nomina':
+            return {'periodo': timezone.localdate().strftime('%Y-%m'), 'formato': 'xlsx'}
+        if nombre == 'editar_perfil':
+            usuario = self.doctor.user
+            return {
+                'first_name': usuario.first_name, 'last_name': usuario.last_name, 'email': usuario.email,
+                'rut': self.doctor.rut, 'fecha_nacimiento': self.doctor.fecha_nacimiento.isoformat(),
+            }
+        return {}
+
+    def _medir(self):
+        """{(nombre, rol): (estado, lista de SQL)} de cada ruta, con sesión y caché vacías."""
+        medidas = {}
+        for patron in urls.urlpatterns:
+            nombre = patron.name
+            url = reverse(nombre, args=self._argumentos(nombre, patron))
+            metodo = self.PRESUPUESTO.get(nombre, ((), (), 'get'))[2:] or ('get',)
+            for rol, usuario in (('admin', self.admin), ('doctor', self.doctor.user)):
+                cliente = Client()
+                cliente.force_login(usuario)
+                cache.clear()
+                olvidar()
+                # Cada medición encola su propio reporte (no reutiliza uno pendiente de la anterior)
+                TrabajoReporte.objects.exclude(pk=self.trabajo.pk).delete()
+                with CaptureQueriesContext(connection) as consultas:
+                    respuesta = getattr(cliente, metodo[0])(url, self._parametros(nombre))
+                medidas[nombre, rol] = (respuesta.status_code, [c['sql'] for c in consultas])
+        return medidas
+
+    def _revisar(self, medidas):
+        for (nombre, rol), (estado, consultas) in medidas.items():
+            with self.subTest(ruta=nombre, rol=rol):
+                self.assertIn(nombre, self.PRESUPUESTO, f"La ruta '{nombre}' no tiene presupuesto de consultas declarado.")
+                maximo, estado_esperado = self.PRESUPUESTO[nombre][rol == 'doctor']
+                self.assertEqual(estado, estado_esperado, f"{nombre} ({rol}) respondió {estado}.")
+                if len(consultas) > maximo:
+                    detalle = '\n'.join(f"  {i}. {sql}" for i, sql in enumerate(consultas, 1))
+                    self.fail(f"{nombre} ({rol}) hizo {len(consultas)} consultas (máximo {maximo}):\n{detalle}")
+
+    def test_presupuesto_constante_con_mas_datos(self):
+        pocos = self._medir()
+        self._revisar(pocos)
+        # Diez veces más atenciones para el mismo doctor (en días anteriores) y para otros doctores
+        sembrar(1200, doctores=[self.doctor], dias=400, hasta=timezone.localdate() - datetime.timedelta(days=40), semilla=12)
+        sembrar(600, doctores=2, dias=40, semilla=13)
+        muchos = self._medir()
+        self._revisar(muchos)
+        for clave, (_, consultas) in muchos.items():
+            with self.subTest(ruta=clave[0], rol=clave[1]):
+                self.assertEqual(len(consultas), len(pocos[clave][1]), f"{clave}: la cantidad de consultas creció con los datos.")
+
+
+class RespuestaCondicionalTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        creado = sembrar(30, doctores=1, dias=10, semilla=5)
+        cls.doctor = creado['doctores'][0]
+        cls.atencion = Atencion.objects.filter(doctor=cls.doctor).latest('pk')
+
+    def setUp(self):
+        self.client.force_login(self.doctor.user)
+        self.url = reverse('atencion_json', args=[self.atencion.pk])
+
+    def test_atencion_json_responde_304_hasta_que_cambia_un_detalle(self):
+        etag = self.client.get(self.url)['ETag']
+        with self.assertNumQueries(4): # sesión, usuario, doctor y `actualizado`
+            self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        detalle = self.atencion.detalles.first()
+        detalle.descripcion = 'Otra descripción'
+        detalle.save()
+        respuesta = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertNotEqual(respuesta['ETag'], etag)
+
+    def test_lista_responde_304_y_cambia_al_borrar_una_fila(self):
+        url = reverse('lista_atenciones')
+        self.client.get(url) # Deja la cookie CSRF, que forma parte del ETag
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        with self.captureOnCommitCallbacks(execute=True): # La versión de datos sube al confirmar
+            self.atencion.delete()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_version_compartida_entre_procesos(self):
+        url = reverse('lista_atenciones')
+        self.client.get(url)
+        etag = self.client.get(url)['ETag']
+        # Otro worker (caché vacía) calcula el mismo ETag
+        cache.clear()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        # Una carga masiva (otro proceso: sin señales ni caché compartida) lo cambia
+        sembrar(3, doctores=[self.doctor], dias=20, hasta=timezone.localdate() - datetime.timedelta(days=30), semilla=7)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class AtencionesLoteTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        creado = sembrar(60, doctores=2, dias=14, semilla=6)
+        cls.admin = creado['admin']
+        cls.doctor, cls.otro = creado['doctores']
+
+    def test_lote_igual_a_una_por_una_y_solo_del_doctor(self):
+        self.client.force_login(self.doctor.user)
+        hoy = timezone.localdate()
+        ventana = {'start': (hoy - datetime.timedelta(days=13)).isoformat(), 'end': (hoy + datetime.timedelta(days=1)).isoformat()}
+        with self.assertNumQueries(7): # sesión, usuario, doctor, versiones del perfil y de datos, atenciones y detalles
+            respuesta = self.client.get(reverse('atenciones_json'), ventana)
+        lote = respuesta.json()['atenciones']
+        self.assertEqual(set(lote), {str(pk) for pk in Atencion.objects.filter(doctor=self.doctor).values_list('pk', flat=True)})
+        pk = next(iter(lote))
+        self.assertEqual(lote[pk], self.client.get(reverse('atencion_json', args=[pk])).json())
+        # Por ids: las de otro doctor no aparecen
+        ajena = Atencion.objects.filter(doctor=self.otro).first()
+        por_ids = self.client.get(reverse('atenciones_json'), {'ids': f'{pk},{ajena.pk}'}).json()['atenciones']
+        self.assertEqual(list(por_ids), [pk])
+        self.assertEqual(self.client.get(reverse('atenciones_json'), {'ids': 'x'}).status_code, 400)
+
+    def test_responde_304_hasta_que_cambia_un_detalle(self):
+        self.client.force_login(self.admin)
+        atencion = Atencion.objects.filter(doctor=self.doctor).latest('pk')
+        url = reverse('atenciones_json') + f'?ids={atencion.pk}'
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        with self.captureOnCommitCallbacks(execute=True):
+            atencion.detalles.create(descripcion='Sellante', valor=5000)
+        respuesta = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.json()['atenciones'][str(atencion.pk)]['detalles'][-1]['descripcion'], 'Sellante')
+
+
+class FragmentosVersionadosTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        creado = sembrar(30, doctores=2, dias=10, semilla=6)
+        cls.admin = creado['admin']
+        cls.doctor, cls.otro = creado['doctores']
+
+    def setUp(self):
+        cache.clear()
+
+    def _consultas_de_atenciones(self, url):
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = self.client.get(url)
+        self.assertEqual(respuesta.status_code, 200)
+        return respuesta, [q['sql'] for q in consultas if 'odontologia_atencion' in q['sql']]
+
+    def test_tabla_sin_cambios_no_consulta_atenciones(self):
+        self.client.force_login(self.doctor.user)
+        url = reverse('lista_atenciones')
+        _, consultas = self._consultas_de_atenciones(url)
+        self.assertTrue(consultas)
+        segunda, consultas = self._consultas_de_atenciones(url)
+        self.assertEqual(consultas, [])
+        self.assertContains(segunda, Atencion.objects.filter(doctor=self.doctor).latest('fecha', 'hora_atencion').paciente_rut)
+
+    def test_guardar_invalida_solo_al_doctor_y_al_global(self):
+        atencion = Atencion.objects.filter(doctor=self.doctor).latest('fecha', 'hora_atencion')
+        urls = {
+            self.doctor.user: reverse('lista_atenciones'),
+            self.otro.user: reverse('lista_atenciones'),
+            self.admin: reverse('atenciones_por_doctor', args=[self.doctor.pk]),
+        }
+        for usuario, url in urls.items():
+            self.client.force_login(usuario)
+            self.client.get(url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            atencion.paciente_nombre = 'Renombrado'
+            atencion.save()
+
+        for usuario, url in urls.items():
+            self.client.force_login(usuario)
+            respuesta, consultas = self._consultas_de_atenciones(url)
+            if usuario == self.otro.user:
+                self.assertEqual(consultas, [])
+            else:
+                self.assertContains(respuesta, 'Renombrado')
+
+
+class BusquedaTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        creado = sembrar(40, doctores=1, dias=10, semilla=7)
+        cls.doctor = creado['doctores'][0]
+        base = Atencion.objects.filter(doctor=cls.doctor).earliest('fecha', 'hora_atencion')
+        cls.por_nombre = cls._copiar(base, paciente_nombre='Ramón', paciente_apellido='Núñez', paciente_rut='15432198-7', motivo_visita='Control')
+        cls.por_detalle = cls._copiar(base, paciente_nombre='Inés', paciente_apellido='Soto', paciente_rut='9876543-3', motivo_visita='Dolor')
+        cls.por_detalle.detalles.create(especialidad='ENDO', descripcion='Endodoncia molar, paciente Nuñez derivado')
+
+    @staticmethod
+    def _copiar(base, **campos):
+        atencion = Atencion.objects.get(pk=base.pk)
+        atencion.pk = None
+        atencion.fecha = base.fecha - datetime.timedelta(days=30)
+        for campo, valor in campos.items():
+            setattr(atencion, campo, valor)
+        atencion.save()
+        return atencion
+
+    def _buscar(self, texto):
+        return list(buscar_atenciones(Atencion.objects.all(), texto))
+
+    def test_terminos(self):
+        self.assertEqual(terminos(' Pérez  12.345.678-k control_dental '), ['Pérez', '12345678k', 'control', 'dental'])
+
+    def test_busca_sin_acentos_por_prefijo_y_ordena_por_relevancia(self):
+        resultados = self._buscar('nunez')
+        self.assertEqual(resultados[:2], [self.por_nombre, self.por_detalle]) # Nombre antes que tratamiento
+        self.assertEqual(self._buscar('RAMON nuñ'), [self.por_nombre])
+        self.assertEqual(self._buscar('15.432.198-7'), [self.por_nombre])
+        self.assertEqual(self._buscar('1543219'), [self.por_nombre])
+        self.assertEqual(self._buscar('endodoncia ines'), [self.por_detalle])
+        self.assertEqual(self._buscar('-- --'), [])
+
+    def test_indice_sigue_a_los_cambios(self):
+        detalle = self.por_detalle.detalles.get()
+        detalle.descripcion = 'Limpieza'
+        detalle.save()
+        self.assertEqual(self._buscar('endodoncia ines'), [])
+        self.por_nombre.paciente_apellido = 'Fuentes'
+        self.por_nombre.save()
+        self.assertEqual(self._buscar('ramon fuentes'), [self.por_nombre])
+        self.por_nombre.delete()
+        self.assertEqual(self._buscar('ramon'), [])
+
+    def test_lista_pagina_resultados_por_relevancia(self):
+        self.client.force_login(self.doctor.user)
+        respuesta = self.client.get(reverse('lista_atenciones'), {'q': 'nunez', 'por_pagina': 1})
+        self.assertEqual(list(respuesta.context['atenciones']), [self.por_nombre])
+        self.assertEqual(respuesta.context['pagina'].url_siguiente, '?q=nunez&por_pagina=1&pagina=2')
+        respuesta = self.client.get(reverse('lista_atenciones') + respuesta.context['pagina'].url_siguiente)
+        self.assertEqual(list(respuesta.context['atenciones']), [self.por_detalle])
+
+class AutocompletarPacientesTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = sembrar(10, doctores=1, dias=5, semilla=8)['doctores'][0]
+        cls.paciente = Paciente.objects.create(rut='15432198-7', nombre='Mariela', apellido='Zúñiga', celular='+56911111111')
+
+    def setUp(self):
+        olvidar()
+
+    def test_busca_por_prefijo_de_rut_o_de_nombre(self):
+        for texto in ('15.432', '15432198-7', 'MARIE', 'zúñ mar'):
+            with self.subTest(texto=texto):
+                self.assertIn('15432198-7', [p['rut'] for p in buscar_pacientes(texto)])
+        self.assertEqual(buscar_pacientes('m'), [])
+
+    def test_nombres_compuestos(self):
+        Paciente.objects.create(rut='12345678-5', nombre='María José', apellido='Pérez Soto')
+        for texto in ('maría jo', 'josé', 'maría josé pérez so', 'soto mar'):
+            with self.subTest(texto=texto):
+                self.assertIn('12345678-5', [p['rut'] for p in buscar_pacientes(texto)])
+        self.assertNotIn('12345678-5', [p['rut'] for p in buscar_pacientes('osé')])
+
+    def test_filtro_por_motor(self):
+        # PostgreSQL: prefijos en el tsvector indexado (0022), sin LIKE '%...'
+        for palabras, consulta in ((['maría', 'jo'], 'maría:* & jo:*'), (["ana-maría", "o'higgins"], 'ana:* & maría:* & o:* & higgins:*')):
+            with self.subTest(palabras=palabras):
+                (campo, subconsulta), = filtro_nombre(palabras, 'postgresql').children
+                self.assertEqual(campo, 'pk__in')
+                self.assertIn("to_tsquery('simple', %s)", subconsulta.sql)
+                self.assertEqual(subconsulta.params, (consulta,))
+        self.assertEqual(filtro_nombre(['&!'], 'postgresql').children, [('pk__in', [])])
+        # Otros motores: istartswith primero, icontains solo para las palabras siguientes del campo
+        campos = [c for c, _ in filtro_nombre(['jo'], 'sqlite').children]
+        self.assertEqual(campos, ['nombre__istartswith', 'apellido__istartswith', 'nombre__icontains', 'apellido__icontains'])
+
+    def test_contacto_solo_con_el_rut_exacto(self):
+        self.assertNotIn('celular', buscar_pacientes('15.432.1')[0])
+        self.assertNotIn('celular', buscar_pacientes('mariela')[0])
+        self.assertEqual(buscar_pacientes('15.432.198-7')[0]['celular'], '+56911111111')
+
+    def test_lru_se_vacia_al_cambiar_una_ficha(self):
+        buscar_pacientes('15432198-7')
+        with self.assertNumQueries(0):
+            buscar_pacientes(' 15432198-7 ')
+        self.paciente.celular = '+56922222222'
+        self.paciente.save()
+        self.assertEqual(buscar_pacientes('15432198-7')[0]['celular'], '+56922222222')
+
+    def test_endpoint(self):
+        self.client.force_login(self.doctor.user)
+        respuesta = self.client.get(reverse('autocompletar_pacientes'), {'q': 'mariela z'})
+        self.assertEqual(respuesta.json()['resultados'], [{
+            'rut': '15432198-7', 'nombre': 'Mariela', 'apellido': 'Zúñiga', 'sexo': 'O',
+        }])
+        self.assertIn('max-age=30', respuesta['Cache-Control'])
+        # Solo quien puede registrar atenciones (un doctor) consulta las fichas
+        self.client.force_login(User.objects.create_user('recepcion'))
+        self.assertEqual(self.client.get(reverse('autocompletar_pacientes'), {'q': 'mariela z'}).status_code, 403)
+
+class AgendaTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        creado = sembrar(10, doctores=2, dias=5, semilla=9)
+        cls.admin = creado['admin']
+        cls.doctor, cls.otro = creado['doctores']
+        cls.endodoncia = Tratamiento.objects.create(nombre='Endodoncia', duracion_aproximada=60)
+        # Un lunes lejos de los días sembrados, con una atención de 10:00 a 11:00
+        hoy = timezone.localdate()
+        cls.lunes = hoy + datetime.timedelta(days=63 - hoy.weekday())
+        cls.ocupada = Atencion.objects.create(
+            doctor=cls.doctor, fecha=cls.lunes, hora_atencion=datetime.time(10), duracion=60,
+            paciente_nombre='Rosa', paciente_apellido='Vera', paciente_rut='22222222-2',
+        )
+
+    def setUp(self):
+        self.client.force_login(self.doctor.user)
+
+    def _registrar(self, hora, tratamiento=''):
+        return self.client.post(reverse('registrar_atencion'), {
+            'paciente_nombre': 'Ana', 'paciente_apellido': 'Soto', 'paciente_rut': '11111111-1', 'paciente_edad': 30,
+            'paciente_sexo': 'F', 'fecha': self.lunes.isoformat(), 'hora_atencion': hora, 'motivo_visita': 'Control',
+            'metodo_pago': 'EF', 'detalles-TOTAL_FORMS': 1, 'detalles-INITIAL_FORMS': 0,
+            'detalles-0-especialidad': 'OTRO', 'detalles-0-tratamiento': tratamiento,
+            'detalles-0-descripcion': 'Control', 'detalles-0-valor': '10000',
+        })
+
+    def test_agenda_dia(self):
+        dia = AgendaDia([(600, 660, 2), (540, 570, 1), (615, 630, 3)])
+        self.assertEqual(dia.choques(560, 610), [(540, 570, 1), (600, 660, 2)])
+        self.assertEqual(dia.choques(560, 620, excluir=2), [(540, 570, 1), (615, 630, 3)])
+        self.assertEqual(dia.choques(570, 600), [])
+        self.assertEqual(dia.libres(540, 720, 30), [570, 660, 675, 690])
+        self.assertEqual(dia.libres(540, 720, 30, desde=661), [675, 690])
+
+    def test_registrar_rechaza_choques_segun_la_duracion(self):
+        respuesta = self._registrar('10:30')
+        self.assertIn('se cruza', respuesta.context['form'].errors['hora_atencion'][0])
+        # 60 minutos desde las 9:15 chocan con la atención de las 10:00; 30 minutos no
+        respuesta = self._registrar('09:15', self.endodoncia.pk)
+        self.assertIn('hora_atencion', respuesta.context['form'].errors)
+        self.assertRedirects(self._registrar('09:15'), reverse('dashboard'))
+        self.assertEqual(Atencion.objects.get(doctor=self.doctor, paciente_rut='11111111-1').duracion, 30)
+
+    def test_restricciones_de_la_base_se_muestran_como_errores_del_formulario(self):
+        Atencion.objects.create(
+            doctor=self.otro, fecha=self.lunes, hora_atencion=datetime.time(16),
+            paciente_nombre='Ana', paciente_apellido='Soto', paciente_rut='11111111-1',
+        )
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = self._registrar('16:00')
+        self.assertEqual(respuesta.context['form'].non_field_errors(), ['El paciente con RUT 11111111-1 ya tiene hora ese día a esa misma hora.'])
+        # Sin lecturas previas al INSERT para revisar horarios
+        self.assertFalse([c['sql'] for c in consultas if c['sql'].startswith('SELECT') and '"paciente_rut" =' in c['sql']])
+        # Fuera de los formularios (p. ej. el shell) full_clean() la sigue revisando
+        duplicada = Atencion(
+            doctor=self.doctor, fecha=self.lunes, hora_atencion=datetime.time(16),
+            paciente_nombre='Ana', paciente_apellido='Soto', paciente_rut='11111111-1',
+        )
+        with self.assertRaises(ValidationError):
+            duplicada.full_clean()
+        # Un choque que aparece al cambiar los tratamientos de una atención ya guardada
+        self.assertRedirects(self._registrar('11:00'), reverse('dashboard'))
+        nueva = Atencion.objects.get(doctor=self.doctor, paciente_rut='11111111-1')
+        editar = {
+            'paciente_nombre': 'Ana', 'paciente_apellido': 'Soto', 'paciente_rut': '11111111-1', 'paciente_edad': 30,
+            'paciente_sexo': 'F', 'fecha': self.lunes.isoformat(), 'hora_atencion': '09:30', 'motivo_visita': 'Control',
+            'metodo_pago': 'EF', 'detalles-TOTAL_FORMS': 1, 'detalles-INITIAL_FORMS': 0,
+            'detalles-0-especialidad': 'OTRO', 'detalles-0-tratamiento': self.endodoncia.pk,
+            'detalles-0-descripcion': 'Endodoncia', 'detalles-0-valor': '10000',
+        }
+        respuesta = self.client.post(reverse('editar_atencion', args=[nueva.pk]), editar)
+        self.assertEqual(respuesta.context['form'].errors['hora_atencion'], [
+            'El doctor ya tiene una atención de 10:00 a 11:00 que se cruza con este horario (60 min).',
+        ])
+        nueva.refresh_from_db()
+        self.assertEqual((nueva.hora_atencion, nueva.duracion), (datetime.time(11), 30))
+
+    def _admin(self, hora, rut='11111111-1', doctor=None):
+        self.client.force_login(self.admin)
+        return self.client.post(reverse('admin:odontologia_atencion_add'), {
+            'doctor': (doctor or self.doctor).pk, 'fecha': self.lunes.isoformat(), 'hora_atencion': hora, 'motivo_visita': 'Control',
+            'metodo_pago': 'EF', 'paciente_nombre': 'Ana', 'paciente_apellido': 'Soto', 'paciente_rut': rut,
+            'paciente_sexo': 'F', 'detalles-TOTAL_FORMS': 0, 'detalles-INITIAL_FORMS': 0,
+        })
+
+    def test_admin_muestra_los_choques_como_error(self):
+        respuesta = self._admin('10:30')
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.context['adminform'].form.errors['hora_atencion'], [
+            'El doctor ya tiene una atención de 10:00 a 11:00 que se cruza con este horario (30 min).',
+        ])
+        self.assertFalse(Atencion.objects.filter(paciente_rut='11111111-1').exists())
+        self.assertEqual(self._admin('11:00').status_code, 302)
+
+    def test_admin_muestra_horarios_repetidos_como_error(self):
+        respuesta = self._admin('10:00', rut='22222222-2', doctor=self.otro)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.context['adminform'].form.non_field_errors(), [
+            'El paciente con RUT 22222222-2 ya tiene hora ese día a esa misma hora.',
+        ])
+        self.assertEqual(Atencion.objects.filter(paciente_rut='22222222-2').count(), 1)
+
+    def test_duracion_sigue_a_los_detalles(self):
+        self.ocupada.detalles.create(descripcion='Endodoncia', tratamiento=self.endodoncia, valor=0)
+        self.ocupada.detalles.create(descripcion='Endodoncia', tratamiento=self.endodoncia, valor=0)
+        self.ocupada.refresh_from_db()
+        self.assertEqual(self.ocupada.duracion, 120)
+
+    def test_endpoint_horas_libres(self):
+        with self.assertNumQueries(5): # sesión, usuario, doctor, catálogo y agenda
+            respuesta = self.client.get(reverse('agenda_libre'), {'fecha': self.lunes.isoformat(), 'tratamiento': self.endodoncia.pk})
+        datos = respuesta.json()
+        self.assertEqual(datos['duracion'], 60)
+        horas = datos['doctores'][0]['dias'][self.lunes.isoformat()]
+        self.assertEqual(horas[:3], ['09:00', '11:00', '11:15'])
+        self.assertEqual(horas[-1], '19:00')
+        domingo = self.lunes - datetime.timedelta(days=1)
+        self.assertEqual(self.client.get(reverse('agenda_libre'), {'fecha': domingo.isoformat()}).json()['doctores'][0]['dias'], {})
+        self.assertEqual(self.client.get(reverse('agenda_libre'), {'desde': self.lunes.isoformat(), 'hasta': '2000-01-01'}).status_code, 400)
+
+
+class FichaPacienteTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = sembrar(0, doctores=1, dias=1, semilla=4)['doctores'][0]
+        cls.atencion = Atencion.objects.create(
+            doctor=cls.doctor, fecha=datetime.date(2026, 3, 2), hora_atencion=datetime.time(10),
+            paciente_nombre='Rsoa', paciente_apellido='Vera', paciente_rut='22222222-2',
+        )
+        Atencion.objects.create(
+            doctor=cls.doctor, fecha=datetime.date(2026, 3, 2), hora_atencion=datetime.time(12),
+            paciente_nombre='Ana', paciente_apellido='Soto', paciente_rut='11111111-1',
+        )
+
+    def setUp(self):
+        self.client.force_login(self.doctor.user)
+
+    def _datos(self, nombre, rut='22222222-2', hora='10:00'):
+        return {
+            'paciente_nombre': nombre, 'paciente_apellido': 'Vera', 'paciente_rut': rut, 'paciente_edad': 40,
+            'paciente_sexo': 'F', 'fecha': '2026-03-02', 'hora_atencion': hora, 'motivo_visita': 'Control',
+            'metodo_pago': 'EF', 'detalles-TOTAL_FORMS': 1, 'detalles-INITIAL_FORMS': 0,
+            'detalles-0-especialidad': 'OTRO', 'detalles-0-descripcion': 'Control', 'detalles-0-valor': '10000',
+        }
+
+    def test_editar_la_propia_atencion_corrige_el_nombre_de_la_ficha(self):
+        respuesta = self.client.post(reverse('editar_atencion', args=[self.atencion.pk]), self._datos('Rosa'))
+        self.assertEqual(respuesta.status_code, 302)
+        self.assertEqual(Paciente.objects.get(rut='22222222-2').nombre, 'Rosa')
+        self.assertEqual(Atencion.objects.get(pk=self.atencion.pk).paciente_nombre, 'Rosa')
+
+    def test_otro_nombre_con_un_rut_existente_sigue_siendo_conflicto(self):
+        # Una atención nueva con el RUT de la ficha
+        respuesta = self.client.post(reverse('registrar_atencion'), self._datos('Rosa', hora='15:00'))
+        self.assertIn('Conflicto', respuesta.context['form'].errors['paciente_rut'][0])
+        # Cambiar el RUT de la atención al de otra ficha
+        respuesta = self.client.post(reverse('editar_atencion', args=[self.atencion.pk]), self._datos('Rsoa', rut='11111111-1'))
+        self.assertIn('Conflicto', respuesta.context['form'].errors['paciente_rut'][0])
+        self.assertEqual(Paciente.objects.get(rut='22222222-2').nombre, 'Rsoa')
+        self.assertEqual(Paciente.objects.get(rut='11111111-1').nombre, 'Ana')
+
+
+class MigracionesDatosTest(TransactionTestCase):
+    def _migrar(self, migracion):
+        executor = MigrationExecutor(connection)
+        destino = [('odontologia', migracion)] if migracion else executor.loader.graph.leaf_nodes()
+        executor.migrate(destino)
+        executor.loader.build_graph()
+        return executor.loader.project_state(destino).apps
+
+    def tearDown(self):
+        self._migrar(None)
+
+    def test_poblar_pacientes(self):
+        # 0012_paciente_ficha_maestra: una ficha por RUT normalizado, vinculada a sus atenciones
+        apps = self._migrar('0011_resumenmensualdoctor')
+        User = apps.get_model('auth', 'User')
+        Doctor = apps.get_model('odontologia', 'Doctor')
+        PacienteAntiguo = apps.get_model('odontologia', 'Paciente')
+        AtencionAntigua = apps.get_model('odontologia', 'Atencion')
+        doctor = Doctor.objects.create(user=User.objects.create(username='dra'), rut='9999999-9')
+        PacienteAntiguo.objects.create(rut='12.345.678-k', nombre='Ficha previa')
+        PacienteAntiguo.objects.create(rut='12345678-K', nombre='Ficha duplicada')
+        filas = [
+            ('12.345.678-k', 'Vieja', datetime.date(2026, 1, 5)),
+            ('11111111-1 ', 'Ana', datetime.date(2026, 1, 5)),
+            ('11.111.111-1', 'Anita', datetime.date(2026, 2, 5)),
+        ]
+        for rut_original, nombre, fecha in filas:
+            AtencionAntigua.objects.create(
+                doctor=doctor, fecha=fecha, hora_atencion=datetime.time(10), paciente_rut=rut_original,
+                paciente_nombre=nombre, paciente_apellido='Soto', paciente_sexo='F', paciente_email=f'{nombre}@x.cl',
+            )
+
+        apps = self._migrar('0012_paciente_ficha_maestra')
+        Paciente = apps.get_model('odontologia', 'Paciente')
+        Atencion = apps.get_model('odontologia', 'Atencion')
+        fichas = {p.rut: p for p in Paciente.objects.all()}
+        self.assertEqual(sorted(fichas), ['11111111-1', '12345678-K'])
+        # La ficha previa se conserva; la nueva toma los datos de la atención más reciente
+        self.assertEqual(fichas['12345678-K'].nombre, 'Ficha previa')
+        self.assertEqual((fichas['11111111-1'].nombre, fichas['11111111-1'].email), ('Anita', 'Anita@x.cl'))
+        self.assertEqual(
+            sorted(Atencion.objects.values_list('paciente_rut', 'paciente_id')),
+            [('11111111-1', fichas['11111111-1'].pk)] * 2 + [('12345678-K', fichas['12345678-K'].pk)],
+        )
+
+    def test_restricciones_de_horario_revisan_los_datos_antes(self):
+        # 0020_atencion_restricciones se detiene listando lo que violaría las restricciones
+        apps = self._migrar('0019_atencion_duracion')
+        User = apps.get_model('auth', 'User')
+        Doctor = apps.get_model('odontologia', 'Doctor')
+        AtencionAntigua = apps.get_model('odontologia', 'Atencion')
+        doctor = Doctor.objects.create(user=User.objects.create(username='dra'), rut='9999999-9')
+        manana = timezone.localdate() + datetime.timedelta(days=1)
+        ayer = timezone.localdate() - datetime.timedelta(days=1)
+        filas = [
+            (manana, datetime.time(10), 60, '11111111-1'),
+            (manana, datetime.time(10, 30), 30, '22222222-2'),  # se cruza con la anterior
+            (ayer, datetime.time(10), 30, '33333333-3'),
+            (ayer, datetime.time(10), 30, '33333333-3'),  # duplicada (las históricas pueden cruzarse)
+        ]
+        ids = [
+            AtencionAntigua.objects.create(
+                doctor=doctor, fecha=fecha, hora_atencion=hora, duracion=duracion, paciente_rut=rut_paciente,
+                paciente_nombre='Ana', paciente_apellido='Soto',
+            ).pk
+            for fecha, hora, duracion, rut_paciente in filas
+        ]
+        with self.assertRaises(RuntimeError) as error:
+            self._migrar('0020_atencion_restricciones')
+        mensaje = str(error.exception)
+        self.assertIn('Hay 2 atenciones', mensaje)
+        self.assertIn(f'atenciones {ids[2]}, {ids[3]}', mensaje)
+        self.assertIn(f'la atención {ids[1]} (10:30) se cruza con la {ids[0]} (10:00, 60 min)', mensaje)
+
+        AtencionAntigua.objects.filter(pk__in=ids[1::2]).delete()
+        self._migrar('0020_atencion_restricciones')
+
+
+class ImportacionTest(TestCase):
+    ENCABEZADOS = ['doctor_rut', 'fecha', 'hora_atencion', 'paciente_rut', 'paciente_nombre', 'paciente_apellido', 'descripcion', 'valor']
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = sembrar(0, doctores=1, dias=1, semilla=6)['doctores'][0]
+        Atencion.objects.create(
+            doctor=cls.doctor, fecha=datetime.date(2026, 3, 2), hora_atencion=datetime.time(10),
+            paciente_nombre='Rosa', paciente_apellido='Vera', paciente_rut='22222222-2',
+        )
+
+    def _importar(self, filas, *opciones):
+        with tempfile.TemporaryDirectory() as carpeta:
+            ruta = Path(carpeta) / 'atenciones.csv'
+            with open(ruta, 'w', newline='', encoding='utf-8') as archivo:
+                escritor = csv.writer(archivo)
+                escritor.writerow(self.ENCABEZADOS)
+                escritor.writerows([self.doctor.rut, *fila] for fila in filas)
+            salida = io.StringIO()
+            call_command('importar_atenciones', str(ruta), *opciones, stdout=salida)
+        return salida.getvalue()
+
+    def test_rechaza_choques_con_la_base_y_dentro_del_lote(self):
+        salida = self._importar([
+            ('2026-03-02', '10:15', '11111111-1', 'Ana', 'Soto', 'Control', '1000'),
+            ('2026-03-02', '11:00', '11111111-1', 'Ana', 'Soto', 'Control', '1000'),
+            ('2026-03-02', '11:15', '12345678-5', 'Luis', 'Paz', 'Control', '1000'),
+            ('2026-03-02', '11:30', '12345678-5', 'Luis', 'Paz', 'Control', '1000'),
+        ])
+        self.assertIn('Fila 2: El doctor ya tiene una atención de 10:00 a 10:30 que se cruza con este horario (30 min).', salida)
+        self.assertIn('Fila 4: El doctor ya tiene una atención de 11:00 a 11:30 que se cruza con este horario (30 min).', salida)
+        horas = Atencion.objects.filter(doctor=self.doctor).order_by('hora_atencion').values_list('hora_atencion', flat=True)
+        self.assertEqual(list(horas), [datetime.time(10), datetime.time(11), datetime.time(11, 30)])
+
+    def test_rechaza_duplicadas_y_conflictos_de_identidad(self):
+        salida = self._importar([
+            ('2026-03-02', '10:00', '22.222.222-2', 'Rosa', 'Vera', 'Control', '1000'),  # ya existe
+            ('2026-03-03', '09:00', '11111111-1', 'Ana', 'Soto', 'Control', '1000'),
+            ('2026-03-04', '09:00', '12345678-5', 'Luis', 'Paz', 'Control', '1000'),
+            ('2026-03-03', '09:00', '11111111-1', 'Ana', 'Soto', 'Control', '1000'),  # repetida en el archivo
+            ('2026-03-05', '09:00', '22222222-2', 'Rosario', 'Vera', 'Control', '1000'),  # otro nombre para el RUT
+        ])
+        self.assertIn('Fila 2: El paciente con RUT 22222222-2 ya tiene hora ese día a esa misma hora.', salida)
+        self.assertIn('Fila 5: El paciente con RUT 11111111-1 ya tiene hora ese día a esa misma hora.', salida)
+        self.assertIn('Fila 6: Conflicto: El RUT 22222222-2 pertenece a Rosa Vera.', salida)
+        self.assertIn('2 atenciones y 2 tratamientos importados, 3 filas con errores.', salida)
+        self.assertEqual(Atencion.objects.count(), 3)
+
+    def test_lote_que_falla_no_importa_ninguna_de_sus_filas(self):
+        with mock.patch('odontologia.importacion.recalcular_boletas', side_effect=[None, DatabaseError('sin conexión')]):
+            salida = self._importar([
+                ('2026-03-03', '09:00', '11111111-1', 'Ana', 'Soto', 'Control', '1000'),
+                ('2026-03-04', '09:00', '12345678-5', 'Luis', 'Paz', 'Control', '1000'),
+                # Segundo lote: falla al recalcular las boletas, después de insertar
+                ('2026-03-05', '09:00', '11111111-1', 'Ana', 'Soto', 'Limpieza', '1000'),
+                ('2026-03-05', '09:00', '11111111-1', 'Ana', 'Soto', '', ''),
+                ('2026-03-02', '10:00', '22222222-2', 'Rosa', 'Vera', 'Control', '1000'),  # ya existe
+                ('mañana', '09:00', '12345678-5', 'Luis', 'Paz', 'Control', '1000'),
+            ], '--lote', '2')
+        for fila in (4, 5, 6):
+            self.assertIn(f'Fila {fila}: No se importó: el lote de las filas 4 a 6 falló (sin conexión).', salida)
+        self.assertNotIn('ya tiene hora', salida)
+        self.assertIn('Fila 7: ', salida)
+        self.assertIn('6 filas en ', salida)
+        self.assertIn('2 atenciones y 2 tratamientos importados, 4 filas con errores.', salida)
+        self.assertEqual(Atencion.objects.count(), 3)
+        self.assertFalse(Atencion.objects.filter(fecha=datetime.date(2026, 3, 5)).exists())
+
+    def test_solo_verificar_no_guarda_nada(self):
+        pacientes = Paciente.objects.count()
+        salida = self._importar([
+            ('2026-03-03', '09:00', '11111111-1', 'Ana', 'Soto', 'Control', '1000'),
+            ('2026-03-03', '10:00', '22222222-2', 'Rosario', 'Vera', 'Control', '1000'),
+        ], '--solo-verificar')
+        self.assertIn('Verificación sin escribir cambios.', salida)
+        self.assertIn('Fila 3: Conflicto', salida)
+        self.assertIn('1 atenciones y 1 tratamientos importados', salida)
+        self.assertEqual(Atencion.objects.count(), 1)
+        self.assertEqual(Paciente.objects.count(), pacientes)
+        self.assertFalse(Boleta.objects.filter(atencion__paciente_rut='11111111-1').exists())
+
+    def test_boletas_y_resumenes_despues_de_importar(self):
+        self._importar([
+            # Filas seguidas con el mismo horario son una atención con varios tratamientos
+            ('2026-03-03', '09:00', '11111111-1', 'Ana', 'Soto', 'Limpieza', '$15.000'),
+            ('2026-03-03', '09:00', '11111111-1', 'Ana', 'Soto', 'Radiografía', '2500,50'),
+            ('2026-04-01', '09:00', '12345678-5', 'Luis', 'Paz', 'Control', '8000'),
+        ], '--lote', '1')
+        atencion = Atencion.objects.get(paciente_rut='11111111-1')
+        self.assertEqual(atencion.detalles.count(), 2)
+        self.assertEqual(atencion.boleta.total_tratamientos, Decimal('17500.50'))
+        esperadas = calcular_totales(Atencion.objects.values_list('pk', flat=True))
+        actuales = {
+            b.atencion_id: (b.total_tratamientos, b.total_examenes, b.ganancia_neta_doctor) for b in Boleta.objects.all()
+        }
+        self.assertEqual(actuales, esperadas)
+        clave = lambda f: (f.doctor_id, f.anio, f.mes, f.especialidad, *(getattr(f, c) for c in CAMPOS_TOTALES))
+        self.assertEqual(sorted(map(clave, ResumenMensualDoctor.objects.all())), sorted(map(clave, calcular_todo())))
+        self.assertEqual(Paciente.objects.get(rut='12345678-5').atenciones.count(), 1)
+
+
+class TrabajosReporteTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.enterClassContext(override_settings(MEDIA_ROOT=cls.enterClassContext(tempfile.TemporaryDirectory())))
+        super().setUpClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        creado = sembrar(20, doctores=2, dias=10, semilla=14)
+        cls.admin = creado['admin']
+        cls.doctor, cls.otro = creado['doctores']
+
+    def _encolar(self, minutos_atras=0, **campos):
+        trabajo = encolar('EXCEL_DOCTOR', {'doctor_id': self.doctor.pk, **campos}, self.doctor.user)
+        TrabajoReporte.objects.filter(pk=trabajo.pk).update(creado=timezone.now() - datetime.timedelta(minutes=minutos_atras))
+        return trabajo
+
+    def test_encolar_reutiliza_el_trabajo_en_curso(self):
+        trabajo = self._encolar()
+        self.assertEqual(encolar('EXCEL_DOCTOR', {'doctor_id': self.doctor.pk}, self.doctor.user), trabajo)
+        self.assertNotEqual(encolar('EXCEL_DOCTOR', {'doctor_id': self.doctor.pk}, self.admin), trabajo)
+        TrabajoReporte.objects.filter(pk=trabajo.pk).update(estado='LISTO')
+        self.assertNotEqual(self._encolar(), trabajo)
+
+    def test_tomar_siguiente_en_orden_de_llegada(self):
+        nuevo = self._encolar(minutos_atras=1)
+        antiguo = self._encolar(minutos_atras=5, anio=2025)
+        tomado = tomar_siguiente()
+        self.assertEqual((tomado.pk, tomado.estado, tomado.intentos), (antiguo.pk, 'PROCESANDO', 1))
+        self.assertIsNotNone(tomado.iniciado)
+        self.assertEqual(tomar_siguiente(), nuevo)
+        self.assertIsNone(tomar_siguiente())
+
+    @skipUnlessDBFeature('has_select_for_update_skip_locked')
+    def test_tomar_siguiente_salta_los_bloqueados(self):
+        self._encolar()
+        with CaptureQueriesContext(connection) as consultas:
+            tomar_siguiente()
+        self.assertTrue([c['sql'] for c in consultas if 'FOR UPDATE SKIP LOCKED' in c['sql']])
+
+    def test_procesar_genera_el_archivo(self):
+        self._encolar()
+        trabajo = procesar(tomar_siguiente())
+        self.assertEqual(trabajo.estado, 'LISTO')
+        self.assertTrue(trabajo.nombre_archivo.endswith('.xlsx'))
+        with trabajo.archivo.open('rb') as archivo:
+            self.assertEqual(archivo.read(2), b'PK') # xlsx es un zip
+
+    def test_error_se_reintenta_hasta_max_intentos(self):
+        self._encolar(doctor_id=0)
+        with self.assertLogs('odontologia.trabajos', 'ERROR'):
+            for intento in range(1, MAX_INTENTOS + 1):
+                trabajo = procesar(tomar_siguiente())
+                self.assertEqual(trabajo.intentos, intento)
+        self.assertEqual(trabajo.estado, 'ERROR')
+        self.assertIn('DoesNotExist', trabajo.error)
+        self.assertIsNone(tomar_siguiente())
+
+    def test_reencolar_abandonados(self):
+        hace_una_hora = timezone.now() - datetime.timedelta(hours=1)
+        reintento = self._encolar()
+        agotado = self._encolar(anio=2025)
+        reciente = self._encolar(anio=2024)
+        TrabajoReporte.objects.filter(pk=reintento.pk).update(estado='PROCESANDO', iniciado=hace_una_hora, intentos=1)
+        TrabajoReporte.objects.filter(pk=agotado.pk).update(estado='PROCESANDO', iniciado=hace_una_hora, intentos=MAX_INTENTOS)
+        TrabajoReporte.objects.filter(pk=reciente.pk).update(estado='PROCESANDO', iniciado=timezone.now(), intentos=1)
+        self.assertEqual(reencolar_abandonados(), 2)
+        estados = dict(TrabajoReporte.objects.values_list('pk', 'estado'))
+        self.assertEqual([estados[t.pk] for t in (reintento, agotado, reciente)], ['PENDIENTE', 'ERROR', 'PROCESANDO'])
+
+    def test_comando_procesa_lo_pendiente(self):
+        trabajo = self._encolar()
+        salida = io.StringIO()
+        call_command('procesar_reportes', '--una-vez', stdout=salida)
+        trabajo.refresh_from_db()
+        self.assertEqual(trabajo.estado, 'LISTO')
+        self.assertIn('Worker detenido.', salida.getvalue())
+
+    def test_sin_worker_la_peticion_genera_el_reporte(self):
+        self.client.force_login(self.admin)
+        url = reverse('descargar_excel_doctor', args=[self.doctor.pk])
+        with override_settings(REPORTES_CON_WORKER=True):
+            encolado = self.client.post(url, HTTP_ACCEPT='application/json').json()
+        self.assertEqual(encolado['estado'], 'PENDIENTE')
+        # El mismo pedido sin worker toma el trabajo encolado y lo deja listo
+        generado = self.client.post(url, HTTP_ACCEPT='application/json').json()
+        self.assertEqual((generado['id'], generado['estado']), (encolado['id'], 'LISTO'))
+        descarga = self.client.get(generado['url_descarga'])
+        self.assertEqual(descarga.status_code, 200)
+        descarga.close()
+
+    def test_quien_puede_ver_y_descargar(self):
+        self._encolar()
+        trabajo = procesar(tomar_siguiente())
+        self.assertTrue(puede_ver(trabajo, self.doctor.user))
+        self.assertTrue(puede_ver(trabajo, self.admin))
+        self.assertFalse(puede_ver(trabajo, self.otro.user))
+        for usuario, estado in ((self.doctor.user, 200), (self.admin, 200), (self.otro.user, 404)):
+            with self.subTest(usuario=usuario.username):
+                self.client.force_login(usuario)
+                self.assertEqual(self.client.get(reverse('estado_reporte', args=[trabajo.pk])).status_code, estado)
+                respuesta = self.client.get(reverse('descargar_reporte', args=[trabajo.pk]))
+                self.assertEqual(respuesta.status_code, estado)
+                if estado == 200:
+                    self.assertEqual(respuesta.filename, trabajo.nombre_archivo)
+                    respuesta.close()
+
+
+class BoletasTest(TestCase):
+    """Boleta y resumen mensual siguen a los detalles y exámenes, con o sin recalculo_diferido."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = sembrar(0, doctores=1, dias=1, semilla=15)['doctores'][0]
+
+    def setUp(self):
+        self.atencion = Atencion.objects.create(
+            doctor=self.doctor, fecha=datetime.date(2026, 3, 2), hora_atencion=datetime.time(10),
+            paciente_nombre='Ana', paciente_apellido='Soto', paciente_rut='11111111-1',
+        )
+
+    def _totales(self):
+        b = Boleta.objects.get(atencion=self.atencion)
+        return b.total_tratamientos, b.total_examenes, b.ganancia_neta_doctor
+
+    def _revisar_resumenes(self):
+        clave = lambda f: (f.doctor_id, f.anio, f.mes, f.especialidad, *(getattr(f, c) for c in CAMPOS_TOTALES))
+        self.assertEqual(sorted(map(clave, ResumenMensualDoctor.objects.all())), sorted(map(clave, calcular_todo())))
+
+    def test_fuera_del_bloque_cada_cambio_recalcula(self):
+        self.assertEqual(self._totales(), (0, 0, 0))
+        detalle = self.atencion.detalles.create(especialidad='ENDO', descripcion='Endodoncia', valor=Decimal('10000'))
+        self.assertEqual(self._totales(), (10000, 0, 5000))
+        examen = self.atencion.examenes_solicitados.create(descripcion='Radiografía', costo_total=Decimal('3000'))
+        self.assertEqual(self._totales(), (10000, 3000, 5000))
+        detalle.valor = Decimal('20000.50')
+        detalle.save()
+        self.assertEqual(self._totales(), (Decimal('20000.50'), 3000, Decimal('10000.25')))
+        self._revisar_resumenes()
+        detalle.delete()
+        examen.delete()
+        self.assertEqual(self._totales(), (0, 0, 0))
+        self._revisar_resumenes()
+
+    def test_dentro_del_bloque_se_recalcula_una_vez_al_final(self):
+        with CaptureQueriesContext(connection) as consultas:
+            with recalculo_diferido():
+                for valor in ('1000', '2000', '3000'):
+                    self.atencion.detalles.create(descripcion='Control', valor=Decimal(valor))
+                self.atencion.examenes_solicitados.create(descripcion='Radiografía', costo_total=Decimal('500'))
+                self.assertEqual(self._totales(), (0, 0, 0))
+        self.assertEqual(len([c for c in consultas if c['sql'].startswith('INSERT INTO "odontologia_boleta"')]), 1)
+        self.assertEqual(self._totales(), (6000, 500, 3000))
+        self._revisar_resumenes()
+
+    def test_error_en_el_bloque_deshace_todo(self):
+        with self.assertRaises(ZeroDivisionError):
+            with recalculo_diferido():
+                self.atencion.detalles.create(descripcion='Control', valor=Decimal('1000'))
+                1 / 0
+        self.assertFalse(self.atencion.detalles.exists())
+        self.assertEqual(self._totales(), (0, 0, 0))
+        # Después del error los cambios vuelven a recalcularse de inmediato
+        self.atencion.detalles.create(descripcion='Control', valor=Decimal('1000'))
+        self.assertEqual(self._totales(), (1000, 0, 500))
+
+    def test_borrar_la_atencion_borra_en_cascada(self):
+        for diferido in (False, True):
+            with self.subTest(diferido=diferido):
+                atencion = Atencion.objects.create(
+                    doctor=self.doctor, fecha=datetime.date(2026, 3, 3), hora_atencion=datetime.time(10),
+                    paciente_nombre='Ana', paciente_apellido='Soto', paciente_rut='11111111-1',
+                )
+                atencion.detalles.create(especialidad='ORTO', descripcion='Brackets', valor=Decimal('50000'))
+                atencion.examenes_solicitados.create(descripcion='Radiografía', costo_total=Decimal('3000'))
+                self._revisar_resumenes()
+                with recalculo_diferido() if diferido else transaction.atomic():
+                    atencion.delete()
+                self.assertFalse(Boleta.objects.filter(atencion_id=atencion.pk).exists())
+                self.assertFalse(DetalleAtencion.objects.filter(atencion_id=atencion.pk).exists())
+                self._revisar_resumenes()
+        self.assertEqual(self._totales(), (0, 0, 0))
+
+
+class InstrumentacionSQLTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        creado = sembrar(0, doctores=1, dias=1, semilla=16)
+        cls.admin = creado['admin']
+        cls.doctor = creado['doctores'][0]
+        cls.trabajo = TrabajoReporte.objects.create(tipo='NOMINA', parametros={'anio': 2026, 'mes': 3}, solicitado_por=cls.admin)
+
+    def _pedir(self, usuario):
+        self.client.force_login(usuario)
+        url = reverse('estado_reporte_json', args=[self.trabajo.pk])
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = self.client.get(url)
+        return respuesta, len(consultas)
+
+    def test_server_timing_con_la_cantidad_de_consultas(self):
+        respuesta, cantidad = self._pedir(self.admin)
+        self.assertEqual(cantidad, 3) # sesión, usuario y trabajo
+        metricas = dict(m.split(';', 1) for m in respuesta['Server-Timing'].split(', '))
+        self.assertRegex(metricas['db'], r'^dur=\d+\.\d;desc="3 consultas"$')
+        self.assertRegex(metricas['app'], r'^dur=\d+\.\d$')
+        self.assertNotIn('dup', metricas)
+
+    def test_server_timing_solo_para_administradores(self):
+        self.trabajo.solicitado_por = self.doctor.user
+        self.trabajo.save()
+        respuesta, _ = self._pedir(self.doctor.user)
+        self.assertNotIn('Server-Timing', respuesta)
+        with override_settings(INSTRUMENTACION_SQL={'SERVER_TIMING': 'siempre'}):
+            respuesta, _ = self._pedir(self.doctor.user)
+        self.assertIn('desc="3 consultas"', respuesta['Server-Timing'])
+
+    def test_umbral_excedido_se_registra_como_warning(self):
+        with override_settings(INSTRUMENTACION_SQL={'MAX_CONSULTAS': 2}), self.assertLogs('odontologia.sql', 'WARNING') as logs:
+            self._pedir(self.admin)
+        datos = logs.records[0].sql_stats
+        self.assertEqual((datos['vista'], datos['estado'], datos['consultas']), ('estado_reporte_json', 200, 3))
+
+    def test_huella_agrupa_consultas_con_distintos_valores(self):
+        self.assertEqual(
+            huella("SELECT * FROM t WHERE id IN (%s, %s, %s) AND  nombre = 'O''Higgins' LIMIT 21"),
+            huella("SELECT * FROM t WHERE id IN (%s, %s) AND nombre = 'Ana' LIMIT 8"),
+        )
+
+
+class EstaticosVendorTest(SimpleTestCase):
+    def test_recortar_css_conserva_solo_lo_usado(self):
+        css = (
+            '/*! licencia */:root{--x:1}.btn,.btn-xl{a:1}.fa-user:before{content:"\\f007"}.fa-twitter:before{content:"}"}'
+            '@media (min-width:1px){.nav{b:2}.navbar{c:3}}.btn:not(.disabled):hover{d:4}@font-face{font-family:x}'
+            '/*# sourceMappingURL=x.css.map */'
+        )
+        self.assertEqual(
+            recortar_css(css, {'btn', 'fa-user', 'nav'}),
+            '/*! licencia */:root{--x:1}.btn{a:1}.fa-user:before{content:"\\f007"}'
+            '@media (min-width:1px){.nav{b:2}}.btn:not(.disabled):hover{d:4}@font-face{font-family:x}',
+        )
+
+    def test_vendorizar_escribe_sumas_y_comprobar_detecta_cambios(self):
+        with tempfile.TemporaryDirectory() as raiz, override_settings(BASE_DIR=raiz):
+            self.assertEqual(len(comprobar()), 1) # Sin SHA256SUMS
+            vendorizar(descargar=lambda ruta: b'.btn{a:1}' if ruta.endswith('.css') else b'x')
+            self.assertEqual(comprobar(), [])
+            (destino() / 'bootstrap/bootstrap.min.css').write_text('.btn{a:2}')
+            (destino() / CSS_POPPINS).unlink()
+            self.assertEqual(comprobar(), [
+                'bootstrap/bootstrap.min.css no coincide con SHA256SUMS.', f'Falta {CSS_POPPINS}.',
+            ])
+
+    def test_plantillas_solo_usan_estaticos_existentes(self):
+        # Con el almacenamiento Manifest un {% static %} sin archivo es un error 500 en la página
+        for plantilla in Path(settings.BASE_DIR, 'odontologia', 'templates').rglob('*.html'):
+            for ruta in re.findall(r"{% static '([^']+)' %}", plantilla.read_text(encoding='utf-8')):
+                with self.subTest(plantilla=plantilla.name, ruta=ruta):
+                    self.assertIsNotNone(finders.find(ruta))
+
+
+def _foto(ancho=800, alto=600, formato='JPEG', gps=True):
+    """Foto subida de prueba; por defecto un JPEG con EXIF de ubicación, como el de un celular."""
+    img = Image.new('RGB', (ancho, alto), 'teal')
+    opciones = {}
+    if gps:
+        exif = Image.Exif()
+        exif[0x8825] = {1: 'S', 2: (33.0, 27.0, 0.0)} # GPSInfo
+        opciones['exif'] = exif.tobytes()
+    destino = io.BytesIO()
+    img.save(destino, formato, **opciones)
+    return SimpleUploadedFile(f'foto.{formato.lower()}', destino.getvalue(), content_type=f'image/{formato.lower()}')
+
+def _png_con_cabecera(ancho, alto):
+    """PNG de pocos bytes que declara ancho x alto en su cabecera (bomba de descompresión)."""
+    destino = io.BytesIO()
+    Image.new('1', (1, 1)).save(destino, 'PNG')
+    datos = bytearray(destino.getvalue())
+    ihdr = datos[12:29] # tipo + datos de IHDR
+    ihdr[4:12] = ancho.to_bytes(4, 'big') + alto.to_bytes(4, 'big')
+    datos[12:29] = ihdr
+    datos[29:33] = zlib.crc32(bytes(ihdr)).to_bytes(4, 'big')
+    return SimpleUploadedFile('bomba.png', bytes(datos), content_type='image/png')
+
+
+class FotosPerfilTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.enterClassContext(override_settings(MEDIA_ROOT=cls.enterClassContext(tempfile.TemporaryDirectory())))
+        super().setUpClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('jefa', password='x')
+        cls.doctor = Doctor.objects.create(user=User.objects.create(username='dra', first_name='Ana'), rut='9876543-3')
+
+    def _subir(self, foto):
+        self.doctor.foto_perfil.save(foto.name, foto, save=False)
+        procesar_foto(self.doctor)
+        self.doctor.refresh_from_db()
+
+    def test_procesar_quita_el_exif(self):
+        foto = _foto()
+        with Image.open(foto) as original:
+            self.assertIn(0x8825, original.getexif())
+        foto.seek(0)
+        self._subir(foto)
+        with self.doctor.foto_perfil.open('rb') as archivo, Image.open(archivo) as guardada:
+            self.assertEqual(dict(guardada.getexif()), {})
+
+    def test_procesar_genera_miniaturas_webp_y_jpeg(self):
+        self._subir(_foto(1200, 400))
+        self._subir(_foto(600, 900, 'PNG', gps=False))
+        self.assertEqual(self.doctor.foto_version, 2)
+        for extension, formato in (('webp', 'WEBP'), ('jpg', 'JPEG')):
+            with self.subTest(extension=extension):
+                self.assertFalse(default_storage.exists(ruta_miniatura(self.doctor.pk, 1, extension)))
+                with default_storage.open(ruta_miniatura(self.doctor.pk, 2, extension)) as archivo, Image.open(archivo) as miniatura:
+                    self.assertEqual((miniatura.format, miniatura.size), (formato, (LADO_MINIATURA, LADO_MINIATURA)))
+        self.assertTrue(self.doctor.miniatura_webp_url.endswith(f'{self.doctor.pk}-2.webp'))
+
+    def test_rechaza_archivos_demasiado_pesados(self):
+        pesado = SimpleUploadedFile('foto.jpg', b'0' * (TAMANO_MAXIMO + 1), content_type='image/jpeg')
+        with self.assertRaisesMessage(ValidationError, 'no puede superar'):
+            validar_foto(pesado)
+
+    def test_rechaza_bombas_de_descompresion_sin_decodificarlas(self):
+        for (ancho, alto), mensaje in (((9000, 5000), '9000 x 5000'), ((100_000, 100_000), 'demasiado grande')):
+            with self.subTest(ancho=ancho, alto=alto), self.assertRaisesMessage(ValidationError, mensaje):
+                validar_foto(_png_con_cabecera(ancho, alto))
+
+    def test_admin_procesa_la_foto(self):
+        self.client.force_login(self.admin)
+        url = reverse('admin:odontologia_doctor_change', args=[self.doctor.pk])
+        datos = {'user': self.doctor.user.pk, 'rut': self.doctor.rut, 'fecha_nacimiento': ''}
+
+        respuesta = self.client.post(url, {**datos, 'foto_perfil': _png_con_cabecera(9000, 5000)})
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertIn('foto_perfil', respuesta.context['adminform'].form.errors)
+
+        self.assertEqual(self.client.post(url, {**datos, 'foto_perfil': _foto()}).status_code, 302)
+        self.doctor.refresh_from_db()
+        self.assertEqual(self.doctor.foto_version, 1)
+        self.assertTrue(default_storage.exists(ruta_miniatura(self.doctor.pk, 1, 'webp')))
+        with self.doctor.foto_perfil.open('rb') as archivo, Image.open(archivo) as guardada:
+            self.assertEqual(dict(guardada.getexif()), {})
+
+
+class EstadisticasTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = sembrar(10, doctores=1, dias=5, semilla=21)['doctores'][0]
+
+    def setUp(self):
+        cache.clear()
+
+    def test_segunda_lectura_sale_de_la_cache(self):
+        with self.assertNumQueries(2): # versión de datos y agregación
+            datos = estadisticas_dashboard(self.doctor.pk)
+        with self.assertNumQueries(1): # solo la versión
+            self.assertEqual(estadisticas_dashboard(self.doctor.pk), datos)
+        clave = clave_datos(self.doctor.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(estadisticas_dashboard(self.doctor.pk, clave), datos)
+
+    def test_guardar_atencion_o_detalle_invalida_la_cache(self):
+        antes, global_antes = estadisticas_dashboard(self.doctor.pk), estadisticas_dashboard()
+        with self.captureOnCommitCallbacks(execute=True):
+            atencion = Atencion.objects.create(
+                doctor=self.doctor, fecha=timezone.localdate(), hora_atencion=datetime.time(21, 45),
+                paciente_nombre='Ana', paciente_apellido='Soto', paciente_rut='11111111-1',
+            )
+        despues = estadisticas_dashboard(self.doctor.pk)
+        self.assertEqual(despues['total_pacientes_hoy'], antes['total_pacientes_hoy'] + 1)
+        self.assertEqual(estadisticas_dashboard()['atenciones_realizadas'], global_antes['atenciones_realizadas'] + 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            atencion.detalles.create(descripcion='Limpieza', valor=Decimal('20000'))
+        self.assertEqual(estadisticas_dashboard(self.doctor.pk)['facturado_mensual'], despues['facturado_mensual'] + Decimal('20000'))
+
+    def test_la_entrada_vence_con_el_ttl(self):
+        estadisticas_dashboard(self.doctor.pk)
+        guardada = time.time()
+        for segundos, consultas in ((TTL_ESTADISTICAS - 1, 1), (TTL_ESTADISTICAS + 1, 2)):
+            with self.subTest(segundos=segundos), mock.patch('django.core.cache.backends.locmem.time') as reloj:
+                reloj.time.return_value = guardada + segundos
+                with self.assertNumQueries(consultas):
+                    estadisticas_dashboard(self.doctor.pk)
+
+
+class CabeceraTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = sembrar(0, doctores=1, dias=1, semilla=22)['doctores'][0]
+
+    def setUp(self):
+        self.sesion = SessionStore()
+
+    def _peticion(self):
+        # Como AuthenticationMiddleware: usuario recién leído en cada petición
+        peticion = RequestFactory().get('/')
+        peticion.user, peticion.session = User.objects.get(pk=self.doctor.user_id), self.sesion
+        return peticion
+
+    def test_obtener_doctor_consulta_una_vez_por_peticion(self):
+        peticion = self._peticion()
+        with self.assertNumQueries(1):
+            self.assertEqual(obtener_doctor(peticion), self.doctor)
+            self.assertEqual(obtener_doctor(peticion), self.doctor)
+
+    def test_cabecera_en_sesion_solo_consulta_la_version(self):
+        peticion = self._peticion()
+        with self.assertNumQueries(2): # versión del perfil y doctor
+            primera = cabecera(peticion)
+        peticion = self._peticion()
+        with self.assertNumQueries(1):
+            self.assertEqual(cabecera(peticion)['nombre_doctor'], primera['nombre_doctor'])
+            cabecera(peticion)
+
+    def test_cabecera_se_actualiza_al_guardar_el_doctor_o_el_usuario(self):
+        cabecera(self._peticion())
+        # Otro worker cambia el nombre: la versión está en la base, no en la caché de este proceso
+        usuario = self.doctor.user
+        usuario.first_name = 'Renata'
+        usuario.save()
+        self.assertEqual(cabecera(self._peticion())['nombre_doctor'], 'Renata')
+
+        Doctor.objects.filter(pk=self.doctor.pk).update(foto_perfil='fotos_perfil/nueva.jpg')
+        self.assertNotIn('nueva.jpg', cabecera(self._peticion())['doctor_profile_pic'])
+        Doctor.objects.get(pk=self.doctor.pk).save()
+        self.assertIn('nueva.jpg', cabecera(self._peticion())['doctor_profile_pic'])
+
+
+def _parametro_de(url, parametro):
+    """Cursor de un enlace de PaginaCursor ('?despues=...')."""
+    return QueryDict(url.lstrip('?'))[parametro]
+
+def _cursor(texto):
+    return base64.urlsafe_b64encode(texto.encode()).decode().rstrip('=')
+
+
+class PaginacionCursorTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        creado = sembrar(0, doctores=4, dias=1, semilla=23)
+        cls.admin = creado['admin']
+        # Empates en (fecha, hora_atencion): solo el id las ordena
+        cls.dia = datetime.date(2026, 3, 2)
+        for i, (doctor, hora) in enumerate([(d, h) for h in (10, 9) for d in creado['doctores']][:7]):
+            Atencion.objects.create(
+                doctor=doctor, fecha=cls.dia, hora_atencion=datetime.time(hora),
+                paciente_nombre='Ana', paciente_apellido='Soto', paciente_rut=f'{i + 1}' * 8 + f'-{i + 1}',
+            )
+        cls.orden = list(Atencion.objects.order_by('-fecha', '-hora_atencion', '-id'))
+
+    def _pagina(self, **parametros):
+        return paginar_atenciones(RequestFactory().get('/', {'por_pagina': 3, **parametros}), Atencion.objects.all())
+
+    def test_cursor_ida_y_vuelta(self):
+        for atencion in self.orden:
+            with self.subTest(pk=atencion.pk):
+                self.assertEqual(decodificar_cursor(codificar_cursor(atencion)), (atencion.fecha, atencion.hora_atencion, atencion.pk))
+        self.assertNotIn('=', codificar_cursor(self.orden[0]))
+
+    def test_recorre_empates_sin_repetir_ni_saltar(self):
+        paginas, pagina = [], self._pagina()
+        self.assertFalse(pagina.hay_anterior)
+        self.assertEqual(pagina.url_anterior, '')
+        while True:
+            paginas.append(pagina.objetos)
+            if not pagina.hay_siguiente:
+                break
+            pagina = self._pagina(despues=_parametro_de(pagina.url_siguiente, 'despues'))
+        self.assertEqual([a for objetos in paginas for a in objetos], self.orden)
+        self.assertEqual([len(objetos) for objetos in paginas], [3, 3, 1])
+        self.assertEqual(pagina.url_siguiente, '')
+        # Hacia atrás desde la última página se vuelven a ver las mismas páginas
+        for esperada in reversed(paginas[:-1]):
+            pagina = self._pagina(antes=_parametro_de(pagina.url_anterior, 'antes'))
+            self.assertEqual(pagina.objetos, esperada)
+            self.assertTrue(pagina.hay_siguiente)
+        self.assertFalse(pagina.hay_anterior)
+
+    def test_cursores_en_los_extremos(self):
+        self.assertEqual(self._pagina(despues=codificar_cursor(self.orden[-1])).objetos, [])
+        self.assertEqual(self._pagina(antes=codificar_cursor(self.orden[0])).objetos, [])
+        # Un cursor en el borde de una página con empates: la siguiente empieza justo después
+        self.assertEqual(self._pagina(despues=codificar_cursor(self.orden[2])).objetos, self.orden[3:6])
+        self.assertEqual(self._pagina(antes=codificar_cursor(self.orden[3])).objetos, self.orden[:3])
+
+    def test_cursores_invalidos_dan_la_primera_pagina(self):
+        primera = self._pagina().objetos
+        invalidos = [
+            '', '!!!', 'Zm9v', _cursor('2026-13-01|10:00:00|1'), _cursor('2026-03-02|25:00|1'),
+            _cursor('2026-03-02|10:00:00|uno'), _cursor('2026-03-02|10:00:00|99999999999999999999'),
+            _cursor('2026-03-02|10:00:00|-1'), _cursor('2026-03-02|10:00:00+03:00|1'), _cursor('2026-03-02|10:00:00|1|2'),
+            base64.urlsafe_b64encode(b'\xff\xfe|x').decode(),
+        ]
+        self.client.force_login(self.admin)
+        for cursor in invalidos:
+            for parametro in ('antes', 'despues'):
+                with self.subTest(cursor=cursor, parametro=parametro):
+                    self.assertEqual(self._pagina(**{parametro: cursor}).objetos, primera)
+                    self.assertEqual(self.client.get(reverse('lista_atenciones'), {parametro: cursor}).status_code, 200)
+
+
+def _valores_libro(contenido):
+    """{hoja: filas} de un xlsx en bytes."""
+    libro = load_workbook(io.BytesIO(contenido), read_only=True)
+    valores = {hoja.title: [fila for fila in hoja.iter_rows(values_only=True)] for hoja in libro.worksheets}
+    libro.close()
+    return valores
+
+
+class NominaTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.enterClassContext(override_settings(MEDIA_ROOT=cls.enterClassContext(tempfile.TemporaryDirectory())))
+        super().setUpClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctores = sembrar(60, doctores=3, dias=20, semilla=24)['doctores']
+        # Dos doctores con el mismo nombre: sus hojas y archivos no pueden repetirse
+        for rut, usuario in (('9876543-3', 'gemela1'), ('12345678-5', 'gemela2')):
+            Doctor.objects.create(user=User.objects.create(username=usuario, first_name='Ana', last_name='Rojas'), rut=rut)
+        ultima = Atencion.objects.latest('fecha')
+        cls.anio, cls.mes = ultima.fecha.year, ultima.fecha.month
+
+    def test_nombres_unicos(self):
+        doctores = [
+            Doctor(pk=pk, rut=str(pk), user=User(first_name=nombre, last_name=apellido))
+            for pk, (nombre, apellido) in enumerate([
+                ('Ana', 'Rojas'), ('ana', 'ROJAS'), ('Ana', 'Rojas'), ('', 'Resumen'),
+                ('Bernardita', 'Del Carmen/Fuenzalida: [Ortodoncia]'), ('B', 'Del Carmen Fuenzalida Ortodoncista'),
+                ('B', 'Del Carmen Fuenzalida Ortodoncia'), ('', ''),
+            ], start=1)
+        ]
+        nombres = _nombres_unicos(doctores, 31)
+        self.assertEqual([nombres[pk] for pk in (1, 2, 3, 4)], ['Rojas Ana', 'ROJAS ana (2)', 'Rojas Ana (3)', 'Resumen (2)'])
+        # Sin caracteres inválidos para Excel y recortados a 31, dejando lugar al sufijo
+        self.assertEqual(nombres[5], 'Del CarmenFuenzalida Ortodoncia')
+        self.assertEqual(nombres[6], 'Del Carmen Fuenzalida Ortodonci')
+        self.assertEqual(nombres[7], 'Del Carmen Fuenzalida Ortod (2)')
+        self.assertEqual(nombres[8], '8') # sin nombre: el RUT
+        self.assertEqual(len({n.lower() for n in nombres.values()}), len(doctores))
+        self.assertTrue(all(len(n) <= 31 for n in nombres.values()))
+
+    def test_xlsx_con_resumen_y_una_hoja_por_doctor(self):
+        nombre, archivo = nomina_en_archivo_temporal(self.anio, self.mes)
+        with archivo:
+            hojas = _valores_libro(archivo.read())
+        self.assertEqual(nombre, f"Nomina_{self.anio}-{self.mes:02d}.xlsx")
+        doctores, por_doctor, resumen = datos_nomina(self.anio, self.mes)
+        self.assertEqual(list(hojas)[0], 'Resumen')
+        self.assertEqual(len(hojas), len(doctores) + 1)
+        self.assertEqual(sum(1 for h in hojas if h.lower().startswith('rojas ana')), 2)
+        self.assertEqual([fila[:3] for fila in hojas['Resumen'][1:len(resumen) + 1]], [fila[:3] for fila in resumen])
+        self.assertTrue(any(por_doctor.values()))
+
+    def test_vista_exportar_nomina(self):
+        self.client.force_login(User.objects.get(is_superuser=True))
+        url = reverse('exportar_nomina')
+        for datos in ({'periodo': '2026-13', 'formato': 'xlsx'}, {'periodo': f'{self.anio}-{self.mes:02d}', 'formato': 'pdf'}):
+            with self.subTest(**datos):
+                self.assertRedirects(self.client.post(url, datos), reverse('lista_doctores'))
+        self.assertFalse(TrabajoReporte.objects.exists())
+        respuesta = self.client.post(url, {'periodo': f'{self.anio}-{self.mes:02d}', 'formato': 'zip'})
+        trabajo = TrabajoReporte.objects.get()
+        self.assertRedirects(respuesta, reverse('estado_reporte', args=[trabajo.pk]))
+        self.assertEqual((trabajo.tipo, trabajo.estado, trabajo.nombre_archivo), ('NOMINA', 'LISTO', f"Nomina_{self.anio}-{self.mes:02d}.zip"))
+        with trabajo.archivo.open('rb') as archivo, zipfile.ZipFile(archivo) as zf:
+            self.assertIn('Resumen.xlsx', zf.namelist())
+
+    def test_zip_igual_en_serie_y_con_procesos(self):
+        en_serie = io.BytesIO()
+        generar_nomina_zip(self.anio, self.mes, en_serie, procesos=1)
+        paralelo = io.BytesIO()
+        with mock.patch('odontologia.nomina.os.cpu_count', return_value=4), \
+                mock.patch('odontologia.nomina.ProcessPoolExecutor', wraps=ProcessPoolExecutor) as pool:
+            generar_nomina_zip(self.anio, self.mes, paralelo, procesos=4)
+        pool.assert_called_once_with(max_workers=4)
+
+        with zipfile.ZipFile(en_serie) as serie, zipfile.ZipFile(paralelo) as procesos:
+            self.assertEqual(serie.namelist(), procesos.namelist())
+            self.assertEqual(serie.namelist()[0], 'Resumen.xlsx')
+            self.assertEqual(len(serie.namelist()), Doctor.objects.count() + 1)
+            for archivo in serie.namelist():
+                with self.subTest(archivo=archivo):
+                    self.assertEqual(_valores_libro(serie.read(archivo)), _valores_libro(procesos.read(archivo)))
+
+        # El libro único tiene las mismas filas que los archivos del ZIP
+        libro = io.BytesIO()
+        generar_nomina_xlsx(self.anio, self.mes, libro)
+        hojas = _valores_libro(libro.getvalue())
+        with zipfile.ZipFile(en_serie) as serie:
+            self.assertEqual(hojas['Resumen'], _valores_libro(serie.read('Resumen.xlsx'))['Resumen'])
+
+
+class CalendarioEventosTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        creado = sembrar(40, doctores=2, dias=20, semilla=25)
+        cls.admin = creado['admin']
+        cls.doctor, cls.otro = creado['doctores']
+        hoy = timezone.localdate()
+        cls.rango = {'start': f'{hoy - datetime.timedelta(days=30)}T00:00:00-03:00', 'end': f'{hoy + datetime.timedelta(days=30)}T00:00:00-03:00'}
+
+    def _eventos(self, usuario, parametros):
+        self.client.force_login(usuario)
+        return self.client.get(reverse('calendario_eventos_json'), parametros)
+
+    def test_parametros_invalidos_dan_400(self):
+        hoy = timezone.localdate()
+        limite = {'start': hoy.isoformat(), 'end': (hoy + datetime.timedelta(days=MAX_DIAS_RANGO_CALENDARIO)).isoformat()}
+        self.assertEqual(self._eventos(self.doctor.user, limite).status_code, 200)
+        invalidos = [
+            {}, {'start': hoy.isoformat()}, {'end': hoy.isoformat()}, {'start': 'ayer', 'end': hoy.isoformat()},
+            {'start': hoy.isoformat(), 'end': '2026-02-30'}, {'start': hoy.isoformat(), 'end': hoy.isoformat()},
+            {'start': hoy.isoformat(), 'end': (hoy - datetime.timedelta(days=1)).isoformat()},
+            {'start': hoy.isoformat(), 'end': (hoy + datetime.timedelta(days=MAX_DIAS_RANGO_CALENDARIO + 1)).isoformat()},
+        ]
+        for parametros in invalidos:
+            with self.subTest(**parametros):
+                respuesta = self._eventos(self.doctor.user, parametros)
+                self.assertEqual(respuesta.status_code, 400)
+                self.assertIn('error', respuesta.json())
+
+    def test_doctor_solo_ve_sus_atenciones(self):
+        inicio, fin = (datetime.date.fromisoformat(self.rango[c][:10]) for c in ('start', 'end'))
+        del_rango = Atencion.objects.filter(fecha__gte=inicio, fecha__lt=fin)
+        propias = set(del_rango.filter(doctor=self.doctor).values_list('pk', flat=True))
+        self.assertTrue(propias and del_rango.exclude(doctor=self.doctor).exists())
+
+        eventos = self._eventos(self.doctor.user, self.rango).json()
+        self.assertEqual({e['id'] for e in eventos}, propias)
+        self.assertFalse([e for e in eventos if e['title'].startswith('Dr. ')])
+
+        eventos = self._eventos(self.admin, self.rango).json()
+        self.assertEqual({e['id'] for e in eventos}, set(del_rango.values_list('pk', flat=True)))
+        self.assertTrue(all(e['title'].startswith('Dr. ') for e in eventos))
+
+    def test_consultas_no_crecen_con_los_eventos(self):
+        sembrar(200, doctores=[self.doctor, self.otro], dias=20, semilla=26)
+        for usuario, consultas in ((self.admin, 3), (self.doctor.user, 4)): # sesión, usuario, (doctor) y atenciones
+            self.client.force_login(usuario)
+            with self.subTest(usuario=usuario.username), self.assertNumQueries(consultas):
+                self.assertGreater(len(self.client.get(reverse('calendario_eventos_json'), self.rango).json()), 40)
 
-# Create your tests here.
@@ -0,0 +1,140 @@
+# odontologia/trabajos.py
+import datetime
+import logging
+import traceback
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from .models import Atencion, Doctor, TrabajoReporte
+from .reportes import excel_doctor_en_archivo_temporal
+from .nomina import nomina_en_archivo_temporal
+
+# --- Cola de reportes en la base de datos ---
+# Las vistas encolan un TrabajoReporte; el comando `procesar_reportes` (un proceso
+# aparte) toma los pendientes uno a uno, genera el archivo y lo guarda en
+# MEDIA_ROOT/reportes/. No se necesita un broker externo. El worker debe ver el mismo
+# MEDIA_ROOT que la web: si no hay uno así (REPORTES_CON_WORKER sin activar) la misma
+# petición genera el reporte (`procesar_sin_worker`) y la cola solo evita duplicados.
+
+logger = logging.getLogger(__name__)
+
+MAX_INTENTOS = 3
+MINUTOS_ABANDONO = 30 # Un trabajo "Procesando" por más tiempo se considera de un worker caído
+
+
+# --- Generadores: reciben los parámetros y devuelven (nombre de descarga, archivo temporal) ---
+
+def _excel_doctor(parametros):
+    doctor = Doctor.objects.select_related('user').get(pk=parametros['doctor_id'])
+    atenciones = Atencion.objects.filter(doctor=doctor).order_by('-fecha', '-hora_atencion')
+    nombre = f"Reporte_{doctor.user.last_name}_{timezone.localdate().strftime('%d-%m-%Y')}.xlsx"
+    return nombre, excel_doctor_en_archivo_temporal(atenciones)
+
+def _nomina(parametros):
+    return nomina_en_archivo_temporal(parametros['anio'], parametros['mes'], parametros.get('formato', 'xlsx'))
+
+GENERADORES = {
+    'EXCEL_DOCTOR': _excel_doctor,
+    'NOMINA': _nomina,
+}
+
+
+# --- API para las vistas ---
+
+def encolar(tipo, parametros, usuario):
+    """
+    Crea el trabajo, o devuelve uno igual del mismo usuario que siga pendiente o en
+    proceso (evita duplicados por doble clic).
+    """
+    en_curso = TrabajoReporte.objects.filter(
+        tipo=tipo, parametros=parametros, solicitado_por=usuario, estado__in=['PENDIENTE', 'PROCESANDO'],
+    ).first()
+    if en_curso:
+        return en_curso
+    return TrabajoReporte.objects.create(tipo=tipo, parametros=parametros, solicitado_por=usuario)
+
+def puede_ver(trabajo, usuario):
+    return trabajo.solicitado_por_id == usuario.pk or usuario.is_staff or usuario.is_superuser
+
+
+# --- API para el worker ---
+
+def tomar_siguiente():
+    """
+    Marca como "Procesando" el pendiente más antiguo y lo devuelve (o None). En
+    PostgreSQL varios workers pueden correr a la vez gracias a SKIP LOCKED; el
+    UPDATE condicionado al estado evita que dos workers tomen el mismo trabajo.
+    """
+    with transaction.atomic():
+        trabajo = (
+            TrabajoReporte.objects.select_for_update(skip_locked=True)
+            .filter(estado='PENDIENTE').order_by('creado').first()
+        )
+        if trabajo is None:
+            return None
+        tomado = tomar(trabajo)
+    if not tomado:
+        return tomar_siguiente()
+    return trabajo
+
+def tomar(trabajo):
+    """Marca el trabajo como "Procesando" si sigue pendiente; False si otro ya lo tomó."""
+    tomado = TrabajoReporte.objects.filter(pk=trabajo.pk, estado='PENDIENTE').update(
+        estado='PROCESANDO', iniciado=timezone.now(), intentos=trabajo.intentos + 1,
+    )
+    if tomado:
+        trabajo.refresh_from_db()
+    return bool(tomado)
+
+def procesar(trabajo):
+    """Genera el archivo del trabajo y lo deja en "Listo", o en "Error" con el detalle."""
+    try:
+        nombre, temporal = GENERADORES[trabajo.tipo](trabajo.parametros)
+        with temporal:
+            trabajo.archivo.save(nombre, File(temporal), save=False)
+    except Exception:
+        logger.exception("Falló el trabajo de reporte %s", trabajo.pk)
+        trabajo.error = traceback.format_exc(limit=5)
+        # Errores transitorios (p. ej. la base de datos se reinició) se reintentan
+        trabajo.estado = 'PENDIENTE' if trabajo.intentos < MAX_INTENTOS else 'ERROR'
+    else:
+        trabajo.nombre_archivo = nombre
+        trabajo.error = ''
+        trabajo.estado = 'LISTO'
+    trabajo.terminado = timezone.now()
+    trabajo.save(update_fields=['archivo', 'nombre_archivo', 'estado', 'error', 'terminado'])
+    return trabajo
+
+def procesar_sin_worker(trabajo):
+    """
+    Sin worker (REPORTES_CON_WORKER) genera el trabajo recién encolado en la misma
+    petición, con los mismos reintentos que el worker. Con worker no hace nada.
+    """
+    if settings.REPORTES_CON_WORKER:
+        return trabajo
+    while trabajo.estado == 'PENDIENTE' and tomar(trabajo):
+        procesar(trabajo)
+    return trabajo
+
+def reencolar_abandonados(minutos=MINUTOS_ABANDONO):
+    """Devuelve a la cola los trabajos que quedaron "Procesando" por un worker que se cayó."""
+    limite = timezone.now() - datetime.timedelta(minutes=minutos)
+    abandonados = TrabajoReporte.objects.filter(estado='PROCESANDO', iniciado__lt=limite)
+    return (
+        abandonados.filter(intentos__lt=MAX_INTENTOS).update(estado='PENDIENTE')
+        + abandonados.update(estado='ERROR', error='El worker no terminó el trabajo.', terminado=timezone.now())
+    )
+
+def purgar_antiguos(dias):
+    """Borra los trabajos terminados hace más de `dias` días junto con sus archivos."""
+    limite = timezone.now() - datetime.timedelta(days=dias)
+    antiguos = TrabajoReporte.objects.filter(Q(estado='LISTO') | Q(estado='ERROR'), terminado__lt=limite)
+    borrados = 0
+    for trabajo in antiguos.iterator():
+        if trabajo.archivo:
+            trabajo.archivo.delete(save=False)
+        trabajo.delete()
+        borrados += 1
+    return borrados
@@ -25,15 +25,26 @@ urlpatterns = [
 
     # Rutas del calendario
     path('calendario/', views.ver_calendario, name='ver_calendario'),
+    path('api/calendario/eventos/', views.calendario_eventos_json, name='calendario_eventos_json'),
     path('api/atencion/<int:pk>/', views.atencion_json, name='atencion_json'),
+    path('api/atenciones/', views.atenciones_json, name='atenciones_json'),
+    path('api/pacientes/', views.autocompletar_pacientes, name='autocompletar_pacientes'),
+    path('api/agenda/libres/', views.agenda_libre, name='agenda_libre'),
     
     path('atencion/<int:pk>/editar/', views.editar_atencion, name='editar_atencion'),
     path('atencion/<int:pk>/eliminar/', views.eliminar_atencion, name='eliminar_atencion'),
 
     path('doctores/', views.lista_doctores, name='lista_doctores'),
+    path('doctores/nomina/', views.exportar_nomina, name='exportar_nomina'),
     path('doctores/<int:pk>/atenciones/', views.atenciones_por_doctor, name='atenciones_por_doctor'),
 
+    path('doctores/<int:pk>/resumen/', views.resumen_financiero_doctor, name='resumen_financiero_doctor'),
     path('doctores/<int:pk>/excel/', views.descargar_excel_doctor, name='descargar_excel_doctor'),
 
-    path('atenciones/', views.lista_atenciones, name='lista_atenciones')
+    path('atenciones/', views.lista_atenciones, name='lista_atenciones'),
+
+    # Reportes generados en segundo plano (worker `procesar_reportes`)
+    path('reportes/<int:pk>/', views.estado_reporte, name='estado_reporte'),
+    path('api/reportes/<int:pk>/', views.estado_reporte_json, name='estado_reporte_json'),
+    path('reportes/<int:pk>/descargar/', views.descargar_reporte, name='descargar_reporte'),
 ]
\ No newline at end of file
@@ -0,0 +1,46 @@
+# odontologia/versiones.py
+import time
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+from .models import VersionDatos
+
+# --- Versión de los datos de cada doctor (caché de fragmentos y ETag de listados) ---
+# Las tablas de atenciones se guardan como fragmentos de plantilla ({% cache %}) cuya
+# clave incluye la versión de datos del doctor, o la global en las vistas de
+# administrador; la misma versión forma el ETag de los listados (condicional.py).
+# signals.py sube la versión del doctor y la global cuando se guarda o borra una
+# atención o un detalle, y los comandos de carga masiva después de cada lote.
+# Las versiones están en la base (VersionDatos) y no en la caché, que es por proceso:
+# así un cambio hecho en otro worker o en un comando se ve en todos de inmediato y
+# las claves viejas dejan de usarse. TTL_FRAGMENTO solo acota la memoria de la caché.
+# Cada subida deja un valor nuevo (el reloj en ns, o +1): aunque la base vuelva atrás
+# (restauración, rollback de un test) no se repite una versión ya usada.
+# La misma tabla guarda la versión del perfil de cada usuario (contexto.py).
+
+GLOBAL = 'global'
+TTL_FRAGMENTO = 300 # segundos
+
+
+def _clave(doctor_id):
+    return str(doctor_id or GLOBAL)
+
+def version_de(clave):
+    return VersionDatos.objects.filter(clave=clave).values_list('version', flat=True).first() or 0
+
+def subir_versiones(claves):
+    """Sube las versiones de `claves` en una sentencia (las crea si no existen)."""
+    ahora = time.time_ns()
+    subidas = VersionDatos.objects.filter(clave__in=claves).update(version=Greatest(F('version') + 1, Value(ahora)))
+    if subidas < len(claves): # Primera vez para alguna de las claves
+        VersionDatos.objects.bulk_create([VersionDatos(clave=c, version=ahora) for c in claves], ignore_conflicts=True)
+
+def version_datos(doctor_id=None):
+    return version_de(_clave(doctor_id))
+
+def clave_datos(doctor_id=None):
+    """Parte de la clave de los fragmentos y del ETag: dueño de los datos y su versión actual."""
+    return f"{_clave(doctor_id)}.{version_datos(doctor_id)}"
+
+def invalidar_datos(doctor_id=None):
+    """Sube la versión del doctor (si se indica) y la global, en una sentencia."""
+    subir_versiones([_clave(doctor_id), GLOBAL] if doctor_id else [GLOBAL])
@@ -1,98 +1,90 @@
 # odontologia/views.py
-import json 
 from django.http import JsonResponse 
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.utils import timezone
+from django.utils.functional import SimpleLazyObject
+from django.utils.cache import patch_cache_control
+from django.db import IntegrityError
+from django.db.models import Prefetch
 from django.forms import inlineformset_factory
 from django.contrib import messages
-import openpyxl
-from openpyxl.styles import Font, Alignment, PatternFill, Border, Side 
-from django.http import HttpResponse
+from django.http import FileResponse, Http404
+from django.urls import reverse
 # Modelos
-from .models import Doctor, Atencion, DetalleAtencion, Examen
+from .models import Doctor, Atencion, DetalleAtencion, Examen, TrabajoReporte, Tratamiento, DURACION_POR_DEFECTO
 # Formularios
-from .forms import AtencionForm, DetalleAtencionForm
+from .forms import AtencionForm, DetalleAtencionForm, DetalleAtencionFormSet
 from .forms import UserUpdateForm, DoctorProfileForm
-from django.templatetags.static import static
+# Paginación y reportes
+from .paginacion import paginar_atenciones, paginar_por_numero
+from .busqueda import buscar_atenciones
+from .autocompletar import buscar_pacientes
+from .agenda import asignar_duracion, horas_libres, duracion_de, MAX_DIAS as MAX_DIAS_AGENDA
+from .trabajos import encolar, procesar_sin_worker, puede_ver
+from .nomina import FORMATOS as FORMATOS_NOMINA
+from .boletas import recalculo_diferido
+from .contexto import obtener_doctor, version_perfil, CLAVE_SESION
+from .condicional import render_condicional, no_modificada, con_validadores, calcular_etag
+from .estadisticas import estadisticas_dashboard
+from .versiones import clave_datos, TTL_FRAGMENTO
+from .resumenes import resumen_anual, anios_con_resumen
 import datetime 
-from decimal import Decimal 
 
-# --- Funciones Auxiliares ---
-
-def get_saludo():
-    now = timezone.localtime(timezone.now())
-    hora_actual = now.hour
-    if 5 <= hora_actual < 12: return "Buenos días"
-    elif 12 <= hora_actual < 20: return "Buenas tardes"
-    else: return "Buenas noches"
-
-def get_doctor_data(user):
-    if user.is_staff or user.is_superuser:
-        return f"Admin. {user.first_name}", static('images/doctor_placeholder.png')
-
-    nombre_doctor = user.first_name or user.username
-    doctor_profile_pic_url = static('images/doctor_placeholder.png')
-    try:
-        doctor = user.doctor
-        nombre_doctor = doctor.user.first_name or doctor.user.username
-        if doctor.foto_perfil and hasattr(doctor.foto_perfil, 'url'):
-            doctor_profile_pic_url = doctor.foto_perfil.url
-    except Doctor.DoesNotExist:
-        pass
-    return nombre_doctor, doctor_profile_pic_url
+# Máximo de días que puede pedir el calendario en una sola llamada (la vista mensual muestra 6 semanas)
+MAX_DIAS_RANGO_CALENDARIO = 93
+# Límites de atenciones_json (datos del modal): ids por llamada y días (la vista mensual muestra 6 semanas)
+MAX_ATENCIONES_LOTE = 200
+MAX_DIAS_LOTE = 42
+# Filas de "Últimas Atenciones" en el panel principal
+POR_PAGINA_DASHBOARD = 10
+NOMBRES_MESES = ["Enero", "Febrero", "Marzo", "Abril", "Mayo", "Junio", "Julio", "Agosto", "Septiembre", "Octubre", "Noviembre", "Diciembre"]
 
 # --- Vistas Principales ---
 
 @login_required
 def dashboard(request):
-    saludo = get_saludo()
-    nombre_doctor, doctor_profile_pic = get_doctor_data(request.user)
     es_admin = request.user.is_staff or request.user.is_superuser
     
-    atenciones = []
-    total_pacientes_hoy = 0
-    atenciones_realizadas = 0
-    ganancia_mensual = 0
+    atenciones = Atencion.objects.none()
+    estadisticas = {}
 
     if es_admin:
         atenciones = Atencion.objects.all().order_by('-fecha', '-hora_atencion')
-        now = timezone.localtime(timezone.now())
-        total_pacientes_hoy = atenciones.filter(fecha=now.date()).count()
-        atenciones_realizadas = atenciones.count()
+        clave = clave_datos()
+        estadisticas = estadisticas_dashboard(clave_datos=clave)
     else:
-        try:
-            doctor = request.user.doctor
+        doctor = obtener_doctor(request)
+        clave = clave_datos(doctor.pk if doctor else None)
+        if doctor:
             atenciones = Atencion.objects.filter(doctor=doctor).order_by('-fecha', '-hora_atencion')
-            now = timezone.localtime(timezone.now())
-            total_pacientes_hoy = atenciones.filter(fecha=now.date()).count()
-            atenciones_realizadas = atenciones.count()
-        except Doctor.DoesNotExist:
-            pass
+            estadisticas = estadisticas_dashboard(doctor.pk, clave)
+
+    # Perezosa: si la tabla está en caché ({% cache %}) no se consulta
+    pagina = SimpleLazyObject(lambda: paginar_atenciones(request, atenciones, por_pagina_defecto=POR_PAGINA_DASHBOARD))
 
     context = {
-        'saludo': saludo,
-        'nombre_doctor': nombre_doctor,
-        'atenciones': atenciones,
-        'doctor_profile_pic': doctor_profile_pic,
-        'es_admin': es_admin,
-        'total_pacientes_hoy': total_pacientes_hoy,
-        'atenciones_realizadas': atenciones_realizadas,
-        'ganancia_mensual': ganancia_mensual,
+        'atenciones': SimpleLazyObject(lambda: pagina.objetos),
+        'pagina': pagina,
+        'clave_datos': clave,
+        'ttl_fragmento': TTL_FRAGMENTO,
+        'total_pacientes_hoy': estadisticas.get('total_pacientes_hoy', 0),
+        'atenciones_realizadas': estadisticas.get('atenciones_realizadas', 0),
+        'facturado_mensual': estadisticas.get('facturado_mensual', 0),
+        'ganancia_mensual': estadisticas.get('ganancia_mensual', 0),
     }
-    return render(request, 'odontologia/dashboard.html', context)
+    return render_condicional(request, 'odontologia/dashboard.html', context, clave, sorted(estadisticas.items()))
 
 
 @login_required
 def registrar_atencion(request):
-    try:
-        doctor = request.user.doctor
-    except Doctor.DoesNotExist:
+    doctor = obtener_doctor(request)
+    if doctor is None:
         messages.error(request, 'Error: Solo los doctores pueden registrar atenciones.')
         return redirect('dashboard')
 
     DetalleFormSet = inlineformset_factory(
-        Atencion, DetalleAtencion, form=DetalleAtencionForm, extra=1, can_delete=False
+        Atencion, DetalleAtencion, form=DetalleAtencionForm, formset=DetalleAtencionFormSet, extra=1, can_delete=False
     )
 
     if request.method == 'POST':
@@ -100,13 +92,22 @@ def registrar_atencion(request):
         detalle_formset = DetalleFormSet(request.POST, prefix='detalles')
 
         if form.is_valid() and detalle_formset.is_valid():
-            atencion = form.save(commit=False)
-            atencion.doctor = doctor
-            atencion.save()
-            detalle_formset.instance = atencion
-            detalle_formset.save()
-            messages.success(request, '¡Atención guardada con éxito!')
-            return redirect('dashboard')
+            asignar_duracion(form, detalle_formset)
+            try:
+                # Atención + detalles en una transacción; la boleta se calcula una vez al final
+                with recalculo_diferido():
+                    atencion = form.save(commit=False)
+                    atencion.doctor = doctor
+                    atencion.save()
+                    detalle_formset.instance = atencion
+                    detalle_formset.save()
+            except IntegrityError as e:
+                # Horario repetido o choque con otra atención del doctor (restricciones de la base)
+                if not form.error_de_integridad(e):
+                    raise
+            else:
+                messages.success(request, '¡Atención guardada con éxito!')
+                return redirect('dashboard')
         
         # CORRECCIÓN: Eliminamos el "else: messages.error(...)"
         # Si hay error, simplemente se re-renderiza la página y el HTML muestra los errores rojos.
@@ -115,15 +116,9 @@ def registrar_atencion(request):
         form = AtencionForm()
         detalle_formset = DetalleFormSet(prefix='detalles')
 
-    nombre_doctor_display, doctor_profile_pic_display = get_doctor_data(request.user)
-    saludo_display = get_saludo()
-
     context = {
         'form': form,
         'detalle_formset': detalle_formset,
-        'nombre_doctor': nombre_doctor_display,
-        'doctor_profile_pic': doctor_profile_pic_display,
-        'saludo': saludo_display,
     }
     return render(request, 'odontologia/registrar_atencion.html', context)
 
@@ -131,32 +126,25 @@ def registrar_atencion(request):
 
 @login_required
 def ver_perfil(request):
-    try:
-        doctor = request.user.doctor
-    except Doctor.DoesNotExist:
+    doctor = obtener_doctor(request)
+    if doctor is None:
         messages.warning(request, 'Esta vista es solo para doctores con perfil.')
         return redirect('dashboard')
 
-    saludo = get_saludo()
-    nombre_doctor, doctor_profile_pic = get_doctor_data(request.user)
     user_form = UserUpdateForm(instance=request.user)
     doctor_form = DoctorProfileForm(instance=doctor)
 
     context = {
         'user_form': user_form,
         'doctor_form': doctor_form,
-        'saludo': saludo,
-        'nombre_doctor': nombre_doctor,
-        'doctor_profile_pic': doctor_profile_pic,
     }
     return render(request, 'odontologia/perfil.html', context)
 
 
 @login_required
 def editar_perfil(request):
-    try:
-        doctor = request.user.doctor
-    except Doctor.DoesNotExist:
+    doctor = obtener_doctor(request)
+    if doctor is None:
         messages.error(request, 'Perfil no encontrado.')
         return redirect('dashboard')
 
@@ -167,18 +155,14 @@ def editar_perfil(request):
         if user_form.is_valid() and doctor_form.is_valid():
             user_form.save()
             doctor_form.save()
+            request.session.pop(CLAVE_SESION, None) # Nombre y foto nuevos en la cabecera
             messages.success(request, '¡Perfil actualizado!')
             return redirect('ver_perfil')
         else:
             messages.error(request, 'Corrige los errores.')
-            saludo = get_saludo()
-            nombre_doctor, doctor_profile_pic = get_doctor_data(request.user)
             context = {
                 'user_form': user_form, 
                 'doctor_form': doctor_form,
-                'saludo': saludo, 
-                'nombre_doctor': nombre_doctor, 
-                'doctor_profile_pic': doctor_profile_pic
             }
             return render(request, 'odontologia/perfil.html', context)
     else:
@@ -189,114 +173,223 @@ def editar_perfil(request):
 @login_required
 def detalle_atencion(request, pk):
     es_admin = request.user.is_staff or request.user.is_superuser
-    try:
-        if es_admin:
-            atencion = get_object_or_404(Atencion, pk=pk)
-        else:
-            doctor = request.user.doctor
-            atencion = get_object_or_404(Atencion, pk=pk, doctor=doctor)
-    except Doctor.DoesNotExist:
+    doctor = obtener_doctor(request)
+    if not es_admin and doctor is None:
         messages.error(request, 'Acceso denegado.')
         return redirect('dashboard')
-    except Atencion.DoesNotExist:
-        messages.error(request, 'Atención no encontrada.')
-        return redirect('dashboard')
+    if es_admin:
+        atencion = get_object_or_404(Atencion, pk=pk)
+    else:
+        atencion = get_object_or_404(Atencion, pk=pk, doctor=doctor)
 
     detalles_tratamiento = atencion.detalles.all()
-    saludo = get_saludo()
-    nombre_doctor, doctor_profile_pic = get_doctor_data(request.user)
 
     context = {
         'atencion': atencion,
         'detalles': detalles_tratamiento,
-        'saludo': saludo,
-        'nombre_doctor': nombre_doctor,
-        'doctor_profile_pic': doctor_profile_pic,
-        'es_admin': es_admin,
     }
     return render(request, 'odontologia/detalle_atencion.html', context)
 
 @login_required
 def ver_calendario(request):
-    saludo = get_saludo()
-    nombre_doctor, doctor_profile_pic = get_doctor_data(request.user)
+    """La página no trae eventos: FullCalendar los pide a `calendario_eventos_json` según el rango visible."""
+    return render(request, 'odontologia/calendario.html')
+
+@login_required
+def calendario_eventos_json(request):
+    """Feed de eventos para FullCalendar acotado a la ventana visible (?start=...&end=...)."""
     es_admin = request.user.is_staff or request.user.is_superuser
+    try:
+        # FullCalendar envía fechas ISO con hora y zona (2025-01-01T00:00:00-03:00); basta la fecha
+        inicio = datetime.date.fromisoformat(request.GET.get('start', '')[:10])
+        fin = datetime.date.fromisoformat(request.GET.get('end', '')[:10])
+    except ValueError:
+        return JsonResponse({'error': 'Parámetros start/end inválidos'}, status=400)
+    if fin <= inicio or (fin - inicio).days > MAX_DIAS_RANGO_CALENDARIO:
+        return JsonResponse({'error': 'Rango de fechas inválido'}, status=400)
+
+    atenciones = Atencion.objects.filter(fecha__gte=inicio, fecha__lt=fin)
+    if not es_admin:
+        doctor = obtener_doctor(request)
+        if doctor is None:
+            return JsonResponse([], safe=False)
+        atenciones = atenciones.filter(doctor=doctor)
+
+    # Una sola consulta: .values() hace el JOIN con doctor__user y evita instanciar modelos
+    filas = atenciones.values(
+        'pk', 'fecha', 'hora_atencion', 'paciente_nombre', 'paciente_apellido', 'doctor__user__last_name'
+    )
     eventos_calendario = []
-    
-    if es_admin:
-        atenciones = Atencion.objects.all()
-    else:
-        try:
-            doctor = request.user.doctor
-            atenciones = Atencion.objects.filter(doctor=doctor)
-        except Doctor.DoesNotExist:
-            atenciones = []
-
-    for atencion in atenciones:
-        start_datetime = datetime.datetime.combine(atencion.fecha, atencion.hora_atencion)
-        titulo = f"{atencion.paciente_nombre} {atencion.paciente_apellido}"
+    for fila in filas:
+        titulo = f"{fila['paciente_nombre']} {fila['paciente_apellido']}"
         if es_admin:
-            titulo = f"Dr. {atencion.doctor.user.last_name}: {titulo}"
-            
+            titulo = f"Dr. {fila['doctor__user__last_name']}: {titulo}"
         eventos_calendario.append({
-            'id': atencion.pk,
+            'id': fila['pk'],
             'title': titulo,
-            'start': start_datetime.isoformat(),
+            'start': datetime.datetime.combine(fila['fecha'], fila['hora_atencion']).isoformat(),
             'allDay': False
         })
+    return JsonResponse(eventos_calendario, safe=False)
 
-    context = {
-        'saludo': saludo,
-        'nombre_doctor': nombre_doctor,
-        'doctor_profile_pic': doctor_profile_pic,
-        'atenciones_json': json.dumps(eventos_calendario),
-        'es_admin': es_admin
+@login_required
+def agenda_libre(request):
+    """
+    Horas libres por doctor (?fecha= o ?desde=&hasta=) para una atención de ?duracion=
+    minutos o de los ?tratamiento= del catálogo indicados. Un doctor solo ve su agenda.
+    """
+    es_admin = request.user.is_staff or request.user.is_superuser
+    try:
+        desde = datetime.date.fromisoformat(request.GET.get('desde') or request.GET.get('fecha', ''))
+        hasta = datetime.date.fromisoformat(request.GET.get('hasta') or request.GET.get('fecha') or desde.isoformat())
+        tratamientos = [int(t) for t in request.GET.getlist('tratamiento')]
+        duracion = int(request.GET.get('duracion') or 0)
+        doctor_id = int(request.GET['doctor']) if request.GET.get('doctor') else None
+    except ValueError:
+        return JsonResponse({'error': 'Parámetros inválidos'}, status=400)
+    if hasta < desde or (hasta - desde).days >= MAX_DIAS_AGENDA:
+        return JsonResponse({'error': 'Rango de fechas inválido'}, status=400)
+    if tratamientos:
+        duracion = duracion_de(Tratamiento.objects.filter(pk__in=tratamientos))
+    if not 0 < duracion <= 24 * 60:
+        duracion = DURACION_POR_DEFECTO
+
+    doctores = Doctor.objects.select_related('user')
+    if not es_admin:
+        doctor = obtener_doctor(request)
+        if doctor is None:
+            return JsonResponse({'error': 'Permiso denegado'}, status=403)
+        doctores = [doctor]
+    elif doctor_id is not None:
+        doctores = doctores.filter(pk=doctor_id)
+    doctores = list(doctores)
+
+    libres = horas_libres([d.pk for d in doctores], desde, hasta, duracion)
+    return JsonResponse({
+        'duracion': duracion,
+        'doctores': [{
+            'id': d.pk,
+            'nombre': str(d),
+            'dias': {
+                fecha.isoformat(): [f"{hora:%H:%M}" for hora in horas]
+                for fecha, horas in libres[d.pk].items()
+            },
+        } for d in doctores],
+    })
+
+@login_required
+def autocompletar_pacientes(request):
+    """Fichas cuyo RUT o nombre empieza con ?q= (para completar el formulario de atención)."""
+    if obtener_doctor(request) is None:
+        return JsonResponse({'error': 'Permiso denegado'}, status=403)
+    respuesta = JsonResponse({'resultados': buscar_pacientes(request.GET.get('q', ''))})
+    # Mientras se escribe se repiten prefijos: el navegador puede reutilizarlos un rato
+    patch_cache_control(respuesta, private=True, max_age=30)
+    return respuesta
+
+def _detalles_modal():
+    return Prefetch('detalles', queryset=DetalleAtencion.objects.only('atencion_id', 'especialidad', 'descripcion', 'valor').order_by('pk'))
+
+def _datos_modal(atencion):
+    """Datos de una atención para el modal del calendario (con doctor__user y detalles ya cargados)."""
+    return {
+        'paciente': f"{atencion.paciente_nombre} {atencion.paciente_apellido}",
+        'rut': atencion.paciente_rut,
+        'fecha': atencion.fecha.strftime("%d/%m/%Y"),
+        'hora': atencion.hora_atencion.strftime("%H:%M"),
+        'motivo': atencion.motivo_visita or "No especificado",
+        'pago': atencion.get_metodo_pago_display(),
+        'detalles': [
+            {'especialidad': d.especialidad, 'descripcion': d.descripcion, 'valor': str(d.valor)}
+            for d in atencion.detalles.all()
+        ],
+        'doctor': f"{atencion.doctor.user.first_name} {atencion.doctor.user.last_name}"
     }
-    return render(request, 'odontologia/calendario.html', context)
 
 @login_required
 def atencion_json(request, pk):
+    """Datos de la atención para el modal del calendario. Responde 304 si no cambió desde la última vez."""
     es_admin = request.user.is_staff or request.user.is_superuser
     try:
+        doctor = obtener_doctor(request)
         if es_admin:
-            atencion = get_object_or_404(Atencion, pk=pk)
+            atenciones = Atencion.objects.filter(pk=pk)
+        elif doctor is None:
+            raise Doctor.DoesNotExist
         else:
-            atencion = get_object_or_404(Atencion, pk=pk, doctor=request.user.doctor)
-
-        detalles = list(atencion.detalles.all().values('especialidad', 'descripcion', 'valor'))
-        for d in detalles: d['valor'] = str(d['valor'])
-
-        data = {
-            'paciente': f"{atencion.paciente_nombre} {atencion.paciente_apellido}",
-            'rut': atencion.paciente_rut,
-            'fecha': atencion.fecha.strftime("%d/%m/%Y"),
-            'hora': atencion.hora_atencion.strftime("%H:%M"),
-            'motivo': atencion.motivo_visita or "No especificado",
-            'pago': atencion.get_metodo_pago_display(),
-            'detalles': detalles,
-            'doctor': f"{atencion.doctor.user.first_name} {atencion.doctor.user.last_name}"
-        }
-        return JsonResponse(data)
+            atenciones = Atencion.objects.filter(pk=pk, doctor=doctor)
+
+        # Consulta mínima para validar la copia del navegador antes de armar la respuesta
+        actualizado = atenciones.values_list('actualizado', flat=True).first()
+        if actualizado is None:
+            raise Atencion.DoesNotExist
+        etag = calcular_etag(pk, actualizado)
+        respuesta = no_modificada(request, etag, actualizado)
+        if respuesta is not None:
+            return respuesta
+
+        atencion = atenciones.select_related('doctor__user').prefetch_related(_detalles_modal()).get()
+        return con_validadores(JsonResponse(_datos_modal(atencion)), etag, atencion.actualizado)
     except (Doctor.DoesNotExist, Atencion.DoesNotExist):
         return JsonResponse({'error': 'No encontrado o no autorizado'}, status=404)
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
 
 @login_required
-def editar_atencion(request, pk):
+def atenciones_json(request):
+    """
+    Datos del modal para varias atenciones (?ids=1,2,3 o la ventana ?start=...&end=... del
+    calendario) en un número fijo de consultas. Responde 304 si los datos no cambiaron.
+    """
     es_admin = request.user.is_staff or request.user.is_superuser
+    doctor = obtener_doctor(request)
+    if not es_admin and doctor is None:
+        return JsonResponse({'error': 'No encontrado o no autorizado'}, status=404)
     try:
-        if es_admin:
-            atencion = get_object_or_404(Atencion, pk=pk)
+        if request.GET.get('ids'):
+            ids = {int(i) for i in request.GET['ids'].split(',')}
+            if len(ids) > MAX_ATENCIONES_LOTE:
+                return JsonResponse({'error': f'Máximo {MAX_ATENCIONES_LOTE} atenciones por llamada'}, status=400)
+            atenciones = Atencion.objects.filter(pk__in=ids)
         else:
-            doctor = request.user.doctor
-            atencion = get_object_or_404(Atencion, pk=pk, doctor=doctor)
-    except (Doctor.DoesNotExist, Atencion.DoesNotExist):
+            inicio = datetime.date.fromisoformat(request.GET.get('start', '')[:10])
+            fin = datetime.date.fromisoformat(request.GET.get('end', '')[:10])
+            if fin <= inicio or (fin - inicio).days > MAX_DIAS_LOTE:
+                return JsonResponse({'error': 'Rango de fechas inválido'}, status=400)
+            atenciones = Atencion.objects.filter(fecha__gte=inicio, fecha__lt=fin)
+    except ValueError:
+        return JsonResponse({'error': 'Parámetros ids o start/end inválidos'}, status=400)
+    if not es_admin:
+        atenciones = atenciones.filter(doctor=doctor)
+
+    # La versión de datos cambia con cualquier atención o detalle del doctor (global para el admin)
+    etag = calcular_etag(
+        request.get_full_path(), request.user.pk, version_perfil(request),
+        clave_datos(None if es_admin else doctor.pk),
+    )
+    respuesta = no_modificada(request, etag)
+    if respuesta is not None:
+        return respuesta
+
+    # Dos consultas para todo el lote: atenciones con doctor y usuario, y sus detalles
+    atenciones = atenciones.select_related('doctor__user').prefetch_related(_detalles_modal())
+    datos = {atencion.pk: _datos_modal(atencion) for atencion in atenciones}
+    return con_validadores(JsonResponse({'atenciones': datos}), etag)
+
+@login_required
+def editar_atencion(request, pk):
+    es_admin = request.user.is_staff or request.user.is_superuser
+    doctor = obtener_doctor(request)
+    if not es_admin and doctor is None:
         messages.error(request, 'Permiso denegado.')
         return redirect('dashboard')
+    if es_admin:
+        atencion = get_object_or_404(Atencion, pk=pk)
+    else:
+        atencion = get_object_or_404(Atencion, pk=pk, doctor=doctor)
 
     DetalleFormSet = inlineformset_factory(
-        Atencion, DetalleAtencion, form=DetalleAtencionForm, extra=1, can_delete=True
+        Atencion, DetalleAtencion, form=DetalleAtencionForm, formset=DetalleAtencionFormSet, extra=1, can_delete=True
     )
 
     if request.method == 'POST':
@@ -304,10 +397,17 @@ def editar_atencion(request, pk):
         detalle_formset = DetalleFormSet(request.POST, instance=atencion, prefix='detalles')
 
         if form.is_valid() and detalle_formset.is_valid():
-            form.save()
-            detalle_formset.save()
-            messages.success(request, '¡Atención actualizada exitosamente!')
-            return redirect('detalle_atencion', pk=atencion.pk)
+            asignar_duracion(form, detalle_formset)
+            try:
+                with recalculo_diferido():
+                    form.save()
+                    detalle_formset.save()
+            except IntegrityError as e:
+                if not form.error_de_integridad(e):
+                    raise
+            else:
+                messages.success(request, '¡Atención actualizada exitosamente!')
+                return redirect('detalle_atencion', pk=atencion.pk)
         
         # CORRECCIÓN: Eliminamos el "else: messages.error(...)"
 
@@ -315,32 +415,24 @@ def editar_atencion(request, pk):
         form = AtencionForm(instance=atencion)
         detalle_formset = DetalleFormSet(instance=atencion, prefix='detalles')
 
-    saludo = get_saludo()
-    nombre_doctor, doctor_profile_pic = get_doctor_data(request.user)
-
     context = {
         'form': form,
         'detalle_formset': detalle_formset,
         'is_edit': True,
-        'saludo': saludo,
-        'nombre_doctor': nombre_doctor,
-        'doctor_profile_pic': doctor_profile_pic,
-        'es_admin': es_admin
     }
     return render(request, 'odontologia/registrar_atencion.html', context)
 
 @login_required
 def eliminar_atencion(request, pk):
     es_admin = request.user.is_staff or request.user.is_superuser
-    try:
-        if es_admin:
-            atencion = get_object_or_404(Atencion, pk=pk)
-        else:
-            doctor = request.user.doctor
-            atencion = get_object_or_404(Atencion, pk=pk, doctor=doctor)
-    except (Doctor.DoesNotExist, Atencion.DoesNotExist):
+    doctor = obtener_doctor(request)
+    if not es_admin and doctor is None:
         messages.error(request, 'No tienes permiso para eliminar esta atención.')
         return redirect('dashboard')
+    if es_admin:
+        atencion = get_object_or_404(Atencion, pk=pk)
+    else:
+        atencion = get_object_or_404(Atencion, pk=pk, doctor=doctor)
 
     if request.method == 'POST':
         nombre = atencion.paciente_nombre
@@ -348,14 +440,8 @@ def eliminar_atencion(request, pk):
         messages.success(request, f"La atención de {nombre} ha sido eliminada.")
         return redirect('dashboard')
 
-    saludo = get_saludo()
-    nombre_doctor, doctor_profile_pic = get_doctor_data(request.user)
-
     context = {
         'atencion': atencion,
-        'saludo': saludo,
-        'nombre_doctor': nombre_doctor,
-        'doctor_profile_pic': doctor_profile_pic,
     }
     return render(request, 'odontologia/eliminar_atencion_confirm.html', context)
 
@@ -368,16 +454,11 @@ def lista_doctores(request):
         messages.error(request, "Acceso restringido a administradores.")
         return redirect('dashboard')
     
-    doctores = Doctor.objects.all()
-    saludo = get_saludo()
-    nombre_doctor, doctor_profile_pic = get_doctor_data(request.user)
+    doctores = Doctor.objects.select_related('user')
 
     context = {
         'doctores': doctores,
-        'saludo': saludo,
-        'nombre_doctor': nombre_doctor,
-        'doctor_profile_pic': doctor_profile_pic,
-        'es_admin': es_admin
+        'mes_anterior': (timezone.localdate().replace(day=1) - datetime.timedelta(days=1)).strftime('%Y-%m'),
     }
     return render(request, 'odontologia/lista_doctores.html', context)
 
@@ -389,143 +470,163 @@ def atenciones_por_doctor(request, pk):
         messages.error(request, "Acceso restringido.")
         return redirect('dashboard')
 
-    doctor_objetivo = get_object_or_404(Doctor, pk=pk)
+    doctor_objetivo = get_object_or_404(Doctor.objects.select_related('user'), pk=pk)
     atenciones = Atencion.objects.filter(doctor=doctor_objetivo).order_by('-fecha', '-hora_atencion')
 
-    # Buscador por RUT
-    query = request.GET.get('q')
+    # Buscador: nombre, RUT, motivo o tratamiento, ordenado por relevancia
+    query = request.GET.get('q', '').strip()
     if query:
-        atenciones = atenciones.filter(paciente_rut__icontains=query)
+        atenciones = buscar_atenciones(atenciones, query)
 
-    saludo = get_saludo()
-    nombre_doctor, doctor_profile_pic = get_doctor_data(request.user)
+    clave = clave_datos(doctor_objetivo.pk)
+    paginar = paginar_por_numero if query else paginar_atenciones
+    pagina = SimpleLazyObject(lambda: paginar(request, atenciones))
 
     context = {
         'doctor_objetivo': doctor_objetivo,
-        'atenciones': atenciones,
-        'saludo': saludo,
-        'nombre_doctor': nombre_doctor,
-        'doctor_profile_pic': doctor_profile_pic,
-        'es_admin': es_admin,
-        'busqueda': query or ""
+        'atenciones': SimpleLazyObject(lambda: pagina.objetos),
+        'pagina': pagina,
+        'total_resultados': atenciones.count, # La plantilla lo llama solo si no está en caché
+        'busqueda': query,
+        'clave_datos': clave,
+        'ttl_fragmento': TTL_FRAGMENTO,
     }
-    return render(request, 'odontologia/atenciones_doctor.html', context)
+    return render_condicional(
+        request, 'odontologia/atenciones_doctor.html', context,
+        clave, doctor_objetivo.user.get_full_name(), doctor_objetivo.rut,
+    )
+
+@login_required
+def resumen_financiero_doctor(request, pk):
+    """Resumen mensual de un doctor para un año (lee la tabla de resúmenes, no las atenciones)."""
+    es_admin = request.user.is_staff or request.user.is_superuser
+    if not es_admin:
+        messages.error(request, "Acceso restringido.")
+        return redirect('dashboard')
+
+    doctor_objetivo = get_object_or_404(Doctor.objects.select_related('user'), pk=pk)
+    try:
+        anio = int(request.GET.get('anio', timezone.localdate().year))
+    except ValueError:
+        anio = timezone.localdate().year
+    anios = anios_con_resumen(doctor_objetivo.pk)
+    if anio not in anios:
+        anios = sorted(anios + [anio], reverse=True)
+    meses, especialidades, totales = resumen_anual(doctor_objetivo.pk, anio)
+
+    context = {
+        'doctor_objetivo': doctor_objetivo,
+        'anio': anio,
+        'anios': anios,
+        'meses': [(NOMBRES_MESES[mes - 1], valores) for mes, valores in meses],
+        'especialidades': especialidades,
+        'totales': totales,
+    }
+    return render(request, 'odontologia/resumen_doctor.html', context)
 
 @login_required
 def lista_atenciones(request):
     """Muestra TODAS las atenciones (según permiso) con buscador."""
-    saludo = get_saludo()
-    nombre_doctor, doctor_profile_pic = get_doctor_data(request.user)
     es_admin = request.user.is_staff or request.user.is_superuser
 
     if es_admin:
         atenciones = Atencion.objects.all().order_by('-fecha', '-hora_atencion')
+        clave = clave_datos()
     else:
-        try:
-            doctor = request.user.doctor
-            atenciones = Atencion.objects.filter(doctor=doctor).order_by('-fecha', '-hora_atencion')
-        except Doctor.DoesNotExist:
-            atenciones = Atencion.objects.none()
+        doctor = obtener_doctor(request)
+        atenciones = Atencion.objects.filter(doctor=doctor).order_by('-fecha', '-hora_atencion') if doctor else Atencion.objects.none()
+        clave = clave_datos(doctor.pk if doctor else None)
 
-    query = request.GET.get('q')
+    # Buscador: nombre, RUT, motivo o tratamiento, ordenado por relevancia
+    query = request.GET.get('q', '').strip()
     if query:
-        atenciones = atenciones.filter(paciente_rut__icontains=query)
+        atenciones = buscar_atenciones(atenciones, query)
+
+    paginar = paginar_por_numero if query else paginar_atenciones
+    pagina = SimpleLazyObject(lambda: paginar(request, atenciones))
 
     context = {
-        'atenciones': atenciones,
-        'saludo': saludo,
-        'nombre_doctor': nombre_doctor,
-        'doctor_profile_pic': doctor_profile_pic,
-        'es_admin': es_admin,
-        'busqueda': query or ""
+        'atenciones': SimpleLazyObject(lambda: pagina.objetos),
+        'pagina': pagina,
+        'busqueda': query,
+        'clave_datos': clave,
+        'ttl_fragmento': TTL_FRAGMENTO,
     }
-    return render(request, 'odontologia/lista_atenciones.html', context)
+    return render_condicional(request, 'odontologia/lista_atenciones.html', context, clave)
 
 @login_required
 def descargar_excel_doctor(request, pk):
-    """Genera Excel profesional con ganancias."""
+    """Encola el Excel de ganancias del doctor; lo genera el worker `procesar_reportes` (o la petición, sin worker)."""
     es_admin = request.user.is_staff or request.user.is_superuser
     if not es_admin:
         messages.error(request, "No tienes permiso.")
         return redirect('dashboard')
+    if request.method != 'POST':
+        return redirect('atenciones_por_doctor', pk=pk)
 
     doctor = get_object_or_404(Doctor, pk=pk)
-    atenciones = Atencion.objects.filter(doctor=doctor).order_by('-fecha', '-hora_atencion')
-
-    response = HttpResponse(content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-    filename = f"Reporte_{doctor.user.last_name}_{timezone.now().strftime('%d-%m-%Y')}.xlsx"
-    response['Content-Disposition'] = f'attachment; filename="{filename}"'
-
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = "Reporte Financiero"
-
-    # Estilos
-    thin_border = Border(left=Side(style='thin'), right=Side(style='thin'), top=Side(style='thin'), bottom=Side(style='thin'))
-    header_font = Font(name='Calibri', bold=True, color='FFFFFF', size=12)
-    header_fill = PatternFill(start_color='1F497D', end_color='1F497D', fill_type='solid')
-    header_alignment = Alignment(horizontal='center', vertical='center')
-    money_alignment = Alignment(horizontal='right')
-    total_font = Font(name='Calibri', bold=True, size=12)
-    total_fill = PatternFill(start_color='FFF2CC', end_color='FFF2CC', fill_type='solid')
-
-    headers = ["Fecha", "Hora", "RUT Paciente", "Nombre Paciente", "Motivo", "Total Cobrado", "Ganancia Doctor (50%)"]
-    ws.append(headers)
-
-    for cell in ws[1]:
-        cell.font = header_font
-        cell.fill = header_fill
-        cell.alignment = header_alignment
-        cell.border = thin_border
-
-    total_ganancias = Decimal('0.00')
-    total_cobrado = Decimal('0.00')
-
-    for atencion in atenciones:
-        total_atencion = sum(detalle.valor for detalle in atencion.detalles.all())
-        ganancia_doctor = total_atencion * Decimal('0.5')
-        total_cobrado += total_atencion
-        total_ganancias += ganancia_doctor
-
-        ws.append([
-            atencion.fecha.strftime("%d/%m/%Y"),
-            atencion.hora_atencion.strftime("%H:%M"),
-            atencion.paciente_rut,
-            f"{atencion.paciente_nombre} {atencion.paciente_apellido}",
-            atencion.motivo_visita,
-            total_atencion,
-            ganancia_doctor
-        ])
-        
-        for col_num, cell in enumerate(ws[ws.max_row], 1):
-            cell.border = thin_border
-            if col_num >= 6:
-                cell.number_format = '$ #,##0'
-                cell.alignment = money_alignment
-
-    # Fila Totales
-    ws.append(["TOTALES", "", "", "", "", total_cobrado, total_ganancias])
-    final_row = ws.max_row
-    ws.merge_cells(start_row=final_row, start_column=1, end_row=final_row, end_column=5)
-    
-    for col_num, cell in enumerate(ws[final_row], 1):
-        cell.font = total_font
-        cell.fill = total_fill
-        cell.border = thin_border
-        if col_num == 1: cell.alignment = Alignment(horizontal='center')
-        if col_num >= 6: 
-            cell.number_format = '$ #,##0'
-            cell.alignment = money_alignment
-
-    # Ajustar ancho
-    for col in ws.columns:
-        max_len = 0
-        column = col[0].column_letter
-        for cell in col:
-            try:
-                if len(str(cell.value)) > max_len: max_len = len(str(cell.value))
-            except: pass
-        ws.column_dimensions[column].width = (max_len + 2) * 1.2
+    trabajo = procesar_sin_worker(encolar('EXCEL_DOCTOR', {'doctor_id': doctor.pk}, request.user))
+    if 'application/json' in request.headers.get('Accept', ''):
+        return JsonResponse(_estado_trabajo(trabajo), status=202)
+    return redirect('estado_reporte', pk=trabajo.pk)
+
+@login_required
+def exportar_nomina(request):
+    """Encola la nómina consolidada de todos los doctores para el mes elegido (AAAA-MM)."""
+    es_admin = request.user.is_staff or request.user.is_superuser
+    if not es_admin:
+        messages.error(request, "No tienes permiso.")
+        return redirect('dashboard')
+    if request.method != 'POST':
+        return redirect('lista_doctores')
+
+    formato = request.POST.get('formato', 'xlsx')
+    try:
+        periodo = datetime.datetime.strptime(request.POST.get('periodo', ''), '%Y-%m')
+    except ValueError:
+        periodo = None
+    if periodo is None or formato not in FORMATOS_NOMINA:
+        messages.error(request, "Seleccione un mes y un formato válidos para la nómina.")
+        return redirect('lista_doctores')
+
+    trabajo = procesar_sin_worker(encolar('NOMINA', {'anio': periodo.year, 'mes': periodo.month, 'formato': formato}, request.user))
+    if 'application/json' in request.headers.get('Accept', ''):
+        return JsonResponse(_estado_trabajo(trabajo), status=202)
+    return redirect('estado_reporte', pk=trabajo.pk)
+
+def _estado_trabajo(trabajo):
+    return {
+        'id': trabajo.pk,
+        'estado': trabajo.estado,
+        'estado_display': trabajo.get_estado_display(),
+        'url_descarga': reverse('descargar_reporte', args=[trabajo.pk]) if trabajo.estado == 'LISTO' else None,
+    }
+
+def _trabajo_visible(request, pk):
+    trabajo = get_object_or_404(TrabajoReporte, pk=pk)
+    if not puede_ver(trabajo, request.user):
+        raise Http404("Reporte no encontrado")
+    return trabajo
 
-    wb.save(response)
-    return response
\ No newline at end of file
+@login_required
+def estado_reporte(request, pk):
+    """Página de espera: consulta el estado del trabajo hasta que el archivo esté listo."""
+    trabajo = _trabajo_visible(request, pk)
+
+    context = {
+        'trabajo': trabajo,
+    }
+    return render(request, 'odontologia/estado_reporte.html', context)
+
+@login_required
+def estado_reporte_json(request, pk):
+    return JsonResponse(_estado_trabajo(_trabajo_visible(request, pk)))
+
+@login_required
+def descargar_reporte(request, pk):
+    """Entrega el archivo generado (no se publica en MEDIA_URL: pasa por el control de acceso)."""
+    trabajo = _trabajo_visible(request, pk)
+    if trabajo.estado != 'LISTO' or not trabajo.archivo:
+        messages.error(request, "El reporte aún no está listo.")
+        return redirect('estado_reporte', pk=trabajo.pk)
+    return FileResponse(trabajo.archivo.open('rb'), as_attachment=True, filename=trabajo.nombre_archivo)